@@ -11,7 +11,7 @@ from django.contrib import messages
 from pyvcloud.vcd.client import ResourceType
 from pyvcloud_project.vmware_client import VMWareClientSingleton
 from pyvcloud_project.utils import pyvcloud_utils as utils
-from pyvcloud_project.utils import vm_utils, vapp_utils
+from pyvcloud_project.utils import progress_utils, vm_utils, vapp_utils
 from pyvcloud_project.utils.pyvcloud_utils import PowerState
 from pyvcloud_project.models import Vms, Vapps
 from rest_framework.response import Response
@@ -395,5 +395,5 @@ def delete_vm(request, vapp_id, vm_id):
     return redirect(reverse('Vms:vm_index', args=[vapp_id]))
 
 def vm_tasks(request, vm_id):
-    client = VMWareClientSingleton().client
-    return JsonResponse(vm_utils.get_vm_status(client, vm_id))
+    return JsonResponse(progress_utils.task_status(
+        vm_id, lambda: vm_utils.get_vm_status(VMWareClientSingleton().client, vm_id)))
@@ -1,7 +1,4 @@
 import logging
-import socket
-import atexit
-import ssl
 import xml.etree.ElementTree as ET
 
 from django.http import HttpResponseBadRequest, HttpResponse
@@ -12,13 +9,13 @@ from rest_framework.authentication import SessionAuthentication, BasicAuthentica
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from pyVim.connect import SmartConnect, Disconnect
 from pyVmomi import vim, vmodl
 from pyvcloud.vcd.client import ResourceType
 from pyvcloud_project.utils import pyvcloud_utils as utils
-from pyvcloud_project.utils import vm_utils
+from pyvcloud_project.utils import gateway_index_utils, vm_utils
 from pyvcloud_project.vmware_client import VMWareClientSingleton
-from pyvcloud_project.models import OrgVdcs, Vms, Vapps
+from pyvcloud_project.vsphere_client import VSphereSessionManager
+from pyvcloud_project.models import Vapps
 from . import views
 
 logger = logging.getLogger(__name__)
@@ -163,31 +160,18 @@ def poweron_vm(request, vm_name):
 
         # Extract client IP address
         client_ip_address = vm_utils.get_client_ip(request)
-
-        client_hostname, _, _ = socket.gethostbyaddr(client_ip_address)
         logger.info(f"Client IP Address for {vm_name} is {client_ip_address}")
-        hostname = client_hostname.split('.')[0]
-        logger.info(f"Hostname for {vm_name} vApp is {hostname}")
-
-        vapp = Vapps.objects.filter(vts_name=hostname).first()
-
-        if vapp:
-            logger.info(f"Found matching Vapps object: {vapp.name}")
-            logger.info(f"Querying for VM: vapp={vapp}, vm_name={vm_name}")
-            vm = Vms.objects.filter(vapp_obj=vapp, name=vm_name).first()
-
-            if vm:
-                vapp_id = vapp.vcd_id
-                vm_id = vm.vcd_id
-                vm_utils.poweron_vm_api(request, vapp_id, vm_id, vm_name)
-                return Response({'message': 'VM Powered on Successfully'}, status=200)
-            else:
-                return HttpResponseBadRequest({'message': 'VM not found'}, status=404)
-
-    except socket.herror as e:
-        error_msg = f"Error: Unable to resolve hostname for IP {client_ip_address}: {e}"
-        logger.error(error_msg)
-        return HttpResponseBadRequest({'message': error_msg}, status=400)
+
+        vapp, vm_id = gateway_index_utils.resolve_caller(client_ip_address, vm_name)
+        if vapp is None:
+            return Response({'message': f'No vApp found for IP address {client_ip_address}'}, status=404)
+
+        logger.info(f"Found matching Vapps object: {vapp['name']}")
+        if vm_id:
+            vm_utils.poweron_vm_api(request, vapp['vcd_id'], vm_id, vm_name)
+            return Response({'message': 'VM Powered on Successfully'}, status=200)
+        else:
+            return HttpResponseBadRequest({'message': 'VM not found'}, status=404)
 
     except Exception as e:
         error_msg = f"Error: {str(e)}"
@@ -205,32 +189,19 @@ def poweroff_vm(request, vm_name):
 
         # Extract client IP address
         client_ip_address = vm_utils.get_client_ip(request)
-
-        client_hostname, _, _ = socket.gethostbyaddr(client_ip_address)
         logger.info(f"Client IP Address for {vm_name} is {client_ip_address}")
-        hostname = client_hostname.split('.')[0]
-        logger.info(f"Hostname for {vm_name} vApp is {hostname}")
-
-        vapp = Vapps.objects.filter(vts_name=hostname).first()
-
-        if vapp:
-            logger.info(f"Found matching Vapps object: {vapp.name}")
-            logger.info(f"Querying for VM: vapp={vapp}, vm_name={vm_name}")
-            vm = Vms.objects.filter(vapp_obj=vapp, name=vm_name).first()
 
-            if not vm:
-                logger.warning(f"No VM found for {vm_name} in vApp {vapp.name}")
-                return Response({'message': f'No VM found for {vm_name} in vApp {vapp.name}'}, status=404)
+        vapp, vm_id = gateway_index_utils.resolve_caller(client_ip_address, vm_name)
+        if vapp is None:
+            return Response({'message': f'No vApp found for IP address {client_ip_address}'}, status=404)
 
-            vapp_id = vapp.vcd_id
-            vm_id = vm.vcd_id
-            vm_utils.poweroff_vm_api(request, vapp_id, vm_id, vm_name)
-            return Response({'message': 'VM Powered off Successfully'}, status=200)
+        logger.info(f"Found matching Vapps object: {vapp['name']}")
+        if not vm_id:
+            logger.warning(f"No VM found for {vm_name} in vApp {vapp['name']}")
+            return Response({'message': f'No VM found for {vm_name} in vApp {vapp["name"]}'}, status=404)
 
-    except socket.herror as e:
-        error_msg = f"Error: Unable to resolve hostname for IP {client_ip_address}: {e}"
-        logger.error(error_msg)
-        return HttpResponseBadRequest({'message': error_msg}, status=400)
+        vm_utils.poweroff_vm_api(request, vapp['vcd_id'], vm_id, vm_name)
+        return Response({'message': 'VM Powered off Successfully'}, status=200)
 
     except Exception as e:
         error_msg = f"Error: {str(e)}"
@@ -245,32 +216,19 @@ def reset_vm(request, vm_name):
 
         # Extract client IP address
         client_ip_address = vm_utils.get_client_ip(request)
-
-        client_hostname, _, _ = socket.gethostbyaddr(client_ip_address)
         logger.info(f"Client IP Address for {vm_name} is {client_ip_address}")
-        hostname = client_hostname.split('.')[0]
-        logger.info(f"Hostname for {vm_name} vApp is {hostname}")
 
-        vapp = Vapps.objects.filter(vts_name=hostname).first()
+        vapp, vm_id = gateway_index_utils.resolve_caller(client_ip_address, vm_name)
+        if vapp is None:
+            return Response({'message': f'No vApp found for IP address {client_ip_address}'}, status=404)
 
-        if vapp:
-            logger.info(f"Found matching Vapps object: {vapp.name}")
-            logger.info(f"Querying for VM: vapp={vapp}, vm_name={vm_name}")
-            vm = Vms.objects.filter(vapp_obj=vapp, name=vm_name).first()
+        logger.info(f"Found matching Vapps object: {vapp['name']}")
+        if not vm_id:
+            logger.warning(f"No VM found for {vm_name} in vApp {vapp['name']}")
+            return Response({'message': f'No VM found for {vm_name} in vApp {vapp["name"]}'}, status=404)
 
-            if not vm:
-                logger.warning(f"No VM found for {vm_name} in vApp {vapp.name}")
-                return Response({'message': f'No VM found for {vm_name} in vApp {vapp.name}'}, status=404)
-
-            vapp_id = vapp.vcd_id
-            vm_id = vm.vcd_id
-            vm_utils.reboot_vm_api(request, vapp_id, vm_id, vm_name)
-            return Response({'message': 'VM reset Successfully'}, status=200)
-
-    except socket.herror as e:
-        error_msg = f"Error: Unable to resolve hostname for IP {client_ip_address}: {e}"
-        logger.error(error_msg)
-        return HttpResponseBadRequest({'message': error_msg}, status=400)
+        vm_utils.reboot_vm_api(request, vapp['vcd_id'], vm_id, vm_name)
+        return Response({'message': 'VM reset Successfully'}, status=200)
 
     except Exception as e:
         error_msg = f"Error: {str(e)}"
@@ -295,29 +253,22 @@ def change_boot_order(request, boot_device, vm_name):
 
     vm_name = vm_name.split(".xml")[0]
     client_ip_address = vm_utils.get_client_ip(request)
-    client = VMWareClientSingleton().client
-    admin_href = client.get_admin().get('href')
-    system = utils.get_system(client, admin_href=admin_href)
-    provider_vdcs = system.list_provider_vdcs()
-    all_org_vdcs_db = OrgVdcs.objects.all()
-    org_vdcs_from_vmware = []
 
     try:
-        si = None
-        try:
-            # Create an SSL context that ignores SSL certificate verification
-            ssl_context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
-            ssl_context.verify_mode = ssl.CERT_NONE
-            logging.info("Trying to connect to VCENTER SERVER . . .")
-            si = SmartConnect(host='atpoda1-vcen1.athtem.eei.ericsson.se', user='administrator@vsphere.local', pwd='VMware1!', sslContext=ssl_context)
-        except IOError as e:
-            pass
-            atexit.register(Disconnect, si)
-
-        logging.info("Connected to VCENTER SERVER !")
-        content = si.RetrieveContent()
-
-        vm = vm_utils.find_vm_by_ip(content, client_ip_address)
+        vapp, _ = gateway_index_utils.resolve_caller(client_ip_address, vm_name)
+        vcenter = None
+        if vapp is not None:
+            vcenter = Vapps.objects.filter(vcd_id=vapp['vcd_id']).values_list(
+                'org_vdc_obj__vcenter', flat=True).first()
+        vm = None
+        if vcenter:
+            try:
+                vm = vm_utils.find_vm_by_ip(VSphereSessionManager.get().content(vcenter), client_ip_address)
+            except Exception as e:
+                logger.warning(f'Unable to search vCenter {vcenter} for {client_ip_address}: {e}')
+        if vm is None:
+            # The Org VDC vcenter may be unreachable or not a vCenter, fall back to the default
+            vm = vm_utils.find_vm_by_ip(VSphereSessionManager.get().content(), client_ip_address)
 
         # Check if vm is not None before proceeding
         if vm is None:
@@ -362,7 +313,6 @@ def change_boot_order(request, boot_device, vm_name):
         config_spec.bootOptions = vim.vm.BootOptions(bootOrder=boot_order)
 
         cloudms.ReconfigVM_Task(config_spec)
-        atexit.register(lambda: SmartConnect.Disconnect(si))
         return Response({'message': f'VM Boot Order Changed to {boot_device} Successfully'}, status=200)
 
     except vmodl.MethodFault as e:
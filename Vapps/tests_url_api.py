@@ -6,7 +6,10 @@ from django.contrib.auth.models import User
 from pyvcloud_project.models import SppUser
 from pyvcloud_project.utils import pyvcloud_utils as utils
 from django.conf import settings
+from django.utils import timezone
+from pyvcloud_project.utils import api_job_utils, job_group_utils
 import time
+import uuid
 
 
 class VappPageApiTests(TestCase):
@@ -390,3 +393,156 @@ class VappPageApiTests(TestCase):
         # Since we removed, returning to original state
         self.manipulate_redis_cache(
             self.vapp_vcd_id_powered_on, True, False)
+
+
+class VappJobApiTests(TestCase):
+    """
+    Test cases for the batch status, job status and bulk vApp action endpoints.
+    """
+    settings.TEST = True
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.client = Client()
+        cls.username = 'testJobUser'
+        cls.password = 'testJobUserPassword'
+        cls.user = User.objects.create_user(username=cls.username, password=cls.password)
+        SppUser.objects.create(user=cls.user, ldap_groups='')
+        cls.other_user = User.objects.create_user(username='otherJobUser', password='otherJobUserPassword')
+        SppUser.objects.create(user=cls.other_user, ldap_groups='')
+
+    def setUp(self):
+        self.logged_in = self.client.login(username=self.username, password=self.password)
+        self.redis_instance = utils.get_redis()
+        self.vapp_id = 'urn:vcloud:vapp:00000000-0000-0000-0000-000000000000'
+        self.keys = []
+
+    def tearDown(self):
+        if self.keys:
+            self.redis_instance.delete(*self.keys)
+
+    def track_job(self, user):
+        job_id = f'test-{uuid.uuid4()}'
+        params = utils.create_event_params(func_name='Create_VApp_From_Template', resource_id='test_template',
+                                           user=user, created=timezone.now(),
+                                           extra_params={'vapp_name': 'test_vapp_name', 'org_vdc_name': 'Oceans'})
+        api_job_utils.track(job_id, 'default', params)
+        self.keys.append(api_job_utils.API_JOB_KEY.format(job_id))
+        return job_id
+
+    def create_group(self, user):
+        group = job_group_utils.create_group('stop', user, [], {'test_vapp_id': ('test_vapp', 'Vapp test_vapp is currently busy')})
+        self.keys += [key.format(group['group_id']) for key in (
+            job_group_utils.JOB_GROUP_KEY, job_group_utils.JOB_GROUP_ITEMS_KEY, job_group_utils.JOB_GROUP_PENDING_KEY)]
+        return group
+
+    def test_get_batch_status_no_ids(self):
+        """
+        Test getting the batch status without any ids or names
+        """
+        self.assertTrue(self.logged_in)
+        response = self.client.get(reverse('Vapps-api:get_batch_status'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('No vApp or VM ids or names given', response.json()['message'])
+
+    def test_get_batch_status_unknown_ids(self):
+        """
+        Test getting the batch status of ids that do not exist
+        """
+        self.assertTrue(self.logged_in)
+        response = self.client.get(reverse('Vapps-api:get_batch_status'), {'ids': 'urn:vcloud:vapp:unknown'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response_data = response.json()
+        self.assertEqual(response_data['results'], [])
+        self.assertIn('urn:vcloud:vapp:unknown', response_data['not_found'])
+
+    def test_get_job_status_unknown_job(self):
+        """
+        Test getting the status of a job that does not exist
+        """
+        self.assertTrue(self.logged_in)
+        response = self.client.get(reverse('Vapps-api:get_job_status', args=['unknown_job_id']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertIn('Job unknown_job_id not found', response.json()['message'])
+
+    def test_get_job_status_pass(self):
+        """
+        Test getting the status of a job started by the user
+        """
+        self.assertTrue(self.logged_in)
+        job_id = self.track_job(self.user)
+        response = self.client.get(reverse('Vapps-api:get_job_status', args=[job_id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response_data = response.json()
+        self.assertEqual(response_data['job']['job_id'], job_id)
+        self.assertEqual(response_data['job']['status'], api_job_utils.QUEUED)
+
+    def test_get_job_status_of_other_user(self):
+        """
+        Test that the job of another user is not found, without waiting for it
+        """
+        self.assertTrue(self.logged_in)
+        job_id = self.track_job(self.other_user)
+        started = time.monotonic()
+        response = self.client.get(reverse('Vapps-api:get_job_status', args=[job_id]), {'wait': 5})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertLess(time.monotonic() - started, 5)
+
+    def test_bulk_vapp_action_unknown_action(self):
+        """
+        Test a bulk vApp action with an unknown action
+        """
+        self.assertTrue(self.logged_in)
+        response = self.client.get(reverse('Vapps-api:bulk_vapp_action'),
+                                   {'action': 'explode', 'vapp_vcd_ids': self.vapp_id})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Unknown action explode', response.json()['message'])
+
+    def test_bulk_vapp_action_no_vapps(self):
+        """
+        Test a bulk vApp action without any vApp ids
+        """
+        self.assertTrue(self.logged_in)
+        response = self.client.get(reverse('Vapps-api:bulk_vapp_action'), {'action': 'stop'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('No vApp ids given', response.json()['message'])
+
+    def test_bulk_vapp_action_unknown_vapps(self):
+        """
+        Test a bulk vApp action where every vApp is rejected
+        """
+        self.assertTrue(self.logged_in)
+        response = self.client.post(reverse('Vapps-api:bulk_vapp_action'),
+                                    {'action': 'stop', 'vapp_vcd_ids': [self.vapp_id]}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn(f'Vapp {self.vapp_id} does not exist', response.json()['message'])
+
+    def test_get_job_group_unknown_group(self):
+        """
+        Test getting a job group that does not exist
+        """
+        self.assertTrue(self.logged_in)
+        response = self.client.get(reverse('Vapps-api:get_job_group', args=['unknown_group_id']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_get_job_group_pass(self):
+        """
+        Test getting a job group started by the user
+        """
+        self.assertTrue(self.logged_in)
+        group = self.create_group(self.user)
+        response = self.client.get(reverse('Vapps-api:get_job_group', args=[group['group_id']]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        job_group = response.json()['job_group']
+        self.assertEqual(job_group['status'], job_group_utils.FINISHED)
+        self.assertEqual(job_group['rejected'], 1)
+        self.assertEqual(job_group['items'][0]['status'], job_group_utils.REJECTED)
+
+    def test_get_job_group_of_other_user(self):
+        """
+        Test that the job group of another user is not found
+        """
+        self.assertTrue(self.logged_in)
+        group = self.create_group(self.other_user)
+        response = self.client.get(reverse('Vapps-api:get_job_group', args=[group['group_id']]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -33,11 +33,26 @@ urlpatterns = [
 
     path('get_vapp_status_xml/<str:org_vdc_id>/<str:vAppName>/',
          views_api.get_vapp_status_xml, name='get_vapp_status_xml'),
+    path('get_batch_status', views_api.get_batch_status, name='get_batch_status'),
+    path('get_batch_status_xml', views_api.get_batch_status_xml,
+         name='get_batch_status_xml'),
 
     path('create_vapp_from_template', views_api.create_vapp_from_template,
          name='create_vapp_from_template'),
     path('create_vapp_from_template_xml', views_api.create_vapp_from_template_xml,
          name='create_vapp_from_template_xml'),
+    path('get_job_status/<str:job_id>', views_api.get_job_status,
+         name='get_job_status'),
+    path('get_job_status_xml/<str:job_id>', views_api.get_job_status_xml,
+         name='get_job_status_xml'),
+
+    path('bulk_vapp_action', views_api.bulk_vapp_action, name='bulk_vapp_action'),
+    path('bulk_vapp_action_xml', views_api.bulk_vapp_action_xml,
+         name='bulk_vapp_action_xml'),
+    path('get_job_group/<str:group_id>', views_api.get_job_group,
+         name='get_job_group'),
+    path('get_job_group_xml/<str:group_id>', views_api.get_job_group_xml,
+         name='get_job_group_xml'),
 
     path('stop_and_add_vapp_to_catalog', views_api.stop_and_add_vapp_to_catalog,
          name='stop_and_add_vapp_to_catalog'),
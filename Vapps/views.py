@@ -12,13 +12,13 @@ from django.contrib.auth.decorators import login_required
 from django.db.models import F
 from pyvcloud.vcd.client import ResourceType
 from rest_framework.response import Response
-from pyvcloud_project.models import OrgVdcs, Vapps, Catalogs, Groups, SppUser
-from pyvcloud_project.utils import vm_utils, vapp_network_utils, orgvdc_utils,\
-    vapp_utils, pyvcloud_utils as utils
+from pyvcloud_project.models import OrgVdcs, Vapps, Catalogs, SppUser
+from pyvcloud_project.utils import api_job_utils, batch_status_utils, job_group_utils, vm_utils, vapp_network_utils,\
+    vapp_utils, vapp_summary_utils, permission_utils, progress_utils, quota_utils, template_cache_utils, pyvcloud_utils as utils
 from pyvcloud_project.vmware_client import VMWareClientSingleton
 from pyvcloud_project.utils.pyvcloud_utils import PowerState, remove_vapp_or_vm_from_busy_cache
 from datetime import datetime
-from django.http import HttpResponseBadRequest
+from django.http import HttpResponseBadRequest, HttpResponseNotFound
 logger = logging.getLogger(__name__)
 
 
@@ -41,30 +41,17 @@ def index(request, org_vdc_id):
     :template:`vapps/vapp_index.html`
     """
     messages.get_messages(request).used = True
-    redis_server = utils.get_redis()
-    client = VMWareClientSingleton().client
     org_vdc_obj = OrgVdcs.objects.get(org_vdc_id=org_vdc_id)
     vapps = Vapps.objects.filter(org_vdc_obj=org_vdc_obj).values('vcd_id', 'shared', 'created', 'name').annotate(status=F('state_id'),
                                                                                                                  gateway=F(
                                                                                                                      'vts_name'),
                                                                                                                  created_by=F('created_by_user_obj__user__username'))
 
-    vapp_resources = orgvdc_utils.get_vapp_resources(client, org_vdc_id)
-    vapp_power_states = orgvdc_utils.get_power_state_of_vapps(
-        client, org_vdc_id)
+    vapp_summaries, summaries_refreshed, summaries_stale = vapp_summary_utils.get_org_vdc_summaries(
+        org_vdc_id)
 
     spp_user = SppUser.objects.get(user=request.user)
-    spp_user_ldap_groups = utils.get_user_ldap_groups(spp_user)
-    permission_groups = Groups.objects.filter(org_vdc_obj=org_vdc_obj)
-
-    spp_user_admin_permission = spp_user.is_staff or spp_user.is_superuser
-    if not spp_user_admin_permission:
-        for group in permission_groups:
-            group_cn = group.group_dn.split(',', 1)[0]
-            if group_cn in spp_user_ldap_groups:
-                spp_user_admin_permission = group.admin_permission
-                if spp_user_admin_permission:
-                    break
+    spp_user_admin_permission = permission_utils.get_acl(spp_user).is_admin(org_vdc_obj.id)
 
     filtered_vapps = []
     for vapp in vapps:
@@ -73,26 +60,46 @@ def index(request, org_vdc_id):
             vapp['gateway'] = "" if not vapp['gateway'] else vapp['gateway'].split('.')[
                 0]
             vapp['created_by'] = "" if not vapp['created_by'] else vapp['created_by']
-            try:
-                vapp.update(vapp_resources[vapp_vcd_id])
-            except KeyError:
-                # vapp import might need to be done first
-                continue
-            try:
-                vapp.update(vapp_power_states[vapp_vcd_id])
-            except KeyError:
-                # vapp import might need to be done first
-                continue
-            vapp['busy'] = redis_server.exists(vapp_vcd_id)
+            # A vApp created since the last refresh has no summary yet
+            summary = vapp_summaries.get(vapp_vcd_id) or vapp_summary_utils.pending_summary(vapp_vcd_id)
+            vapp.update({key: value for key, value in summary.items()
+                         if key not in ('gateway', 'owner')})
             filtered_vapps.append(vapp)
         else:
             continue
 
     context = {'vapps': filtered_vapps, 'org_vdc_id': org_vdc_id,
-               'admin_permission': spp_user_admin_permission, 'sppuser': spp_user.username, 'cloudAreaName': org_vdc_obj.name }
+               'admin_permission': spp_user_admin_permission, 'sppuser': spp_user.username, 'cloudAreaName': org_vdc_obj.name,
+               'summaries_refreshed': summaries_refreshed, 'summaries_stale': summaries_stale}
     return render(request, 'Vapps/vapp_index.html', context)
 
 
+API_VAPP_FIELDS = ('vcd_id', 'shared', 'created', 'name', 'state_id', 'vts_name',
+                   'created_by_user_obj__user__username', 'ip_address')
+
+
+def api_vapp_details(client, vapp, redis_server):
+    """
+    Builds the vApp details returned by the create_vapp_from_template API.
+
+    Args:
+        vapp: dict: A Vapps row read with values(*API_VAPP_FIELDS).
+    """
+    vapp_vcd_id = vapp.get('vcd_id')
+    return {
+        'name': vapp.get('name', ''),
+        'status': vapp_utils.get_vapp_power_state(client, vapp_vcd_id),
+        'creation_date': vapp.get('created'),
+        'number_of_vms': len(vapp_utils.list_vapp_vms(vapp_vcd_id)),
+        'vapp_id': vapp_vcd_id,
+        'gateway_hostname': (vapp.get('vts_name') or '').split('.')[0],
+        'gateway_ipaddress': vapp.get('ip_address', ''),
+        'owner': vapp.get('created_by_user_obj__user__username', ''),
+        'shared': vapp.get('shared'),
+        'busy': redis_server.exists(vapp_vcd_id),
+    }
+
+
 @require_http_methods(['GET'])
 @login_required(login_url='user_login')
 def create_vapp_from_template(request):
@@ -108,17 +115,13 @@ def create_vapp_from_template(request):
     request_host = 'TestCase' if settings.TEST else request.META['HTTP_HOST']
 
     client = VMWareClientSingleton().client
-    resource_type = ResourceType.VAPP_TEMPLATE.value
-    fields = 'catalogName,name'
-    qfilter = f"isExpired==false;id=={vapp_template_id}"
-    query_result = utils.send_typed_query(
-        client, resource_type, fields, qfilter)
+    template = template_cache_utils.get_template(vapp_template_id, client)
 
     sppuser = None
     if not isinstance(request.user, SppUser):
         sppuser = SppUser.objects.get(user=request.user)
 
-    if not query_result:
+    if not template:
         msg = f"Could not retrieve template from vmware for template id {vapp_template_id}"
         return HttpResponseBadRequest(msg)
 
@@ -132,33 +135,9 @@ def create_vapp_from_template(request):
         if vapp_name_exist:
             # Retrieve the details of the existing vApp
             vapp = Vapps.objects.filter(name=vapp_name).select_related(
-                'org_vdc_obj', 'created_by_user_obj__user').values('vcd_id', 'shared', 'created', 'name',
-                                                                   'state_id', 'vts_name',
-                                                                   'created_by_user_obj__user__username', 'ip_address')
+                'org_vdc_obj', 'created_by_user_obj__user').values(*API_VAPP_FIELDS)
             if vapp:
-                vapp_vcd_id = vapp[0].get('vcd_id')
-                gateway = vapp[0].get('vts_name', '').split('.')[0]
-                created_by = vapp[0].get(
-                    'created_by_user_obj__user__username', '')
-
-                vapp_power_state = vapp_utils.get_vapp_power_state(
-                    client, vapp_vcd_id)
-                number_of_vms = vapp_utils.list_vapp_vms(vapp_vcd_id)
-
-                vapp_details = {
-                    'name': vapp[0].get('name', ''),
-                    'status': vapp_power_state,
-                    'creation_date': vapp[0].get('created'),
-                    'number_of_vms': len(number_of_vms),
-                    'vapp_id': vapp_vcd_id,
-                    'gateway_hostname': gateway,
-                    'gateway_ipaddress': vapp[0].get('ip_address', ''),
-                    'owner': created_by,
-                    'shared': vapp[0].get('shared'),
-                    'busy': redis_server.exists(vapp_vcd_id),
-                }
-
-                return Response(vapp_details)
+                return Response(api_vapp_details(client, vapp[0], redis_server))
 
             else:
                 msg = f'Vapp with name {vapp_name} exists but could not retrieve vApp details'
@@ -168,9 +147,8 @@ def create_vapp_from_template(request):
         msg = f'An error occurred while checking if the vApp name {vapp_name} is unique. VApp name might not be provided in the request'
         return HttpResponseBadRequest(msg)
 
-    templates = query_result[0]
-    catalog_name = templates[0].get("catalogName")
-    template_name = templates[0].get("name")
+    catalog_name = template.get("catalogName")
+    template_name = template.get("name")
 
     if not all([catalog_name, template_name, vapp_name, orgvdc_name, power_on]):
         msg = f'Failed to open catalog area. Check provided arguments "catalog_name": {catalog_name or "MISSING"}, "template_name": {template_name or "MISSING"}, "vapp_name": {vapp_name or "MISSING"}, "orgvdc_name": {orgvdc_name or "MISSING"}'
@@ -183,57 +161,58 @@ def create_vapp_from_template(request):
         msg = f"Org VDC with name {orgvdc_name} not found."
         return HttpResponseBadRequest(msg)
 
-    orgvdc_id = orgvdc_obj.org_vdc_id
-
-    if orgvdc_obj.provider_vdc_obj.new_quota_system and power_on and not vapp_utils.allowed_power_on_vapp_resources(client, orgvdc_id, template_name):
-        msg = f"Starting this vApp {vapp_name} would bring you over the running Resource (CPU/Memory) quota, please power off other vApps first"
-        return HttpResponseBadRequest(msg)
-    elif power_on and not vapp_utils.allowed_poweron_another_vapp(client, orgvdc_id):
-        msg = f"Choosing to power on this new vApp would bring you over the running vApp quota, please power off other vApps first"
-        return HttpResponseBadRequest(msg)
-    elif not vapp_utils.allowed_create_another_vapp(client, orgvdc_id):
-        msg = f"Creating this vApp {vapp_name} would bring you over the Total vApps quota, please delete other vApps first"
-        return HttpResponseBadRequest(msg)
+    try:
+        quota_reservation = vapp_utils.reserve_vapp_quota(client, orgvdc_obj, template, power_on)
+    except quota_utils.QuotaExceeded as exceeded:
+        return HttpResponseBadRequest(vapp_utils.quota_exceeded_message(exceeded.field, vapp_name))
 
     extra_params = {'org_vdc_id': orgvdc_obj.org_vdc_id, 'vapp_name': vapp_name, 'catalog_name': catalog_name,
-                    'template_name': template_name, 'power_on': power_on, 'org_vdc_name': orgvdc_name, 'sppuser': sppuser}
+                    'template_name': template_name, 'power_on': power_on, 'org_vdc_name': orgvdc_name, 'sppuser': sppuser,
+                    'quota_reservation': quota_reservation}
     event_params = utils.create_event_params(func_name=func_name, resource_id=vapp_template_id, user=request.user, resource_type='vapp',
                                              event_stage='Start', created=timezone.now(), extra_params=extra_params, is_api=True, request_host=request_host)
 
     logger.info(f'user: {request.user} vapp_name {vapp_name} vapp_template_name: {template_name} vapp_template_id: {vapp_template_id} catalog_name {catalog_name} orgvdc_name: {orgvdc_name} orgvdc_id: {orgvdc_obj.org_vdc_id}')
 
-    utils.create_event_in_db(event_params)
-    vapp_utils.create_vapp_from_template(event_params)
+    # async=true returns 202 with the job id straight away, wait=<seconds> waits up to
+    # api_job_utils.MAX_WAIT for the job and returns 202 if it is still running
+    wait = api_job_utils.parse_wait(request.GET.get('wait'))
+    if request.GET.get('async', '').lower() == 'true' or wait is not None:
+        utils.assign_job_id(event_params)
+        job_id = event_params['job_id']
+        api_job_utils.track(job_id, vapp_utils.create_vapp_from_template.queue_name(), event_params)
+        try:
+            utils.create_event_in_db(event_params)
+            job = vapp_utils.create_vapp_from_template.delay(event_params)
+        except Exception as error:
+            quota_utils.refresh_after_job(event_params, succeeded=False)
+            api_job_utils.record_outcome(job_id, succeeded=False, error=str(error))
+            raise
+        logger.info(f"LMI Request: vApp {vapp_name} creation accepted as job {job.id}")
+
+        job_record = api_job_utils.wait_for_job(job.id, wait) if wait else api_job_utils.get_job(job.id)
+        if job_record['status'] == api_job_utils.FAILED:
+            return HttpResponseBadRequest(job_record['error'])
+        if job_record['status'] != api_job_utils.FINISHED:
+            return Response(job_record, status=202)
+    else:
+        try:
+            utils.create_event_in_db(event_params)
+            vapp_utils.create_vapp_from_template(event_params)
+        except Exception:
+            quota_utils.refresh_after_job(event_params, succeeded=False)
+            raise
+        quota_utils.refresh_after_job(event_params, succeeded=True)
 
     logger.info(
         f"LMI Request: vApp {vapp_name} Created & Powered On. Retriving the vApp Details")
 
     # Retrieve the details of the created vApp
     vapp = Vapps.objects.filter(org_vdc_obj=orgvdc_obj, name=vapp_name).select_related(
-        'created_by_user_obj__user').values('vcd_id', 'shared', 'created', 'name',
-                                            'state_id', 'vts_name',
-                                            'created_by_user_obj__user__username', 'ip_address')
+        'created_by_user_obj__user').values(*API_VAPP_FIELDS)
 
     if vapp:
-        vapp_vcd_id = vapp[0].get('vcd_id')
-        gateway = vapp[0].get('vts_name', '').split('.')[0]
-        created_by = vapp[0].get('created_by_user_obj__user__username', '')
-
-        vapp_power_state = vapp_utils.get_vapp_power_state(client, vapp_vcd_id)
-        number_of_vms = vapp_utils.list_vapp_vms(vapp_vcd_id)
-
-        vapp_details.append({
-            'name': vapp[0].get('name', ''),
-            'status': vapp_power_state,
-            'creation_date': vapp[0].get('created'),
-            'number_of_vms': len(number_of_vms),
-            'vapp_id': vapp_vcd_id,
-            'gateway_hostname': gateway,
-            'gateway_ipaddress': vapp[0].get('ip_address', ''),
-            'owner': created_by,
-            'shared': vapp[0].get('shared'),
-            'busy': redis_server.exists(vapp_vcd_id),
-        })
+        vapp_details.append(api_vapp_details(client, vapp[0], redis_server))
 
     logger.info(
         f"LMI Request: vApp {vapp_name} Details found.")
@@ -241,6 +220,174 @@ def create_vapp_from_template(request):
     return Response(vapp_details)
 
 
+def get_api_job(request, job_id):
+    """
+    Returns the status of a job started through the API, with the details of the created
+    vApp once it has finished. A wait=<seconds> parameter waits for the job to end.
+    """
+    job_record = api_job_utils.get_job(job_id)
+    if not job_record or not (request.user.is_staff or job_record['user_id'] == str(request.user.pk)):
+        return HttpResponseNotFound(f'Job {job_id} not found')
+    wait = api_job_utils.parse_wait(request.GET.get('wait'))
+    if wait and job_record['status'] not in api_job_utils.FINAL_STATUSES:
+        job_record = api_job_utils.wait_for_job(job_id, wait) or job_record
+
+    job_record['vapp_details'] = None
+    if job_record['status'] == api_job_utils.FINISHED and job_record['vapp_name']:
+        vapp = Vapps.objects.filter(org_vdc_obj__name=job_record['org_vdc_name'],
+                                    name=job_record['vapp_name']).values(*API_VAPP_FIELDS)
+        if vapp:
+            job_record['vapp_details'] = api_vapp_details(VMWareClientSingleton().client, vapp[0],
+                                                          utils.get_redis())
+    return Response(job_record)
+
+
+def get_batch_status(request):
+    """
+    Returns the power state, busy state, current task and gateway of many vApps and VMs.
+
+    Parameters:
+    - ids, names: vApp or VM ids and names, comma separated or repeated. A POST body may
+      give them as lists.
+
+    Returns:
+    - dict: The status of each vApp and VM found and the ids and names that were not found.
+    """
+    values = request.GET.getlist('ids') + request.GET.getlist('names')
+    if request.method == 'POST':
+        for field in ('ids', 'names'):
+            posted = request.data.get(field, [])
+            values += posted if isinstance(posted, list) else [posted]
+    refs = batch_status_utils.parse_refs(values)
+    if not refs:
+        return HttpResponseBadRequest('No vApp or VM ids or names given')
+    if len(refs) > batch_status_utils.MAX_BATCH_SIZE:
+        return HttpResponseBadRequest(
+            f'At most {batch_status_utils.MAX_BATCH_SIZE} vApps and VMs can be asked for at once')
+
+    results, not_found = batch_status_utils.get_batch_status(
+        VMWareClientSingleton().client, refs, permission_utils.get_acl(request.user))
+    logger.info(f"LMI Request: Status of {len(results)} vApps and VMs found, {len(not_found)} not found")
+    return Response({'results': results, 'not_found': not_found})
+
+
+# Bulk action -> (event function name, busy cache event, job)
+BULK_VAPP_ACTIONS = {
+    'start': ('Start_VApp', 'Starting', vapp_utils.start_vapp),
+    'stop': ('Stop_VApp', 'Stopping', vapp_utils.stop_vapp),
+    'poweroff': ('Poweroff_VApp', 'Powering Off', vapp_utils.poweroff_vapp),
+    'delete': ('Delete_VApp', 'Powering Off & Deleting', vapp_utils.delete_vapp),
+}
+
+
+def _bulk_action_error(action, vapp_name, power_state):
+    """
+    Returns why a vApp in the given power state cannot take a bulk action, or None.
+    """
+    if not power_state:
+        return f"Vapp {vapp_name} was not found in vCD"
+    if action == 'start' and power_state == PowerState.POWER_ON.value:
+        return f"Vapp \"{vapp_name}\" is already on"
+    if action == 'stop' and power_state == PowerState.POWER_OFF.value:
+        return f"Vapp \"{vapp_name}\" must be powered on to be stopped"
+    if action == 'poweroff' and power_state == PowerState.POWER_OFF.value:
+        return f"Vapp \"{vapp_name}\" is already powered off."
+    if action == 'delete' and power_state != PowerState.POWER_OFF.value:
+        return f"Vapp \"{vapp_name}\" is not powered off. Please power it off before deleting"
+    return None
+
+
+def bulk_vapp_action(request):
+    """
+    Starts, stops, powers off or deletes many vApps as one job group.
+
+    The vApps are checked and claimed in the busy cache in bulk, and their jobs are run at
+    most parallel at a time. vApps that are busy, in the wrong power state or not writable
+    by the user are rejected and reported in the group.
+
+    Parameters:
+    - action: start, stop, poweroff or delete.
+    - vapp_vcd_ids: The vApp ids, comma separated or repeated. A POST body may give them
+      as a list.
+    - parallel: The most jobs run at once, 5 by default.
+
+    Returns:
+    - Response 202: The job group, see get_job_group.
+    """
+    data = request.data if request.method == 'POST' else request.GET
+    action = data.get('action')
+    values = request.GET.getlist('vapp_vcd_ids')
+    if request.method == 'POST':
+        posted = request.data.get('vapp_vcd_ids', [])
+        values += posted if isinstance(posted, list) else [posted]
+    vapp_vcd_ids = batch_status_utils.parse_refs(values)
+
+    if action not in BULK_VAPP_ACTIONS:
+        return HttpResponseBadRequest(f'Unknown action {action}, expected one of {", ".join(BULK_VAPP_ACTIONS)}')
+    if not vapp_vcd_ids:
+        return HttpResponseBadRequest('No vApp ids given')
+    if len(vapp_vcd_ids) > job_group_utils.MAX_GROUP_SIZE:
+        return HttpResponseBadRequest(f'At most {job_group_utils.MAX_GROUP_SIZE} vApps can be changed at once')
+
+    func_name, busy_event, job = BULK_VAPP_ACTIONS[action]
+    request_host = 'TestCase' if settings.TEST else request.META['HTTP_HOST']
+    acl = permission_utils.get_acl(request.user)
+    vapps = {vapp['vcd_id']: vapp for vapp in Vapps.objects.filter(vcd_id__in=vapp_vcd_ids).values(
+        'vcd_id', 'name', 'org_vdc_obj', 'org_vdc_obj__org_vdc_id')}
+
+    rejected = {}
+    for vapp_vcd_id in vapp_vcd_ids:
+        vapp = vapps.get(vapp_vcd_id)
+        if vapp is None or not acl.can_write(vapp['org_vdc_obj']):
+            rejected[vapp_vcd_id] = ('', f'Vapp {vapp_vcd_id} does not exist')
+            vapps.pop(vapp_vcd_id, None)
+    for vapp_vcd_id in batch_status_utils.get_busy_vapps(list(vapps)):
+        vapp_name = vapps.pop(vapp_vcd_id)['name']
+        rejected[vapp_vcd_id] = (vapp_name, f"Vapp {vapp_name} is currently busy")
+
+    client = VMWareClientSingleton().client
+    power_states = batch_status_utils.get_vapp_states(client, list(vapps), fresh=(action == 'delete'))
+    for vapp_vcd_id in list(vapps):
+        power_state = power_states.get(vapp_vcd_id, ('',))[0]
+        msg = _bulk_action_error(action, vapps[vapp_vcd_id]['name'], power_state)
+        if msg:
+            rejected[vapp_vcd_id] = (vapps.pop(vapp_vcd_id)['name'], msg)
+
+    locked = set(utils.add_vapps_or_vms_to_busy_cache({vapp_vcd_id: busy_event for vapp_vcd_id in vapps}))
+    created = datetime.now()
+    items = []
+    for vapp in vapps.values():
+        if vapp['vcd_id'] not in locked:
+            rejected[vapp['vcd_id']] = (vapp['name'], f"Vapp {vapp['name']} is currently busy")
+            continue
+        extra_params = {'org_vdc_id': vapp['org_vdc_obj__org_vdc_id'], 'vapp_name': vapp['name']}
+        event_params = utils.create_event_params(func_name=func_name, resource_id=vapp['vcd_id'], user=request.user, resource_type='vapp',
+                                                 event_stage='Start', created=created, extra_params=extra_params, is_api=True, request_host=request_host)
+        item_job = job
+        if action == 'stop' and power_states[vapp['vcd_id']][0] == PowerState.MIXED.value:
+            item_job = vapp_utils.poweroff_vapp
+        items.append((event_params, item_job))
+
+    if not items:
+        return HttpResponseBadRequest('; '.join(reason for _, reason in rejected.values()))
+
+    utils.create_events_in_db([event_params for event_params, _ in items])
+    group = job_group_utils.create_group(action, request.user, items, rejected,
+                                         job_group_utils.parse_parallel(data.get('parallel')))
+    logger.info(f"LMI Request: {action} of {len(items)} vApps accepted as job group {group['group_id']}, {len(rejected)} rejected")
+    return Response(group, status=202)
+
+
+def get_job_group(request, group_id):
+    """
+    Returns the progress of a job group and the result of each of its vApps.
+    """
+    group = job_group_utils.get_group(group_id)
+    if not group or not (request.user.is_staff or group['user_id'] == request.user.pk):
+        return HttpResponseNotFound(f'Job group {group_id} not found')
+    return Response(group)
+
+
 @require_http_methods(['GET'])
 @login_required(login_url='user_login')
 def stop_and_add_vapp_to_catalog(request):
@@ -295,13 +442,9 @@ def stop_and_add_vapp_to_catalog(request):
         org_vdc_id = vapp.org_vdc_obj.org_vdc_id
 
         # check if template with same name already exists
-        qfilter = f"isExpired==false;catalogName=={catalog_name}"
-        fields = "name"
-        resource_type = ResourceType.VAPP_TEMPLATE.value
-        catalog_templates = utils.send_typed_query(
-            client, resource_type, fields, qfilter)
+        template_count = template_cache_utils.count_templates(catalog_name, client)
 
-        if not catalog_templates:
+        if not template_count:
             msg = f"Error retrieving templates for catalog: {catalog_name}"
             logger.info(
                 f'user: {request.user} Error retrieving templates for catalog: {catalog_name}')
@@ -309,14 +452,13 @@ def stop_and_add_vapp_to_catalog(request):
 
         # check if the catalog/orgvdc will allow more templates to be added
         catalog_obj = Catalogs.objects.get(name=catalog_name)
-        if not len(catalog_templates) < catalog_obj.allowed_templates:
+        if not template_count < catalog_obj.allowed_templates:
             msg = f"Catalog {catalog_name} already has the max allowed templates, {catalog_obj.allowed_templates}. One or more must be removed before more can be added"
             return HttpResponseBadRequest(msg)
 
-        for template in catalog_templates:
-            if template.get('name').lower() == new_template_name.lower():
-                msg = f"Template with name {new_template_name} already exists in Catalog {catalog_name}"
-                return HttpResponseBadRequest(msg)
+        if template_cache_utils.template_name_exists(catalog_name, new_template_name, client):
+            msg = f"Template with name {new_template_name} already exists in Catalog {catalog_name}"
+            return HttpResponseBadRequest(msg)
 
         # Get Org & Vapp href
         qfilter = f"id=={vapp_vcd_id}"
@@ -366,8 +508,6 @@ def get_vapps(request, org_vdc_id):
     """
     func_name = 'Get_VApps'
     request_host = 'TestCase' if settings.TEST else request.META['HTTP_HOST']
-    redis_server = utils.get_redis()
-    client = VMWareClientSingleton().client
 
     vapps_in_orgVdc = []
 
@@ -385,30 +525,33 @@ def get_vapps(request, org_vdc_id):
     if not vapps_obj:
         return HttpResponseBadRequest(f"No Vapps found for the specified org vdc: {org_vdc_id}")
 
-    vapp_power_states = orgvdc_utils.get_power_state_of_vapps(
-        client, org_vdc_id)
-    vapp_resources = orgvdc_utils.get_vapp_vms(client, org_vdc_id)
+    vapp_summaries, summaries_refreshed, summaries_stale = vapp_summary_utils.get_org_vdc_summaries(
+        org_vdc_id)
 
     for vapp in vapps_obj:
         vapp_vcd_id = vapp['vcd_id']
         vapp['gateway'] = "" if not vapp['vts_name'] else vapp['vts_name'].split('.')[
             0]
         vapp['created_by'] = "" if not vapp['created_by_user_obj__user__username'] else vapp['created_by_user_obj__user__username']
+        summary = vapp_summaries.get(vapp_vcd_id, {})
 
         vapps_in_orgVdc.append({
             'name': vapp['name'],
-            'status': vapp_power_states.get(vapp_vcd_id, {}).get('power_state'),
+            'status': summary.get('power_state'),
             'creation_date': vapp['created'],
-            'number_of_vms': vapp_resources.get(vapp_vcd_id, {}).get('number_of_vms'),
+            'number_of_vms': summary.get('number_of_vms'),
             'vapp_id': vapp_vcd_id,
             'gateway_hostname': vapp['gateway'],
             'gateway_ipaddress': vapp['ip_address'],
             'owner': vapp['created_by'],
             'shared': vapp['shared'],
-            'busy': redis_server.exists(vapp_vcd_id),
+            'busy': summary.get('busy', False),
+            'last_updated': vapp_summary_utils.summary_updated(summary) if summary else None,
+            'stale': summaries_stale,
         })
 
-    return Response(vapps_in_orgVdc)
+    return Response(vapps_in_orgVdc, headers={'X-Summary-Refreshed': summaries_refreshed.isoformat(),
+                                              'X-Summary-Stale': str(summaries_stale).lower()})
 
 
 @require_http_methods(['GET'])
@@ -613,7 +756,7 @@ def delete_vapp(request, vapp_vcd_id, api=False):
 
     # check if Vapp is Powered off
     client = VMWareClientSingleton().client
-    power_state = vapp_utils.is_vapp_powered_off(client, vapp_vcd_id)
+    power_state = vapp_utils.is_vapp_powered_off(client, vapp_vcd_id, fresh=True)
     if power_state != PowerState.POWER_OFF.value:
         msg = f"Vapp \"{vapp_name}\" is not powered off. Please power it off before deleting"
         utils.remove_vapp_or_vm_from_busy_cache(vapp_vcd_id)
@@ -794,28 +937,23 @@ def add_vapp_to_catalog(request):
             return redirect(reverse('Vapp:vapp_index', args=[org_vdc_id]))
 
         # check if template with same name already exists
-        qfilter = f"isExpired==false;catalogName=={catalog_name}"
-        fields = "name"
-        resource_type = ResourceType.VAPP_TEMPLATE.value
-        catalog_templates = utils.send_typed_query(
-            client, resource_type, fields, qfilter)
-        if not catalog_templates:
+        template_count = template_cache_utils.count_templates(catalog_name, client)
+        if not template_count:
             messages.error(
                 request, f"Error retrieving templates for catalog : {catalog_name}")
             return redirect(reverse('Vapp:vapp_index', args=[org_vdc_id]))
 
         # check if the catalog/orgvdc will allow more templates to be added
         catalog_obj = Catalogs.objects.get(name=catalog_name)
-        if not len(catalog_templates) < catalog_obj.allowed_templates:
+        if not template_count < catalog_obj.allowed_templates:
             messages.error(
                 request, f"Catalog {catalog_name} already has the max allowed templates, {catalog_obj.allowed_templates}. One or more must be removed before more can be added")
             return redirect(reverse('Vapp:vapp_index', args=[org_vdc_id]))
 
-        for template in catalog_templates:
-            if template.get('name').lower() == new_template_name.lower():
-                messages.error(
-                    request, f"Template with name {new_template_name} already exists in Catalog {catalog_name}")
-                return redirect(reverse('Vapp:vapp_index', args=[org_vdc_id]))
+        if template_cache_utils.template_name_exists(catalog_name, new_template_name, client):
+            messages.error(
+                request, f"Template with name {new_template_name} already exists in Catalog {catalog_name}")
+            return redirect(reverse('Vapp:vapp_index', args=[org_vdc_id]))
 
         # Get Org & Vapp href
         qfilter = f"id=={vapp_vcd_id}"
@@ -854,7 +992,7 @@ def add_vapp_to_catalog(request):
             return redirect(reverse('Vapp:vapp_index', args=[org_vdc_id]))
         # check if Vapp is Powered off
         msg = f"Vapp \"{vapp_name}\" is not powered off. Please power it off before adding it to a catalog"
-        power_state = vapp_utils.is_vapp_powered_off(client, vapp_vcd_id)
+        power_state = vapp_utils.is_vapp_powered_off(client, vapp_vcd_id, fresh=True)
         if power_state != PowerState.POWER_OFF.value:
             messages.error(request, msg)
             return redirect(reverse('Vapp:vapp_index', args=[org_vdc_id]))
@@ -956,8 +1094,8 @@ def rename_vapp(request, vapp_vcd_id):
 
 
 def vapp_tasks(request, vapp_vcd_id=None):
-    client = VMWareClientSingleton().client
-    task_status = vapp_utils.get_vapp_status(client, vapp_vcd_id)
+    task_status = progress_utils.task_status(
+        vapp_vcd_id, lambda: vapp_utils.get_vapp_status(VMWareClientSingleton().client, vapp_vcd_id))
     return JsonResponse(task_status)
 
 
@@ -1089,31 +1227,8 @@ def recompose_vapp(request, vapp_vcd_id, api=False):
         context['vapp_id'] = vapp_vcd_id
 
         spp_user = SppUser.objects.get(user=request.user)
-        spp_user_ldap_groups = utils.get_user_ldap_groups(spp_user)
-        permission_groups = Groups.objects.filter()
-
-        user_catalogs = set()
-        spp_user_admin_permission = spp_user.is_staff or spp_user.is_superuser
-        if not spp_user_admin_permission:
-            user_groups = []
-            for group in permission_groups:
-                group_cn = group.group_dn.split(',', 1)[0]
-                if group_cn in spp_user_ldap_groups:
-                    user_groups.append(group)
-
-            for group in user_groups:
-                if group.restrict_catalogs:
-                    restricted_catalog_ids = group.unrestricted.split(',')
-                    user_catalogs.update(Catalogs.objects.filter(
-                        vcd_id__in=restricted_catalog_ids))
-                else:
-                    group_catalogs = Catalogs.objects.filter(
-                        org_obj=group.org_obj)
-                    user_catalogs.update(group_catalogs)
-        else:
-            user_catalogs.update(Catalogs.objects.filter())
-
-        user_catalog_ids = [catalog.vcd_id for catalog in user_catalogs]
+        user_catalogs = permission_utils.get_acl(spp_user).filter_catalogs(Catalogs.objects.all())
+        user_catalog_ids = {catalog.vcd_id for catalog in user_catalogs}
 
         catalog_templates = defaultdict(list)
         template_vm_dict = defaultdict(list)
@@ -3,7 +3,8 @@ import xml.etree.ElementTree as ET
 from . import views
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from django.http import HttpResponseBadRequest, HttpResponseServerError, HttpResponse
+from django.http import HttpResponseBadRequest, HttpResponseServerError, HttpResponse, HttpResponseNotFound
+from django.urls import reverse
 from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.authentication import SessionAuthentication, BasicAuthentication
 from rest_framework.permissions import IsAuthenticated
@@ -210,6 +211,9 @@ def get_vapps_xml(request, org_vdc_id):
         ET.SubElement(vapp_element, 'owner').text = vapp['owner']
         ET.SubElement(vapp_element, 'shared').text = str(vapp['shared'])
         ET.SubElement(vapp_element, 'busy').text = str(vapp['busy'])
+        ET.SubElement(vapp_element, 'last_updated').text = vapp['last_updated'].isoformat() \
+            if vapp['last_updated'] else ''
+        ET.SubElement(vapp_element, 'stale').text = str(vapp['stale'])
 
     xml_data = ET.tostring(vm_elements, encoding='UTF-8', xml_declaration=True)
     return HttpResponse(xml_data, content_type='application/xml')
@@ -236,6 +240,64 @@ def get_vapp_status_xml(request, vAppName, org_vdc_id):
     return HttpResponse(ET.tostring(root, encoding='UTF-8', xml_declaration=True), content_type='application/xml')
 
 
+@api_view(['GET', 'POST'])
+@authentication_classes([SessionAuthentication, BasicAuthentication])
+@permission_classes([IsAuthenticated])
+def get_batch_status(request):
+    logger.info("Rest-Call Received: Getting the status of a batch of vApps and VMs")
+    response = views.get_batch_status(request)
+
+    if isinstance(response, HttpResponseBadRequest):
+        message = {'message': 'Error {}'.format(response.content.decode())}
+        return Response(message, status=response.status_code)
+    return Response(dict(response.data, message='Batch status retrieved successfully'))
+
+
+@api_view(['GET', 'POST'])
+@authentication_classes([SessionAuthentication, BasicAuthentication])
+@permission_classes([IsAuthenticated])
+def get_batch_status_xml(request):
+    logger.info("LMI Request: Getting the status of a batch of vApps and VMs")
+    response = views.get_batch_status(request)
+
+    root = ET.Element('response')
+    if isinstance(response, HttpResponseBadRequest):
+        ET.SubElement(root, 'message').text = 'Error {}'.format(response.content.decode())
+        return HttpResponse(ET.tostring(root, encoding='UTF-8', xml_declaration=True),
+                            status=response.status_code, content_type='application/xml')
+
+    for result in response.data['results']:
+        result_element = ET.SubElement(root, result['type'])
+        for field, value in result.items():
+            if field == 'busy':
+                value = '1' if value else '0'
+            ET.SubElement(result_element, field).text = str(value) if value is not None else ''
+    not_found_element = ET.SubElement(root, 'not_found')
+    for ref in response.data['not_found']:
+        ET.SubElement(not_found_element, 'ref').text = ref
+    return HttpResponse(ET.tostring(root, encoding='UTF-8', xml_declaration=True), content_type='application/xml')
+
+
+def _accepted_job(request, job_record, xml=False):
+    """
+    Builds the body of a 202 response for a job accepted by the API.
+    """
+    status_view = 'Vapps-api:get_job_status_xml' if xml else 'Vapps-api:get_job_status'
+    return {'message': 'Request accepted', 'job_id': job_record['job_id'],
+            'status': job_record['status'],
+            'status_url': request.build_absolute_uri(reverse(status_view, args=[job_record['job_id']]))}
+
+
+def _job_to_xml(root, job):
+    job_element = ET.SubElement(root, 'job')
+    for field, value in job.items():
+        if isinstance(value, dict):
+            _job_to_xml(job_element, value).tag = field
+        elif value is not None:
+            ET.SubElement(job_element, field).text = value.isoformat() if hasattr(value, 'isoformat') else str(value)
+    return job_element
+
+
 @api_view(['GET'])
 @authentication_classes([SessionAuthentication, BasicAuthentication])
 @permission_classes([IsAuthenticated])
@@ -252,6 +314,8 @@ def create_vapp_from_template(request):
     if isinstance(response, HttpResponseBadRequest):
         message = {'message': 'Error {}'.format(str(response.content))}
         return Response(message, status=response.status_code)
+    elif response.status_code == 202:
+        return Response(_accepted_job(request, response.data), status=202)
     else:
         return Response({'message': 'VApp Created Successfully', 'Additional_Information': str(response.data)}, status=response.status_code)
 
@@ -277,6 +341,12 @@ def create_vapp_from_template_xml(request):
         return HttpResponse(ET.tostring(root, encoding='utf-8', xml_declaration=True), status=400,
                             content_type='application/xml')
 
+    if response.status_code == 202:
+        root.remove(message_element)
+        _job_to_xml(root, _accepted_job(request, response.data, xml=True))
+        return HttpResponse(ET.tostring(root, encoding='UTF-8', xml_declaration=True), status=202,
+                            content_type='application/xml')
+
     # Access the first dictionary element in the list if 'response.data' is a non-empty list,
     # otherwise assign the value of 'response.data'
     data = response.data[0] if hasattr(response, 'data') and response.data and isinstance(
@@ -370,3 +440,117 @@ def recompose_vapp_xml(request, vapp_vcd_id):
 
     result_element.text = '0'
     return HttpResponse(ET.tostring(root, encoding='UTF-8', xml_declaration=True), content_type='application/xml')
+
+
+@api_view(['GET'])
+@authentication_classes([SessionAuthentication, BasicAuthentication])
+@permission_classes([IsAuthenticated])
+def get_job_status(request, job_id):
+    logger.info(f"Rest-Call Received: Retrieving status of job {job_id}")
+    response = views.get_api_job(request, job_id)
+
+    if isinstance(response, (HttpResponseBadRequest, HttpResponseNotFound)):
+        message = {'message': 'Error {}'.format(response.content.decode())}
+        return Response(message, status=response.status_code)
+    return Response({'message': f'Job {job_id} is {response.data["status"]}', 'job': response.data})
+
+
+@api_view(['GET'])
+@authentication_classes([SessionAuthentication, BasicAuthentication])
+@permission_classes([IsAuthenticated])
+def get_job_status_xml(request, job_id):
+    logger.info(f"LMI Request: Retrieving status of job {job_id}")
+    response = views.get_api_job(request, job_id)
+
+    root = ET.Element('response')
+    if isinstance(response, (HttpResponseBadRequest, HttpResponseNotFound)):
+        ET.SubElement(root, 'message').text = 'Error {}'.format(response.content.decode())
+        return HttpResponse(ET.tostring(root, encoding='UTF-8', xml_declaration=True),
+                            status=response.status_code, content_type='application/xml')
+
+    _job_to_xml(root, response.data)
+    return HttpResponse(ET.tostring(root, encoding='UTF-8', xml_declaration=True), content_type='application/xml')
+
+
+def _group_to_xml(root, group):
+    group_element = ET.SubElement(root, 'job_group')
+    for field, value in group.items():
+        if field == 'items':
+            items_element = ET.SubElement(group_element, 'items')
+            for item in value:
+                item_element = ET.SubElement(items_element, 'item')
+                for item_field, item_value in item.items():
+                    ET.SubElement(item_element, item_field).text = str(item_value)
+        elif value is not None:
+            ET.SubElement(group_element, field).text = str(value)
+    return group_element
+
+
+def _accepted_group(request, group, xml=False):
+    """
+    Builds the body of a 202 response for a job group accepted by the API.
+    """
+    status_view = 'Vapps-api:get_job_group_xml' if xml else 'Vapps-api:get_job_group'
+    return dict(group, message='Request accepted',
+                status_url=request.build_absolute_uri(reverse(status_view, args=[group['group_id']])))
+
+
+@api_view(['GET', 'POST'])
+@authentication_classes([SessionAuthentication, BasicAuthentication])
+@permission_classes([IsAuthenticated])
+def bulk_vapp_action(request):
+    logger.info("Rest-Call Received: Bulk {} of vApps".format(request.GET.get('action') or request.data.get('action')))
+    response = views.bulk_vapp_action(request)
+
+    if isinstance(response, HttpResponseBadRequest):
+        message = {'message': 'Error {}'.format(response.content.decode())}
+        return Response(message, status=response.status_code)
+    return Response(_accepted_group(request, response.data), status=202)
+
+
+@api_view(['GET', 'POST'])
+@authentication_classes([SessionAuthentication, BasicAuthentication])
+@permission_classes([IsAuthenticated])
+def bulk_vapp_action_xml(request):
+    logger.info("LMI Request: Bulk {} of vApps".format(request.GET.get('action') or request.data.get('action')))
+    response = views.bulk_vapp_action(request)
+
+    root = ET.Element('response')
+    if isinstance(response, HttpResponseBadRequest):
+        ET.SubElement(root, 'message').text = 'Error {}'.format(response.content.decode())
+        return HttpResponse(ET.tostring(root, encoding='UTF-8', xml_declaration=True),
+                            status=response.status_code, content_type='application/xml')
+
+    _group_to_xml(root, _accepted_group(request, response.data, xml=True))
+    return HttpResponse(ET.tostring(root, encoding='UTF-8', xml_declaration=True), status=202,
+                        content_type='application/xml')
+
+
+@api_view(['GET'])
+@authentication_classes([SessionAuthentication, BasicAuthentication])
+@permission_classes([IsAuthenticated])
+def get_job_group(request, group_id):
+    logger.info(f"Rest-Call Received: Retrieving status of job group {group_id}")
+    response = views.get_job_group(request, group_id)
+
+    if isinstance(response, HttpResponseNotFound):
+        message = {'message': 'Error {}'.format(response.content.decode())}
+        return Response(message, status=response.status_code)
+    return Response({'message': f'Job group {group_id} is {response.data["status"]}', 'job_group': response.data})
+
+
+@api_view(['GET'])
+@authentication_classes([SessionAuthentication, BasicAuthentication])
+@permission_classes([IsAuthenticated])
+def get_job_group_xml(request, group_id):
+    logger.info(f"LMI Request: Retrieving status of job group {group_id}")
+    response = views.get_job_group(request, group_id)
+
+    root = ET.Element('response')
+    if isinstance(response, HttpResponseNotFound):
+        ET.SubElement(root, 'message').text = 'Error {}'.format(response.content.decode())
+        return HttpResponse(ET.tostring(root, encoding='UTF-8', xml_declaration=True),
+                            status=response.status_code, content_type='application/xml')
+
+    _group_to_xml(root, response.data)
+    return HttpResponse(ET.tostring(root, encoding='UTF-8', xml_declaration=True), content_type='application/xml')
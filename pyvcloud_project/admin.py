@@ -7,8 +7,10 @@ from .models import (
     EventTypes, MigCountTypes, MigRas, MigTeams, MigNightlyCounts, MigVsphereMappings,
     Orgs, ProviderVdcs, OrgVdcs, Groups, MigVcloudMappings, SoftwareBuilds, SoftwareLsvs,
     SoftwareTypes, SoftwareReleases, States, TaskTypes, Teams, ThrottlerSettings, Citags,
-    Events, Catalogs, Vapps, VappCitags, Vms, SppUser, AuthDetail, RetryInterval, HistoricalReport
+    Events, Catalogs, Vapps, VappCitags, Vms, SppUser, AuthDetail, RetryInterval, HistoricalReport,
+    ReportSnapshot, VdcCapacityRollup, VappCapacityRollup
 )
+from .utils import event_utils
 
 
 class EventTypesAdmin(admin.ModelAdmin):
@@ -222,9 +224,13 @@ class EventsAdmin(admin.ModelAdmin):
     """
     Admin class for managing Events in the Django admin interface.
     """
-    list_display = ('function_name', 'resource_id', 'user', 'is_api', 'function_parameters',
+    list_display = ('function_name', 'resource_id', 'user', 'is_api', 'parameters',
                     'event_stage', 'outcome', 'created', 'retries')
 
+    @admin.display(description='Function parameters')
+    def parameters(self, obj):
+        return event_utils.decode_event_parameters(obj.function_parameters)
+
 
 admin.site.register(Events, EventsAdmin)
 
@@ -301,7 +307,8 @@ class RetryIntervalAdmin(admin.ModelAdmin):
     """
     Admin class for managing RetryInterval in the Django admin interface.
     """
-    list_display = ('name', 'max_retries', 'retry_interval')
+    list_display = ('name', 'queue', 'max_retries', 'retry_interval',
+                    'backoff', 'max_interval', 'job_timeout')
 
 
 admin.site.register(RetryInterval, RetryIntervalAdmin)
@@ -310,4 +317,40 @@ admin.site.register(RetryInterval, RetryIntervalAdmin)
 class HistoricalReportAdmin(admin.ModelAdmin):
     list_display = ('name', 'created_date')
 
-admin.site.register(HistoricalReport, HistoricalReportAdmin)
\ No newline at end of file
+admin.site.register(HistoricalReport, HistoricalReportAdmin)
+
+
+class ReportSnapshotAdmin(admin.ModelAdmin):
+    """
+    Admin class for managing ReportSnapshot in the Django admin interface.
+    """
+    list_display = ('report_type', 'scope', 'row_count', 'historical', 'created')
+    list_filter = ('report_type', 'historical')
+    exclude = ('data',)
+
+
+admin.site.register(ReportSnapshot, ReportSnapshotAdmin)
+
+
+class VdcCapacityRollupAdmin(admin.ModelAdmin):
+    """
+    Admin class for viewing VdcCapacityRollup in the Django admin interface.
+    """
+    list_display = ('datacenter_name', 'period', 'period_start', 'sample_count',
+                    'running_cpus_max', 'running_memory_gb_max', 'running_vapps_max')
+    list_filter = ('period',)
+
+
+admin.site.register(VdcCapacityRollup, VdcCapacityRollupAdmin)
+
+
+class VappCapacityRollupAdmin(admin.ModelAdmin):
+    """
+    Admin class for viewing VappCapacityRollup in the Django admin interface.
+    """
+    list_display = ('vapp_name', 'period', 'period_start', 'sample_count',
+                    'powered_on_count', 'running_cpu_max', 'running_memory_max')
+    list_filter = ('period',)
+
+
+admin.site.register(VappCapacityRollup, VappCapacityRollupAdmin)
@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class PyvcloudProjectConfig(AppConfig):
+    name = 'pyvcloud_project'
+
+    def ready(self):
+        from pyvcloud_project import signals  # noqa: F401
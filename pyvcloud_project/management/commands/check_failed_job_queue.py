@@ -13,8 +13,8 @@ class Command(BaseCommand):
 
     Need to regularly poll the failed jobs queue for new entries using cron, match them with the events in the db
     and then update the db event with the exception information from the failed job.
-    The default TTL for a failed job in RQ is 1 year.  rq> defaults.py
-    Won't need to run this too frequently in that case. Once a day should be fine. It can always be triggered manually with
+    Each run only reads the jobs added to the FailedJobRegistry since the cursor stored by the previous run,
+    so it is cheap enough to run every minute. It can always be triggered manually with
     python manage.py check_failed_job_queue
     """
 
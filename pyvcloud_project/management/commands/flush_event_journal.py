@@ -0,0 +1,20 @@
+import logging
+from django.core.management.base import BaseCommand
+from pyvcloud_project.utils import pyvcloud_utils
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Events are appended to a Redis stream by the views and the rq callbacks instead of being written
+    to the database one at a time. This command drains the stream, bulk inserts the events and copies
+    the job id of each finished job onto its Start event.
+    Runs every minute from cron and can be triggered manually with
+    python manage.py flush_event_journal
+    """
+
+    def handle(self, *args, **kwargs):
+        logger.info('Flushing event journal')
+        logger.info(self.style.SUCCESS(
+            f'Finished : {pyvcloud_utils.flush_event_journal()}'))
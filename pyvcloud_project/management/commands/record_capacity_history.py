@@ -0,0 +1,19 @@
+import logging
+from django.core.management.base import BaseCommand
+from pyvcloud_project.utils import report_snapshot_utils
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Builds the system-wide vApp and datacenter reports and adds one sample per org VDC and per
+    vApp to the capacity history, so the hourly, daily and weekly trends are sampled at a fixed
+    rate. Runs every hour from cron and can be triggered manually with
+    python manage.py record_capacity_history
+    """
+
+    def handle(self, *args, **kwargs):
+        logger.info('Recording capacity history')
+        logger.info(self.style.SUCCESS(
+            f'Finished : {report_snapshot_utils.record_capacity_samples()}'))
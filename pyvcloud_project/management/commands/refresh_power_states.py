@@ -0,0 +1,33 @@
+import logging
+import time
+from django.core.management.base import BaseCommand
+from pyvcloud_project.utils import power_state_utils
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Reads the power state of every vApp and VM into the Redis power state cache.
+    With --interval the command keeps running and refreshes the cache every interval seconds,
+    this is how it is run under supervisord. Without it the cache is refreshed once.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Seconds between refreshes, 0 to refresh once')
+
+    def handle(self, *args, **kwargs):
+        interval = kwargs['interval']
+        while True:
+            started = time.monotonic()
+            try:
+                logger.info(self.style.SUCCESS(
+                    f'Finished : {power_state_utils.refresh_power_states()}'))
+            except Exception as error:
+                if not interval:
+                    raise
+                logger.error(f'Power state refresh failed: {error}')
+            if not interval:
+                return
+            time.sleep(max(interval - (time.monotonic() - started), 0))
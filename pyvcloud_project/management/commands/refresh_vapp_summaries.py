@@ -0,0 +1,20 @@
+import logging
+from django.core.management.base import BaseCommand
+from pyvcloud_project.utils import quota_utils, vapp_summary_utils
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds the materialized vApp summaries served by the vApp index and the get_vapps API.
+    The job callbacks keep the summaries of the vApps they touch up to date, this catches
+    changes made directly in vCD. Also reconciles the quota ledgers with vCD. Runs every two
+    minutes from cron.
+    """
+
+    def handle(self, *args, **kwargs):
+        logger.info('Refreshing vApp summaries')
+        logger.info(self.style.SUCCESS(f'Finished : {vapp_summary_utils.refresh_all()}'))
+        logger.info('Reconciling quota ledgers')
+        logger.info(self.style.SUCCESS(f'Finished : {quota_utils.reconcile()}'))
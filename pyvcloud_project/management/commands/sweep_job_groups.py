@@ -0,0 +1,21 @@
+import logging
+from django.core.management.base import BaseCommand
+from pyvcloud_project.utils import job_group_utils
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    A job group only moves on to its next job from the callbacks of the jobs it has queued. A job
+    whose callbacks never run, e.g. because its work horse was killed, would leave its vApp busy
+    and its group stalled. This command ends the items of such jobs and enqueues pending items
+    in their place.
+    Runs every minute from cron and can be triggered manually with
+    python manage.py sweep_job_groups
+    """
+
+    def handle(self, *args, **kwargs):
+        logger.info('Sweeping job groups')
+        logger.info(self.style.SUCCESS(
+            f'Finished : {job_group_utils.sweep_groups()}'))
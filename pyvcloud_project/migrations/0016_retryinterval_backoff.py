@@ -0,0 +1,23 @@
+# Generated by Django 4.2.1 on 2026-10-19 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pyvcloud_project', '0015_historicalreport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='retryinterval',
+            name='backoff',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='retryinterval',
+            name='max_interval',
+            field=models.IntegerField(default=600),
+        ),
+    ]
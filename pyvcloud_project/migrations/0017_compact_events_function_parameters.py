@@ -0,0 +1,119 @@
+# Generated by Django 4.2.1 on 2026-10-19 10:00
+
+import ast
+import base64
+import hashlib
+import json
+import re
+import zlib
+from datetime import date, datetime
+
+from django.db import migrations
+
+# A frozen copy of the schema version 1 encoding of pyvcloud_project.utils.event_utils, so
+# that later changes to that module do not change what this migration writes.
+SCHEMA_VERSION = 1
+
+EVENT_PARAMETER_KEYS = (
+    'func_name', 'resource_id', 'resource_type', 'event_stage', 'outcome', 'created',
+    'is_api', 'request_host', 'job_id', 'retries', 'retries_left', 'retry_max',
+    'org_vdc_id', 'org_vdc_name', 'org_href', 'vapp_name', 'vapp_href', 'old_vapp_name',
+    'new_vapp_name', 'vm_name', 'vm_href', 'catalog_name', 'template_id', 'template_name',
+    'template_href', 'new_template_name', 'power_on',
+)
+
+EVENT_BLOB_KEYS = ('contents', 'templates', 'recompose_vms')
+
+MAX_VALUE_LENGTH = 256
+COMPRESS_THRESHOLD = 2048
+COMPRESSED_PREFIX = 'zlib:'
+
+LEGACY_VALUE_PATTERN = re.compile(r"'(\w+)': ('(?:[^'\\]|\\.)*'|True|False|None|-?\d+)")
+
+
+def _blob_pointer(value):
+    text = value if isinstance(value, str) else str(value)
+    return {'sha256': hashlib.sha256(text.encode()).hexdigest(), 'len': len(text)}
+
+
+def _compact_value(value):
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    text = value if isinstance(value, str) else str(value)
+    if len(text) > MAX_VALUE_LENGTH:
+        return _blob_pointer(text)
+    return text
+
+
+def encode_event_parameters(params):
+    document = {'v': SCHEMA_VERSION}
+    user = params.get('user')
+    if user is not None:
+        document['user'] = getattr(user, 'username', None) or str(user)
+    for key in EVENT_PARAMETER_KEYS:
+        if key in params:
+            document[key] = _compact_value(params[key])
+    for key in EVENT_BLOB_KEYS:
+        if params.get(key) is not None:
+            document[key] = _blob_pointer(params[key])
+
+    encoded = json.dumps(document, separators=(',', ':'))
+    if len(encoded) > COMPRESS_THRESHOLD:
+        compressed = base64.b64encode(zlib.compress(encoded.encode())).decode()
+        encoded = COMPRESSED_PREFIX + compressed
+    return encoded
+
+
+def is_encoded(text):
+    if text.startswith(COMPRESSED_PREFIX):
+        return True
+    try:
+        document = json.loads(text)
+    except ValueError:
+        return False
+    return isinstance(document, dict) and 'v' in document
+
+
+def parse_legacy_event_parameters(text):
+    try:
+        params = ast.literal_eval(text)
+        if isinstance(params, dict):
+            return params
+    except (ValueError, SyntaxError):
+        pass
+    params = {}
+    for key, value in LEGACY_VALUE_PATTERN.findall(text):
+        if key in EVENT_PARAMETER_KEYS and key not in params:
+            params[key] = ast.literal_eval(value)
+    return params
+
+
+def compact_function_parameters(apps, schema_editor):
+    Events = apps.get_model('pyvcloud_project', 'Events')
+    batch = []
+    events = Events.objects.exclude(function_parameters__isnull=True).exclude(
+        function_parameters='').only('id', 'function_parameters')
+    for event in events.iterator(chunk_size=1000):
+        if is_encoded(event.function_parameters):
+            continue
+        event.function_parameters = encode_event_parameters(
+            parse_legacy_event_parameters(event.function_parameters))
+        batch.append(event)
+        if len(batch) >= 1000:
+            Events.objects.bulk_update(batch, ['function_parameters'])
+            batch = []
+    if batch:
+        Events.objects.bulk_update(batch, ['function_parameters'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pyvcloud_project', '0016_retryinterval_backoff'),
+    ]
+
+    operations = [
+        migrations.RunPython(compact_function_parameters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.1 on 2026-10-19 12:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pyvcloud_project', '0017_compact_events_function_parameters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('report_type', models.CharField(choices=[('vapp', 'Vapp'), ('datacenter', 'Datacenter')], max_length=20)),
+                ('scope', models.CharField(blank=True, default='', max_length=60)),
+                ('schema_version', models.IntegerField(default=1)),
+                ('row_count', models.IntegerField(default=0)),
+                ('data', models.BinaryField()),
+                ('historical', models.BooleanField(default=False)),
+                ('created', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name_plural': 'Report Snapshots',
+                'indexes': [models.Index(fields=['report_type', 'scope', 'created'], name='report_snapshot_lookup_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='historicalreport',
+            name='snapshot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='pyvcloud_project.reportsnapshot'),
+        ),
+    ]
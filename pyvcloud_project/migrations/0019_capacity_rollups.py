@@ -0,0 +1,64 @@
+# Generated by Django 4.2.1 on 2026-10-19 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pyvcloud_project', '0018_reportsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VappCapacityRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vapp_vcd_id', models.CharField(max_length=128)),
+                ('vapp_name', models.CharField(max_length=128)),
+                ('org_vdc_id', models.CharField(db_index=True, max_length=128)),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day'), ('week', 'Week')], max_length=10)),
+                ('period_start', models.DateTimeField()),
+                ('sample_count', models.IntegerField(default=0)),
+                ('powered_on_count', models.IntegerField(default=0)),
+                ('running_cpu_sum', models.BigIntegerField(default=0)),
+                ('running_cpu_max', models.IntegerField(default=0)),
+                ('running_memory_sum', models.BigIntegerField(default=0)),
+                ('running_memory_max', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'vApp Capacity Rollups',
+                'indexes': [models.Index(fields=['period', 'period_start'], name='vapp_capacity_rollup_period_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='VdcCapacityRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('org_vdc_id', models.CharField(max_length=128)),
+                ('datacenter_name', models.CharField(max_length=60)),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day'), ('week', 'Week')], max_length=10)),
+                ('period_start', models.DateTimeField()),
+                ('sample_count', models.IntegerField(default=0)),
+                ('running_cpus_sum', models.BigIntegerField(default=0)),
+                ('running_cpus_max', models.IntegerField(default=0)),
+                ('running_memory_gb_sum', models.BigIntegerField(default=0)),
+                ('running_memory_gb_max', models.IntegerField(default=0)),
+                ('running_vapps_sum', models.BigIntegerField(default=0)),
+                ('running_vapps_max', models.IntegerField(default=0)),
+                ('total_vapps_sum', models.BigIntegerField(default=0)),
+                ('total_vapps_max', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'VDC Capacity Rollups',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='vdccapacityrollup',
+            constraint=models.UniqueConstraint(fields=('org_vdc_id', 'period', 'period_start'), name='vdc_capacity_rollup_bucket'),
+        ),
+        migrations.AddConstraint(
+            model_name='vappcapacityrollup',
+            constraint=models.UniqueConstraint(fields=('vapp_vcd_id', 'period', 'period_start'), name='vapp_capacity_rollup_bucket'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.1 on 2026-10-19 16:00
+
+from django.db import migrations
+
+
+def add_rebuild_report_snapshot_policy(apps, schema_editor):
+    RetryInterval = apps.get_model('pyvcloud_project', 'RetryInterval')
+    if not RetryInterval.objects.filter(name='rebuild_report_snapshot').exists():
+        RetryInterval.objects.create(name='rebuild_report_snapshot', queue='low', max_retries=0,
+                                     retry_interval=60, job_timeout=1800, backoff=False,
+                                     max_interval=600)
+
+
+def remove_rebuild_report_snapshot_policy(apps, schema_editor):
+    RetryInterval = apps.get_model('pyvcloud_project', 'RetryInterval')
+    RetryInterval.objects.filter(name='rebuild_report_snapshot').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pyvcloud_project', '0019_capacity_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_rebuild_report_snapshot_policy, remove_rebuild_report_snapshot_policy),
+    ]
@@ -3,10 +3,8 @@ Module: models.py
 Description: Contains the models for the pyvcloud_project module.
 """
 
-from collections import namedtuple
 from django.db import models
 from django.contrib.auth.models import User
-from rq import Retry
 import django
 
 
@@ -561,27 +559,6 @@ class AuthDetail(models.Model):
         return str(self.name)
 
 
-class RetryIntervalManager(models.Manager):
-    """
-    Custom manager for RetryInterval model.
-    """
-
-    def get_retry_obj(self, name):
-        """
-        Retrieve the retry object for the given name.
-        """
-        retry_tuple = namedtuple('RetryInterval', ['args', 'kwargs'])
-        try:
-            self_obj = self.get(name=name)
-        except RetryInterval.DoesNotExist:
-            return retry_tuple('default', {
-                'connection': None, 'timeout': 1800, 'retry': Retry(max=3, interval=30)
-            })
-        return retry_tuple(self_obj.queue, {'connection': None, 'timeout': self_obj.job_timeout,
-                                            'retry': Retry(max=self_obj.max_retries,
-                                                           interval=self_obj.retry_interval)})
-
-
 class RetryInterval(models.Model):
     """
     Model representing retry intervals.
@@ -597,8 +574,8 @@ class RetryInterval(models.Model):
     max_retries = models.IntegerField(blank=False, null=False, default=1)
     retry_interval = models.IntegerField(blank=False, null=False, default=1)
     job_timeout = models.IntegerField(blank=False, null=False, default=600)
-
-    objects = RetryIntervalManager()
+    backoff = models.BooleanField(default=False)
+    max_interval = models.IntegerField(blank=False, null=False, default=600)
 
     class Meta:
         verbose_name_plural = 'RetryIntervals'
@@ -606,12 +583,106 @@ class RetryInterval(models.Model):
     def __str__(self):
         return str(self.name)
 
+class ReportSnapshot(models.Model):
+    """
+    Model representing a generated report, stored as zlib compressed JSON rows.
+    """
+    class ReportTypes(models.TextChoices):
+        VAPP = 'vapp'
+        DATACENTER = 'datacenter'
+
+    report_type = models.CharField(max_length=20, choices=ReportTypes.choices)
+    scope = models.CharField(max_length=60, blank=True, default='')
+    schema_version = models.IntegerField(default=1)
+    row_count = models.IntegerField(default=0)
+    data = models.BinaryField()
+    historical = models.BooleanField(default=False)
+    created = models.DateTimeField(default=django.utils.timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name_plural = 'Report Snapshots'
+        indexes = [models.Index(fields=['report_type', 'scope', 'created'],
+                                name='report_snapshot_lookup_idx')]
+
+    def __str__(self):
+        return f'{self.report_type} report {self.scope} {self.created}'
+
+
+class CapacityPeriods(models.TextChoices):
+    """
+    The bucket sizes of the capacity history rollups.
+    """
+    HOUR = 'hour'
+    DAY = 'day'
+    WEEK = 'week'
+
+
+class VdcCapacityRollup(models.Model):
+    """
+    Model representing the capacity used by an org VDC over one hour, day or week.
+
+    Each report snapshot adds one sample; the sums and sample_count give the average.
+    """
+    org_vdc_id = models.CharField(max_length=128)
+    datacenter_name = models.CharField(max_length=60)
+    period = models.CharField(max_length=10, choices=CapacityPeriods.choices)
+    period_start = models.DateTimeField()
+    sample_count = models.IntegerField(default=0)
+    running_cpus_sum = models.BigIntegerField(default=0)
+    running_cpus_max = models.IntegerField(default=0)
+    running_memory_gb_sum = models.BigIntegerField(default=0)
+    running_memory_gb_max = models.IntegerField(default=0)
+    running_vapps_sum = models.BigIntegerField(default=0)
+    running_vapps_max = models.IntegerField(default=0)
+    total_vapps_sum = models.BigIntegerField(default=0)
+    total_vapps_max = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'VDC Capacity Rollups'
+        constraints = [models.UniqueConstraint(fields=['org_vdc_id', 'period', 'period_start'],
+                                               name='vdc_capacity_rollup_bucket')]
+
+    def __str__(self):
+        return f'{self.datacenter_name} {self.period} {self.period_start}'
+
+
+class VappCapacityRollup(models.Model):
+    """
+    Model representing the capacity used by a vApp over one hour, day or week.
+
+    Each report snapshot adds one sample; the sums and sample_count give the average.
+    """
+    vapp_vcd_id = models.CharField(max_length=128)
+    vapp_name = models.CharField(max_length=128)
+    org_vdc_id = models.CharField(max_length=128, db_index=True)
+    period = models.CharField(max_length=10, choices=CapacityPeriods.choices)
+    period_start = models.DateTimeField()
+    sample_count = models.IntegerField(default=0)
+    powered_on_count = models.IntegerField(default=0)
+    running_cpu_sum = models.BigIntegerField(default=0)
+    running_cpu_max = models.IntegerField(default=0)
+    running_memory_sum = models.BigIntegerField(default=0)
+    running_memory_max = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'vApp Capacity Rollups'
+        constraints = [models.UniqueConstraint(fields=['vapp_vcd_id', 'period', 'period_start'],
+                                               name='vapp_capacity_rollup_bucket')]
+        indexes = [models.Index(fields=['period', 'period_start'],
+                                name='vapp_capacity_rollup_period_idx')]
+
+    def __str__(self):
+        return f'{self.vapp_name} {self.period} {self.period_start}'
+
+
 class HistoricalReport(models.Model):
     """
     Table to store historical reports
     """
     name = models.CharField(max_length=50)
     created_date = models.DateTimeField(auto_now_add=True)
+    snapshot = models.ForeignKey(ReportSnapshot, on_delete=models.SET_NULL,
+                                 blank=True, null=True)
 
     class Meta:
         verbose_name_plural = 'Historical Reports'
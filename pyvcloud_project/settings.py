@@ -52,7 +52,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'pyvcloud_project',
+    'pyvcloud_project.apps.PyvcloudProjectConfig',
     'VMs.apps.VmsConfig',
     'Vapps.apps.VappsConfig',
     'django_rq',
@@ -242,6 +242,9 @@ RQ_QUEUES = {
         'USE_REDIS_CACHE': 'default',
     },
 }
+RQ = {
+    'WORKER_CLASS': 'pyvcloud_project.worker.WarmWorker',
+}
 SESSION_ENGINE = "django.contrib.sessions.backends.cache"
 SESSION_CACHE_ALIAS = "default"
 DJANGO_SETTINGS_MODULE = "settings rq worker high default low"
@@ -295,6 +298,11 @@ LOGGING = {
 }
 
 CRONJOBS = [
+    ('* * * * *', 'django.core.management.call_command', ['flush_event_journal']),
+    ('* * * * *', 'django.core.management.call_command', ['check_failed_job_queue']),
+    ('* * * * *', 'django.core.management.call_command', ['sweep_job_groups']),
+    ('*/2 * * * *', 'django.core.management.call_command', ['refresh_vapp_summaries']),
+    ('0 * * * *', 'django.core.management.call_command', ['record_capacity_history']),
     ('0 1 * * *', 'django.core.management.call_command', ['import_database']),
     ('0 2 * * *', 'pyvcloud_project.historical_report_cron_jobs.DatacenterReportDownloadCronJob'),
     ('0 2 * * *', 'pyvcloud_project.historical_report_cron_jobs.VappReportDownloadCronJob'),
@@ -0,0 +1,63 @@
+"""
+Module: signals.py
+Description: Signal receivers that keep the Redis-backed caches in step with the database.
+"""
+
+from django.db.models.signals import post_delete, post_save
+from django.contrib.auth.models import User
+from django.dispatch import receiver
+from redis.exceptions import RedisError
+from pyvcloud_project.models import Catalogs, Groups, RetryInterval, SppUser, Vapps, Vms
+from pyvcloud_project.utils import gateway_index_utils, permission_utils
+from pyvcloud_project.worker_queue_settings import RetryPolicyRegistry
+
+
+@receiver([post_save, post_delete], sender=RetryInterval)
+def invalidate_retry_policies(sender, **kwargs):
+    """
+    Reload the retry policies in every process when a RetryInterval changes.
+    """
+    RetryPolicyRegistry.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Groups)
+@receiver([post_save, post_delete], sender=Catalogs)
+def invalidate_all_user_acls(sender, **kwargs):
+    """
+    Rebuild every user's permissions when a group or catalog changes.
+    """
+    permission_utils.invalidate_all()
+
+
+@receiver([post_save, post_delete], sender=SppUser)
+def invalidate_spp_user_acl(sender, instance, **kwargs):
+    """
+    Rebuild a user's permissions when their LDAP groups are saved at login.
+    """
+    permission_utils.invalidate_user(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user_acl(sender, instance, **kwargs):
+    """
+    Rebuild a user's permissions when their staff or superuser flag changes.
+    """
+    permission_utils.invalidate_user(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Vapps)
+@receiver([post_save, post_delete], sender=Vms)
+def update_gateway_index(sender, instance, signal, **kwargs):
+    """
+    Keep the gateway index used by the VM self-service APIs in step with the vApp
+    gateways and VMs saved by the imports and jobs.
+    """
+    if sender is Vapps:
+        update = gateway_index_utils.index_vapp if signal is post_save else gateway_index_utils.unindex_vapp
+    else:
+        update = gateway_index_utils.index_vm if signal is post_save else gateway_index_utils.unindex_vm
+    try:
+        update(instance)
+    except RedisError:
+        # The index is rebuilt from the database once it expires
+        pass
@@ -0,0 +1,138 @@
+"""
+This module contains test cases for the Lua scripts of the Redis quota ledger.
+
+The tests run the scripts against the Redis server of the settings, on org VDC ids of their
+own, and are skipped when Redis is not available.
+"""
+
+import time
+import uuid
+from types import SimpleNamespace
+from django.test import SimpleTestCase
+from redis.exceptions import RedisError
+from pyvcloud_project.utils import quota_utils
+from pyvcloud_project.utils import pyvcloud_utils as utils
+
+
+class QuotaLedgerTestCase(SimpleTestCase):
+    """
+    Test cases for reserving, settling and reconciling quota.
+    """
+
+    def setUp(self):
+        """
+        Set up an org VDC with an empty ledger.
+        """
+        self.redis = utils.get_redis()
+        try:
+            self.redis.ping()
+        except RedisError:
+            self.skipTest('Redis is not available')
+        self.org_vdc_id = f'test-{uuid.uuid4().hex}'
+        self.org_vdc = SimpleNamespace(org_vdc_id=self.org_vdc_id, running_tb_limit=2,
+                                       stored_tb_limit=3, cpu_limit=8, memory_limit=16)
+        self.reservations = []
+        quota_utils.write_ledgers({}, [self.org_vdc_id], time.time())
+
+    def tearDown(self):
+        keys = quota_utils._keys(self.org_vdc_id)
+        del keys[2]
+        keys += [quota_utils.RESERVATION_KEY.format(reservation_id)
+                 for reservation_id in self.reservations]
+        self.redis.delete(*keys)
+
+    def reserve(self, **kwargs):
+        reservation_id = quota_utils.reserve(self.org_vdc, **kwargs)
+        self.reservations.append(reservation_id)
+        return reservation_id
+
+    def ledger(self):
+        return {field: int(value) for field, value in
+                self.redis.hgetall(quota_utils.LEDGER_KEY.format(self.org_vdc_id)).items()}
+
+    def reserved(self):
+        return {field: int(value) for field, value in
+                self.redis.hgetall(quota_utils.RESERVED_KEY.format(self.org_vdc_id)).items()}
+
+    def test_reserve_records_the_reservation(self):
+        """
+        Test that a reservation within the quotas adds to the reserved totals.
+        """
+        self.reserve(power_on=True, cpu=2, memory_mb=1024, check_resources=True)
+        self.assertEqual(self.reserved(), {'running': 1, 'stored': 1, 'cpu': 2, 'memory_mb': 1024})
+        self.assertEqual(self.ledger(), {'running': 0, 'stored': 0, 'cpu': 0, 'memory_mb': 0})
+
+    def test_reserve_over_quota_changes_nothing(self):
+        """
+        Test that a reservation over a quota is refused without reserving anything.
+        """
+        self.reserve(power_on=True)
+        with self.assertRaises(quota_utils.QuotaExceeded) as context:
+            self.reserve(power_on=True)
+        self.assertEqual(context.exception.field, 'running')
+        self.assertEqual(self.reserved()['running'], 1)
+
+        with self.assertRaises(quota_utils.QuotaExceeded) as context:
+            self.reserve(power_on=False, cpu=9, check_resources=True)
+        self.assertEqual(context.exception.field, 'cpu')
+        self.assertEqual(self.reserved()['stored'], 1)
+
+    def test_commit_moves_the_reservation_into_the_ledger(self):
+        """
+        Test that committing a reservation moves it into the ledger only once.
+        """
+        reservation_id = self.reserve(power_on=True, cpu=2, memory_mb=512)
+        self.assertEqual(quota_utils.commit(self.org_vdc_id, reservation_id), 1)
+        self.assertEqual(self.ledger(), {'running': 1, 'stored': 1, 'cpu': 2, 'memory_mb': 512})
+        self.assertEqual(self.reserved(), {'running': 0, 'stored': 0, 'cpu': 0, 'memory_mb': 0})
+        self.assertEqual(quota_utils.commit(self.org_vdc_id, reservation_id), 0)
+        self.assertEqual(self.ledger()['stored'], 1)
+
+    def test_release_gives_the_reservation_back(self):
+        """
+        Test that releasing a reservation leaves the ledger unchanged.
+        """
+        reservation_id = self.reserve(power_on=False)
+        self.assertEqual(quota_utils.release(self.org_vdc_id, reservation_id), 1)
+        self.assertEqual(self.reserved()['stored'], 0)
+        self.assertEqual(self.ledger()['stored'], 0)
+        self.assertEqual(quota_utils.release(self.org_vdc_id, reservation_id), 0)
+        self.assertEqual(self.reserved()['stored'], 0)
+
+    def test_reconcile_keeps_reservations_made_during_the_query(self):
+        """
+        Test that a reconcile does not drop a reservation made while vCD was queried.
+        """
+        started = time.time()
+        self.reserve(power_on=True)
+        quota_utils.write_ledgers({self.org_vdc_id: {'running': 0, 'stored': 1, 'cpu': 0,
+                                                     'memory_mb': 0}}, [self.org_vdc_id], started)
+        self.assertEqual(self.reserved()['running'], 1)
+        self.assertEqual(self.ledger()['stored'], 1)
+
+    def test_reconcile_adds_commits_made_during_the_query(self):
+        """
+        Test that a reconcile counts a vApp committed after the vCD query started.
+        """
+        started = time.time()
+        reservation_id = self.reserve(power_on=True, cpu=2)
+        quota_utils.commit(self.org_vdc_id, reservation_id)
+        quota_utils.write_ledgers({}, [self.org_vdc_id], started)
+        self.assertEqual(self.ledger(), {'running': 1, 'stored': 1, 'cpu': 2, 'memory_mb': 0})
+        self.assertEqual(self.reserved()['running'], 0)
+
+        quota_utils.write_ledgers({}, [self.org_vdc_id], time.time() + 1)
+        self.assertEqual(self.ledger()['stored'], 0)
+
+    def test_reconcile_drops_expired_reservations(self):
+        """
+        Test that a reconcile drops reservations that have expired.
+        """
+        reservation_id = self.reserve(power_on=False)
+        self.redis.delete(quota_utils.RESERVATION_KEY.format(reservation_id))
+        quota_utils.write_ledgers({}, [self.org_vdc_id], time.time())
+        self.assertEqual(self.reserved()['stored'], 0)
+        self.assertFalse(self.redis.sismember(
+            quota_utils.RESERVATION_INDEX_KEY.format(self.org_vdc_id), reservation_id))
+        self.assertEqual(quota_utils.release(self.org_vdc_id, reservation_id), 0)
+        self.assertEqual(self.reserved()['stored'], 0)
@@ -8,7 +8,7 @@ from django.contrib.auth.models import User
 from django.conf import settings
 from rest_framework.test import APITestCase
 from rest_framework import status
-from pyvcloud_project.models import SppUser
+from pyvcloud_project.models import OrgVdcs, SppUser
 
 
 class HomePageAPITestCase(APITestCase):
@@ -120,3 +120,103 @@ class HomePageAPITestCase(APITestCase):
             self.assertIsInstance(template, dict)
             for key in expected_keys:
                 self.assertIn(key, template)
+
+
+class CapacityTrendAPITestCase(APITestCase):
+    """
+    Test cases for the capacity trend API views and the progress endpoint.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Set up a staff user, a user without permissions and an org VDC.
+        """
+        settings.TEST = True
+        cls.client = Client()
+        cls.username = 'testStaffUser'
+        cls.password = 'testStaffUserPassword'
+        cls.user = User.objects.create_user(username=cls.username, password=cls.password, is_staff=True)
+        SppUser.objects.create(user=cls.user, ldap_groups='')
+        cls.plain_username = 'testPlainUser'
+        cls.plain_password = 'testPlainUserPassword'
+        plain_user = User.objects.create_user(username=cls.plain_username, password=cls.plain_password)
+        SppUser.objects.create(user=plain_user, ldap_groups='')
+        cls.org_vdc = OrgVdcs.objects.create(name='test_trend_vdc', org_vdc_id='urn:vcloud:vdc:test-trend')
+
+    def setUp(self):
+        """
+        Log in the staff user.
+        """
+        self.logged_in = self.client.login(username=self.username, password=self.password)
+
+    def test_get_vdc_capacity_trend(self):
+        """
+        Test getting the capacity trend of an org VDC.
+        """
+        self.assertTrue(self.logged_in)
+        response = self.client.get(reverse('Views-api:get_vdc_capacity_trend',
+                                           args=[self.org_vdc.name, 'running_cpus']), {'period': 'week'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response_data = response.json()
+        self.assertEqual(response_data['period'], 'week')
+        self.assertIsInstance(response_data['series'], list)
+
+    def test_get_vdc_capacity_trend_unknown_datacenter(self):
+        """
+        Test getting the capacity trend of an org VDC that does not exist.
+        """
+        self.assertTrue(self.logged_in)
+        response = self.client.get(reverse('Views-api:get_vdc_capacity_trend',
+                                           args=['unknown_vdc', 'running_cpus']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_get_vdc_capacity_trend_unknown_metric(self):
+        """
+        Test getting the capacity trend of a metric that does not exist.
+        """
+        self.assertTrue(self.logged_in)
+        response = self.client.get(reverse('Views-api:get_vdc_capacity_trend',
+                                           args=[self.org_vdc.name, 'unknown_metric']))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Unknown metric unknown_metric', response.json()['message'])
+
+    def test_get_vdc_capacity_trend_too_many_days(self):
+        """
+        Test that a days parameter too large for a timedelta is clamped.
+        """
+        self.assertTrue(self.logged_in)
+        response = self.client.get(reverse('Views-api:get_vdc_capacity_trend',
+                                           args=[self.org_vdc.name, 'running_cpus']),
+                                   {'period': 'hour', 'days': 10 ** 12})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_get_vapp_capacity_trend_without_history(self):
+        """
+        Test getting the capacity trend of a vApp without any recorded history.
+        """
+        self.assertTrue(self.logged_in)
+        response = self.client.get(reverse('Views-api:get_vapp_capacity_trend',
+                                           args=['urn:vcloud:vapp:deleted', 'running_cpu']))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['series'], [])
+
+    def test_get_vapp_capacity_trend_without_permission(self):
+        """
+        Test that a user who may not read every org VDC does not see the history of an
+        unknown vApp.
+        """
+        self.client.logout()
+        self.assertTrue(self.client.login(username=self.plain_username, password=self.plain_password))
+        response = self.client.get(reverse('Views-api:get_vapp_capacity_trend',
+                                           args=['urn:vcloud:vapp:deleted', 'running_cpu']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_progress_poll_malformed_basic_auth(self):
+        """
+        Test that a malformed Authorization header is refused rather than failing.
+        """
+        self.client.logout()
+        response = self.client.get(reverse('progress_poll', args=['urn:vcloud:vapp:unknown']),
+                                   HTTP_AUTHORIZATION='Basic not-base64!')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
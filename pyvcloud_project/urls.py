@@ -61,6 +61,8 @@ urlpatterns = [
          views.delete_groups, name='delete_groups'),
     path('OrgsVdcs/edit', views.edit_orgvdc,
          name='edit_orgvdc'),
+    path('progress/<str:resource_id>', views.progress_poll, name='progress_poll'),
+    path('progress/<str:resource_id>/stream', views.progress_stream, name='progress_stream'),
     path('django-rq/', include('django_rq.urls')),
     path('Vapps/', include('Vapps.urls')),
     path('Vapps-api/', include('Vapps.urls_api')),
@@ -15,5 +15,9 @@ urlpatterns = [
     path('get_templates_from_catalog/<str:catalog_name>',
          views_api.get_templates_from_catalog, name='get_templates_from_catalog'),
     path('get_templates_from_catalog_xml/<str:catalog_name>',
-         views_api.get_templates_from_catalog_xml, name='get_templates_from_catalog_xml')
+         views_api.get_templates_from_catalog_xml, name='get_templates_from_catalog_xml'),
+    path('get_vdc_capacity_trend/<str:datacenter_name>/<str:metric>',
+         views_api.get_vdc_capacity_trend, name='get_vdc_capacity_trend'),
+    path('get_vapp_capacity_trend/<str:vapp_vcd_id>/<str:metric>',
+         views_api.get_vapp_capacity_trend, name='get_vapp_capacity_trend')
 ]
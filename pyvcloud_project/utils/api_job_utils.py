@@ -0,0 +1,141 @@
+"""
+This module tracks the worker jobs started asynchronously by the LMI API.
+
+When an API request is accepted with 202 its job is recorded in the Redis hash
+api_job:<job_id>, holding the request details and the job status. The job is recorded
+under a job id chosen before it is enqueued, so even a job that ends straight away finds
+its record. The status moves from queued to started when the rq job runs, and to finished
+or failed when the job callbacks record its outcome. If the callbacks did not record it,
+the outcome is taken from rq, and a job rq no longer knows is failed once
+ENQUEUE_GRACE has passed. The status endpoints read this hash, so a job can still be
+looked up for API_JOB_TTL after rq has dropped it.
+"""
+import time
+from datetime import timedelta
+import django_rq
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rq.exceptions import NoSuchJobError
+from rq.job import Job
+from pyvcloud_project.utils import pyvcloud_utils as utils
+
+API_JOB_KEY = 'api_job:{}'
+API_JOB_TTL = 24 * 3600
+
+QUEUED = 'queued'
+STARTED = 'started'
+FINISHED = 'finished'
+FAILED = 'failed'
+FINAL_STATUSES = (FINISHED, FAILED)
+
+# The longest a request may wait for a job with wait=, in seconds
+MAX_WAIT = 60
+WAIT_POLL_INTERVAL = 1
+
+# A job rq does not know yet may still be being enqueued for this long
+ENQUEUE_GRACE = timedelta(seconds=60)
+
+
+def track(job_id, queue, params):
+    """
+    Records a job accepted by the API, before it is enqueued.
+
+    Args:
+        job_id: str: The id the job is enqueued under, see pyvcloud_utils.assign_job_id.
+        queue: str: The name of the queue the job is enqueued on.
+        params: dict: The event parameters the job is enqueued with.
+    """
+    user = params.get('user')
+    record = {
+        'job_id': job_id,
+        'queue': queue,
+        'func_name': params.get('func_name', ''),
+        'resource_id': params.get('resource_id', ''),
+        'vapp_name': params.get('vapp_name', ''),
+        'org_vdc_name': params.get('org_vdc_name', ''),
+        'user_id': getattr(user, 'pk', '') or '',
+        'status': QUEUED,
+        'error': '',
+        'created': timezone.now().isoformat(),
+    }
+    pipeline = utils.get_redis().pipeline()
+    pipeline.hset(API_JOB_KEY.format(job_id), mapping=record)
+    pipeline.expire(API_JOB_KEY.format(job_id), API_JOB_TTL)
+    pipeline.execute()
+
+
+def record_outcome(job_id, succeeded, error=''):
+    """
+    Records the outcome of a job, if it was started through the API.
+    """
+    key = API_JOB_KEY.format(job_id)
+    redis_instance = utils.get_redis()
+    if redis_instance.exists(key):
+        redis_instance.hset(key, mapping={'status': FINISHED if succeeded else FAILED,
+                                          'error': error, 'ended': timezone.now().isoformat()})
+
+
+def _rq_status(record):
+    """
+    Returns the status and error of a job that has no recorded outcome yet, as seen by rq.
+    """
+    try:
+        job = Job.fetch(record['job_id'], connection=django_rq.get_queue(record['queue']).connection)
+    except NoSuchJobError:
+        created = parse_datetime(record['created'])
+        if created and timezone.now() - created < ENQUEUE_GRACE:
+            return record['status'], ''
+        return FAILED, 'The job ended without recording its outcome'
+    status = job.get_status()
+    status = getattr(status, 'value', status)
+    if status == 'finished':
+        return FINISHED, ''
+    if status == 'failed':
+        return FAILED, (job.exc_info or '').strip().split('\n')[-1]
+    return (STARTED if status == 'started' else QUEUED), ''
+
+
+def get_job(job_id):
+    """
+    Returns the record of a job started through the API.
+
+    Returns:
+        dict: The job record with its current status, or None if the job is not known.
+    """
+    record = utils.get_redis().hgetall(API_JOB_KEY.format(job_id))
+    if not record:
+        return None
+    if record['status'] not in FINAL_STATUSES:
+        record['status'], error = _rq_status(record)
+        if record['status'] in FINAL_STATUSES:
+            record_outcome(job_id, record['status'] == FINISHED, error)
+            record['error'] = error
+    return record
+
+
+def wait_for_job(job_id, timeout):
+    """
+    Waits up to timeout seconds, capped at MAX_WAIT, for a job to finish or fail.
+
+    Returns:
+        dict: The job record, or None if the job is not known.
+    """
+    deadline = time.monotonic() + min(max(timeout, 0), MAX_WAIT)
+    record = get_job(job_id)
+    while record and record['status'] not in FINAL_STATUSES and time.monotonic() < deadline:
+        time.sleep(WAIT_POLL_INTERVAL)
+        record = get_job(job_id)
+    return record
+
+
+def parse_wait(value):
+    """
+    Parses the wait= query parameter.
+
+    Returns:
+        int: The seconds to wait, or None if the parameter is missing or invalid.
+    """
+    try:
+        return int(value) if value not in (None, '') else None
+    except ValueError:
+        return None
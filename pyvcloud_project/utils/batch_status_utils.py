@@ -0,0 +1,273 @@
+"""
+This module contains the batch status lookup behind the LMI batch status API.
+
+The vApps and VMs asked for are given by id or name and resolved with one vApp and one VM
+query, which also loads the VMs of every vApp for its busy check. Busy flags are read with
+one Redis pipeline, power states from the power state cache and running jobs from the
+progress streams. vCD is only asked about what the caches cannot answer: one ADMIN_VAPP,
+one ADMIN_VM and one ADMIN_TASK query per QUERY_CHUNK_SIZE resources, whose answers are
+written back to the caches.
+"""
+import json
+from django.db.models import Q
+from pyvcloud.vcd.client import ResourceType
+from pyvcloud_project.models import Vapps, Vms
+from pyvcloud_project.utils import orgvdc_utils, power_state_utils, progress_utils, \
+    pyvcloud_utils as utils, vapp_utils, vm_utils
+
+# The most vApps and VMs one request may ask for
+MAX_BATCH_SIZE = 200
+
+# The most ids put in the filter of one vCD query, keeping the query URL short
+QUERY_CHUNK_SIZE = 40
+
+VAPP_URN_PREFIX = 'urn:vcloud:vapp:'
+VM_URN_PREFIX = 'urn:vcloud:vm:'
+
+VAPP_FIELDS = ('vcd_id', 'name', 'vts_name', 'org_vdc_obj', 'org_vdc_obj__name')
+VM_FIELDS = ('vcd_id', 'name', 'vapp_obj__vcd_id', 'vapp_obj__name', 'vapp_obj__vts_name',
+             'vapp_obj__org_vdc_obj', 'vapp_obj__org_vdc_obj__name')
+
+NO_RUNNING_TASKS = 'No running tasks'
+
+
+def parse_refs(values):
+    """
+    Splits comma separated ids and names into a list without blanks or duplicates.
+    """
+    return list(dict.fromkeys(ref.strip() for value in values
+                              for ref in str(value).split(',') if ref.strip()))
+
+
+def _chunks(values, size=QUERY_CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _query_by_field(client, resource_type, fields, field, values, qfilter=None):
+    """
+    Streams the records of typed queries matching any of values, one query per chunk.
+    """
+    for chunk in _chunks(values):
+        any_filter = ','.join(f'{field}=={value}' for value in chunk)
+        chunk_filter = f'{qfilter};({any_filter})' if qfilter else any_filter
+        yield from utils.stream_typed_query(client, resource_type, fields, chunk_filter)
+
+
+def _vm_uuid(vm_vcd_id):
+    """
+    Returns the bare uuid of a VM urn, which some views use as its busy cache key.
+    """
+    return vm_vcd_id.rsplit(':', 1)[-1]
+
+
+def _gateway(vts_name):
+    return '' if not vts_name else vts_name.split('.')[0]
+
+
+def resolve(refs, acl):
+    """
+    Finds the vApps and VMs given by id or name that the user may read.
+
+    Ids may be urns or bare uuids. A name matching several vApps or VMs returns all of them.
+
+    Args:
+        refs: list: The ids and names.
+        acl: UserAcl: The permissions of the user.
+
+    Returns:
+        tuple: (items, vapp_vms, not_found) where items holds one dict per vApp or VM,
+        vapp_vms maps each vApp found to the vcd_ids of its VMs and not_found lists the
+        refs that matched nothing.
+    """
+    keys = {}
+    for ref in refs:
+        candidates = [ref] if ref.startswith('urn:') else [ref, VAPP_URN_PREFIX + ref, VM_URN_PREFIX + ref]
+        for key in candidates:
+            keys.setdefault(key, []).append(ref)
+
+    items, found = [], set()
+    vapps = Vapps.objects.filter(Q(vcd_id__in=list(keys)) | Q(name__in=refs)).values(*VAPP_FIELDS)
+    for vapp in vapps:
+        if not acl.can_read(vapp['org_vdc_obj']):
+            continue
+        matched = keys.get(vapp['vcd_id'], []) + keys.get(vapp['name'], [])
+        found.update(matched)
+        items.append({'ref': matched[0], 'type': 'vapp', 'vcd_id': vapp['vcd_id'],
+                      'name': vapp['name'], 'vapp_vcd_id': vapp['vcd_id'], 'vapp_name': vapp['name'],
+                      'org_vdc_name': vapp['org_vdc_obj__name'], 'gateway': _gateway(vapp['vts_name'])})
+
+    vapp_vms = {item['vcd_id']: [] for item in items}
+    vms = Vms.objects.filter(Q(vcd_id__in=list(keys)) | Q(name__in=refs) |
+                             Q(vapp_obj__vcd_id__in=list(vapp_vms))).values(*VM_FIELDS)
+    for vm in vms:
+        if vm['vapp_obj__vcd_id'] in vapp_vms:
+            vapp_vms[vm['vapp_obj__vcd_id']].append(vm['vcd_id'])
+        matched = keys.get(vm['vcd_id'], []) + keys.get(vm['name'], [])
+        if not matched or not acl.can_read(vm['vapp_obj__org_vdc_obj']):
+            continue
+        found.update(matched)
+        items.append({'ref': matched[0], 'type': 'vm', 'vcd_id': vm['vcd_id'], 'name': vm['name'],
+                      'vapp_vcd_id': vm['vapp_obj__vcd_id'], 'vapp_name': vm['vapp_obj__name'],
+                      'org_vdc_name': vm['vapp_obj__org_vdc_obj__name'],
+                      'gateway': _gateway(vm['vapp_obj__vts_name'])})
+
+    return items, vapp_vms, [ref for ref in refs if ref not in found]
+
+
+def _busy_reasons(items, vapp_vms):
+    """
+    Reads the busy cache entries of the items and of the VMs of the vApps with one pipeline.
+
+    Returns:
+        dict: item vcd_id -> busy reason, for the busy items.
+    """
+    cache_keys = {}
+    for item in items:
+        cache_keys.setdefault(item['vcd_id'], [item['vcd_id']])
+        if item['type'] == 'vm':
+            cache_keys[item['vcd_id']].append(_vm_uuid(item['vcd_id']))
+        for vm_vcd_id in vapp_vms.get(item['vcd_id'], []):
+            cache_keys[item['vcd_id']] += [vm_vcd_id, _vm_uuid(vm_vcd_id)]
+
+    flat_keys = list(dict.fromkeys(key for keys in cache_keys.values() for key in keys))
+    if not flat_keys:
+        return {}
+    pipeline = utils.get_redis().pipeline()
+    for key in flat_keys:
+        pipeline.get(key)
+    entries = {key: value for key, value in zip(flat_keys, pipeline.execute()) if value}
+
+    reasons = {}
+    for vcd_id, keys in cache_keys.items():
+        reason = next((entries[key] for key in keys if key in entries), None)
+        if reason:
+            reasons[vcd_id] = reason
+    return reasons
+
+
+def get_busy_vapps(vapp_vcd_ids):
+    """
+    Returns vApp vcd_id -> busy reason for the vApps that are busy or have a busy VM,
+    reading their VMs with one query and the busy cache with one pipeline.
+    """
+    vapp_vms = {vapp_vcd_id: [] for vapp_vcd_id in vapp_vcd_ids}
+    for vm in Vms.objects.filter(vapp_obj__vcd_id__in=list(vapp_vms)).values('vcd_id', 'vapp_obj__vcd_id'):
+        vapp_vms[vm['vapp_obj__vcd_id']].append(vm['vcd_id'])
+    return _busy_reasons([{'vcd_id': vapp_vcd_id, 'type': 'vapp'} for vapp_vcd_id in vapp_vms],
+                         vapp_vms)
+
+
+def get_vapp_states(client, vapp_vcd_ids, fresh=False):
+    """
+    Returns vApp vcd_id -> (status, isDeployed) from the power state cache, querying vCD
+    for the vApps it does not hold, or for all of them if fresh is set. vApps unknown to
+    vCD are left out.
+    """
+    vapp_states = {} if fresh else power_state_utils.get_vapp_states(vapp_vcd_ids)
+    missing = [vapp_vcd_id for vapp_vcd_id in vapp_vcd_ids if vapp_vcd_id not in vapp_states]
+    for record in _query_by_field(client, ResourceType.ADMIN_VAPP.value, 'status,isDeployed,vdc',
+                                  'id', missing):
+        vapp_vcd_id = utils.href_to_id(record.get('href'))
+        vapp_states[vapp_vcd_id] = (record.get('status'), record.get('isDeployed'))
+        power_state_utils.set_vapp_state(vapp_vcd_id, *vapp_states[vapp_vcd_id],
+                                         utils.vdc_href_to_id(record.get('vdc')))
+    return vapp_states
+
+
+def _power_states(client, items):
+    """
+    Returns item vcd_id -> power state, from the power state cache and from vCD for the
+    items it does not hold.
+    """
+    vapp_ids = [item['vcd_id'] for item in items if item['type'] == 'vapp']
+    vm_ids = [item['vcd_id'] for item in items if item['type'] == 'vm']
+
+    vapp_states = get_vapp_states(client, vapp_ids)
+
+    vm_states = power_state_utils.get_vm_states(vm_ids)
+    missing = [vm_vcd_id for vm_vcd_id in vm_ids if vm_vcd_id not in vm_states]
+    queried = {utils.href_to_id(record.get('href')): record.get('status')
+               for record in _query_by_field(client, ResourceType.ADMIN_VM.value, 'status', 'id', missing)}
+    power_state_utils.set_vm_states(queried)
+    vm_states.update(queried)
+
+    states = {vapp_vcd_id: orgvdc_utils.create_vapp_status_string(*state)
+              for vapp_vcd_id, state in vapp_states.items()}
+    states.update(vm_states)
+    return states
+
+
+def _current_tasks(client, items):
+    """
+    Returns item vcd_id -> current task.
+
+    The task of a running SPP job comes from its progress stream, otherwise the answer
+    cached by the task views is used. The remaining items are looked up with running
+    ADMIN_TASK queries, and their answers cached for the task views.
+    """
+    vcd_ids = list(dict.fromkeys(item['vcd_id'] for item in items))
+    events = progress_utils.latest_events(vcd_ids)
+    tasks = {vcd_id: progress_utils.status_text(event)
+             for vcd_id, event in events.items() if progress_utils.is_running(event)}
+
+    redis_instance = utils.get_redis()
+    pending = [vcd_id for vcd_id in vcd_ids if vcd_id not in tasks]
+    if pending:
+        cached = redis_instance.mget([progress_utils.TASK_STATUS_KEY.format(vcd_id) for vcd_id in pending])
+        for vcd_id, value in zip(pending, cached):
+            if value:
+                tasks[vcd_id] = json.loads(value)['status']
+
+    pending = [vcd_id for vcd_id in vcd_ids if vcd_id not in tasks]
+    if not pending:
+        return tasks
+    latest = {}
+    for record in _query_by_field(client, ResourceType.ADMIN_TASK.value, 'status,operationFull,object,startDate',
+                                  'object', pending, qfilter='status==running'):
+        vcd_id = utils.href_to_id(record.get('object'))
+        if vcd_id not in latest or record.get('startDate', '') > latest[vcd_id].get('startDate', ''):
+            latest[vcd_id] = record
+
+    pipeline = redis_instance.pipeline()
+    for vcd_id in pending:
+        record = latest.get(vcd_id)
+        if record is None:
+            tasks[vcd_id] = NO_RUNNING_TASKS
+        elif vcd_id.startswith(VM_URN_PREFIX):
+            tasks[vcd_id] = vm_utils.shorten_task_operation(record.get('operationFull', ''))
+        else:
+            tasks[vcd_id] = vapp_utils.shorten_task_operation(record.get('operationFull', ''))
+        pipeline.set(progress_utils.TASK_STATUS_KEY.format(vcd_id),
+                     json.dumps({'status': tasks[vcd_id]}), ex=progress_utils.TASK_STATUS_TTL)
+    pipeline.execute()
+    return tasks
+
+
+def get_batch_status(client, refs, acl):
+    """
+    Returns the power state, busy state, current task and gateway of many vApps and VMs.
+
+    Args:
+        client: VMWare client object.
+        refs: list: The ids and names of the vApps and VMs, at most MAX_BATCH_SIZE.
+        acl: UserAcl: The permissions of the user.
+
+    Returns:
+        tuple: (results, not_found) where results holds one dict per vApp or VM found and
+        not_found lists the refs that matched nothing the user may read.
+    """
+    items, vapp_vms, not_found = resolve(refs, acl)
+    if not items:
+        return [], not_found
+
+    busy_reasons = _busy_reasons(items, vapp_vms)
+    power_states = _power_states(client, items)
+    tasks = _current_tasks(client, items)
+    for item in items:
+        item['power_state'] = power_states.get(item['vcd_id'], '')
+        item['busy'] = item['vcd_id'] in busy_reasons
+        item['busy_reason'] = busy_reasons.get(item['vcd_id'], '')
+        item['current_task'] = tasks.get(item['vcd_id'], NO_RUNNING_TASKS)
+    return items, not_found
@@ -0,0 +1,205 @@
+"""
+This module contains the capacity history kept from the system-wide report snapshots.
+
+Every hour, report_snapshot_utils.record_capacity_samples builds a system-wide datacenter and
+vApp snapshot, and each adds one sample per org VDC and per vApp to
+the hour, day and week buckets it falls in (VdcCapacityRollup and VappCapacityRollup). The
+buckets keep the sum, peak and sample count of each metric, so they are updated in place as
+samples arrive and a trend is read back with one indexed query. Hourly buckets are kept for
+HOURLY_RETENTION, daily and weekly buckets are kept.
+
+A late or manual run may record into the same buckets as the scheduled one. The buckets
+are created with ignore_conflicts and then locked with select_for_update before they are
+updated, so neither sample is lost.
+"""
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+from pyvcloud_project.models import CapacityPeriods, VappCapacityRollup, VdcCapacityRollup
+from pyvcloud_project.utils.pyvcloud_utils import PowerState
+
+HOURLY_RETENTION = timedelta(days=31)
+
+# The furthest back a trend reads daily and weekly buckets, in days
+MAX_TREND_DAYS = 10 * 366
+
+# Metric name -> datacenter report row key
+VDC_METRICS = {
+    'running_cpus': 'running_cpus',
+    'running_memory_gb': 'running_memory_gb',
+    'running_vapps': 'running_vApps',
+    'total_vapps': 'total_vApps',
+}
+
+# Metric name -> vApp report row key
+VAPP_METRICS = {
+    'running_cpu': 'running_cpu',
+    'running_memory': 'running_memory',
+}
+
+BULK_BATCH_SIZE = 500
+
+
+def period_start(timestamp, period):
+    """
+    Returns the start of the hour, day or week (starting on Monday) holding a timestamp.
+    """
+    if period == CapacityPeriods.HOUR:
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    day = timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == CapacityPeriods.DAY:
+        return day
+    return day - timedelta(days=day.weekday())
+
+
+def _record_samples(model, key_field, samples, metrics, timestamp):
+    """
+    Adds one sample per key to the hour, day and week buckets of a rollup model.
+
+    Args:
+        samples: dict: key -> (labels, values, counters), where labels are copied onto the
+            bucket, values are added to the <metric>_sum and <metric>_max fields and counters
+            are added to the field of the same name.
+    """
+    with transaction.atomic():
+        for period in CapacityPeriods.values:
+            start = period_start(timestamp, period)
+            # Make sure every bucket exists, then lock them before adding the samples
+            model.objects.bulk_create(
+                [model(**{key_field: key}, **labels, period=period, period_start=start)
+                 for key, (labels, _, _) in samples.items()],
+                batch_size=BULK_BATCH_SIZE, ignore_conflicts=True)
+            buckets = {getattr(rollup, key_field): rollup
+                       for rollup in model.objects.select_for_update().filter(period=period, period_start=start)}
+            to_update = []
+            for key, (labels, values, counters) in samples.items():
+                rollup = buckets[key]
+                for field, label in labels.items():
+                    setattr(rollup, field, label)
+                for metric, value in values.items():
+                    setattr(rollup, f'{metric}_sum', getattr(rollup, f'{metric}_sum') + value)
+                    setattr(rollup, f'{metric}_max', max(getattr(rollup, f'{metric}_max'), value))
+                for field, value in counters.items():
+                    setattr(rollup, field, getattr(rollup, field) + value)
+                rollup.sample_count += 1
+                to_update.append(rollup)
+
+            update_fields = ['sample_count'] + list(labels) + list(counters)
+            update_fields += [f'{metric}_{suffix}' for metric in metrics for suffix in ('sum', 'max')]
+            model.objects.bulk_update(to_update, update_fields, batch_size=BULK_BATCH_SIZE)
+
+        model.objects.filter(period=CapacityPeriods.HOUR,
+                             period_start__lt=timestamp - HOURLY_RETENTION).delete()
+
+
+def record_datacenter_rows(rows, timestamp=None):
+    """
+    Adds the rows of a datacenter report to the org VDC capacity history.
+    """
+    samples = {}
+    for row in rows:
+        if not row.get('org_vdc_id'):
+            continue
+        samples[row['org_vdc_id']] = (
+            {'datacenter_name': row['datacenter_name']},
+            {metric: int(row.get(key) or 0) for metric, key in VDC_METRICS.items()},
+            {},
+        )
+    if samples:
+        _record_samples(VdcCapacityRollup, 'org_vdc_id', samples, VDC_METRICS,
+                        timestamp or timezone.now())
+
+
+def record_vapp_rows(rows, timestamp=None):
+    """
+    Adds the rows of a vApp report to the vApp capacity history.
+    """
+    samples = {}
+    for row in rows:
+        samples[row['vapp_vcd_id']] = (
+            {'vapp_name': row['name'], 'org_vdc_id': row.get('org_vdc_id') or ''},
+            {metric: int(row.get(key) or 0) for metric, key in VAPP_METRICS.items()},
+            {'powered_on_count': int(row.get('vapp_power_state') == PowerState.POWER_ON.value)},
+        )
+    if samples:
+        _record_samples(VappCapacityRollup, 'vapp_vcd_id', samples, VAPP_METRICS,
+                        timestamp or timezone.now())
+
+
+def _series(rollups, metric):
+    series = []
+    for rollup in rollups:
+        point = {
+            'period_start': rollup.period_start,
+            'average': round(getattr(rollup, f'{metric}_sum') / rollup.sample_count, 2),
+            'peak': getattr(rollup, f'{metric}_max'),
+            'samples': rollup.sample_count,
+        }
+        if isinstance(rollup, VappCapacityRollup):
+            point['powered_on_ratio'] = round(rollup.powered_on_count / rollup.sample_count, 2)
+        series.append(point)
+    return series
+
+
+def _trend(model, metrics, lookup, metric, period, since, until):
+    if metric not in metrics:
+        raise ValueError(f'Unknown metric {metric}, expected one of {", ".join(metrics)}')
+    if period not in CapacityPeriods.values:
+        raise ValueError(f'Unknown period {period}, expected one of {", ".join(CapacityPeriods.values)}')
+    rollups = model.objects.filter(**lookup, period=period, sample_count__gt=0)
+    if since:
+        rollups = rollups.filter(period_start__gte=period_start(since, period))
+    if until:
+        rollups = rollups.filter(period_start__lte=until)
+    return _series(rollups.order_by('period_start'), metric)
+
+
+def max_trend_days(period):
+    """
+    Returns the most days of history a trend of a period can hold.
+    """
+    return HOURLY_RETENTION.days if period == CapacityPeriods.HOUR else MAX_TREND_DAYS
+
+
+def vdc_trend(org_vdc_id, metric, period=CapacityPeriods.DAY, since=None, until=None):
+    """
+    Returns the trend of one metric of an org VDC.
+
+    Args:
+        org_vdc_id: str: The org VDC urn.
+        metric: str: One of VDC_METRICS.
+        period: str: One of CapacityPeriods.
+        since: datetime: The first bucket to return, optional.
+        until: datetime: The last bucket to return, optional.
+
+    Returns:
+        list: One dict per bucket with period_start, average, peak and samples.
+
+    Raises:
+        ValueError: If the metric or period is unknown.
+    """
+    return _trend(VdcCapacityRollup, VDC_METRICS, {'org_vdc_id': org_vdc_id},
+                  metric, period, since, until)
+
+
+def vapp_org_vdc_id(vapp_vcd_id):
+    """
+    Returns the org VDC urn the latest history of a vApp was recorded in, or None.
+    """
+    return VappCapacityRollup.objects.filter(vapp_vcd_id=vapp_vcd_id).exclude(org_vdc_id='') \
+        .order_by('-period_start').values_list('org_vdc_id', flat=True).first()
+
+
+def vapp_trend(vapp_vcd_id, metric, period=CapacityPeriods.DAY, since=None, until=None):
+    """
+    Returns the trend of one metric of a vApp.
+
+    Returns:
+        list: One dict per bucket with period_start, average, peak, samples and
+        powered_on_ratio.
+
+    Raises:
+        ValueError: If the metric or period is unknown.
+    """
+    return _trend(VappCapacityRollup, VAPP_METRICS, {'vapp_vcd_id': vapp_vcd_id},
+                  metric, period, since, until)
@@ -0,0 +1,104 @@
+"""
+This module contains the compact encoding used for Events.function_parameters.
+
+Event parameters used to be stored as the str() of the whole parameter dict,
+including lxml elements, XML contents and model reprs. They are now stored as
+schema-versioned JSON holding only the whitelisted keys. Large values are
+replaced by a sha256 pointer, and documents above COMPRESS_THRESHOLD bytes are
+zlib compressed.
+
+    {"v": 1, "func_name": "...", "resource_id": "...", "contents": {"sha256": "...", "len": 5120}}
+    zlib:<base64 of the zlib compressed JSON document>
+"""
+import base64
+import hashlib
+import json
+import zlib
+from datetime import date, datetime
+
+SCHEMA_VERSION = 1
+
+# Keys stored as they are, as long as they are not longer than MAX_VALUE_LENGTH
+EVENT_PARAMETER_KEYS = (
+    'func_name', 'resource_id', 'resource_type', 'event_stage', 'outcome', 'created',
+    'is_api', 'request_host', 'job_id', 'retries', 'retries_left', 'retry_max',
+    'org_vdc_id', 'org_vdc_name', 'org_href', 'vapp_name', 'vapp_href', 'old_vapp_name',
+    'new_vapp_name', 'vm_name', 'vm_href', 'catalog_name', 'template_id', 'template_name',
+    'template_href', 'new_template_name', 'power_on',
+)
+
+# Keys whose values are always stored as a hash pointer
+EVENT_BLOB_KEYS = ('contents', 'templates', 'recompose_vms')
+
+MAX_VALUE_LENGTH = 256
+COMPRESS_THRESHOLD = 2048
+COMPRESSED_PREFIX = 'zlib:'
+
+def _blob_pointer(value):
+    text = value if isinstance(value, str) else str(value)
+    return {'sha256': hashlib.sha256(text.encode()).hexdigest(), 'len': len(text)}
+
+
+def _compact_value(value):
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    text = value if isinstance(value, str) else str(value)
+    if len(text) > MAX_VALUE_LENGTH:
+        return _blob_pointer(text)
+    return text
+
+
+def encode_event_parameters(params):
+    """
+    Encode event parameters into the compact function_parameters format.
+
+    Args:
+        params: dict: The event parameters.
+
+    Returns:
+        str: The encoded parameters.
+    """
+    document = {'v': SCHEMA_VERSION}
+    user = params.get('user')
+    if user is not None:
+        document['user'] = getattr(user, 'username', None) or str(user)
+    for key in EVENT_PARAMETER_KEYS:
+        if key in params:
+            document[key] = _compact_value(params[key])
+    for key in EVENT_BLOB_KEYS:
+        if params.get(key) is not None:
+            document[key] = _blob_pointer(params[key])
+
+    encoded = json.dumps(document, separators=(',', ':'))
+    if len(encoded) > COMPRESS_THRESHOLD:
+        compressed = base64.b64encode(zlib.compress(encoded.encode())).decode()
+        encoded = COMPRESSED_PREFIX + compressed
+    return encoded
+
+
+def decode_event_parameters(text):
+    """
+    Decode function_parameters written by encode_event_parameters.
+
+    Rows that have not been converted yet are returned as {'legacy': text}.
+
+    Args:
+        text: str: The stored function_parameters.
+
+    Returns:
+        dict: The decoded parameters.
+    """
+    if not text:
+        return {}
+    if text.startswith(COMPRESSED_PREFIX):
+        text = zlib.decompress(base64.b64decode(text[len(COMPRESSED_PREFIX):])).decode()
+    try:
+        document = json.loads(text)
+    except ValueError:
+        return {'legacy': text}
+    if not isinstance(document, dict) or 'v' not in document:
+        return {'legacy': text}
+    return document
+
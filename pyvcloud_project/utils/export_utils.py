@@ -0,0 +1,220 @@
+"""
+This module contains the report export engine used by the report downloads and the
+historical report cron jobs.
+
+Each report has one declarative list of columns. Rows are written one at a time as CSV or
+NDJSON into a StreamingHttpResponse, gzip compressed when the client accepts it, so the
+response is never built in memory. Historical report files are served in chunks with
+support for single HTTP byte ranges, so large files can be resumed.
+"""
+import csv
+import json
+import os
+import re
+import zlib
+from collections import namedtuple
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+
+HISTORICAL_REPORTS_DIR = '/opt/pycloudportal/HistoricalReports'
+
+FILE_CHUNK_SIZE = 64 * 1024
+
+Column = namedtuple('Column', ['header', 'key'])
+
+VAPP_REPORT_COLUMNS = [
+    Column('Datacenter Name', 'catalog_name'),
+    Column('vApp Name', 'name'),
+    Column('Status', 'vapp_power_state'),
+    Column('Gateway', 'gateway'),
+    Column('Created By', 'created_by'),
+    Column('Creation Date', 'creation_date'),
+    Column('Running CPUs', 'running_cpu'),
+    Column('Running Memory (GB)', 'running_memory'),
+    Column('Origin Catalog Name', 'origin_catalog_name'),
+    Column('Origin Template Name', 'origin_template_name'),
+]
+
+DATACENTER_REPORT_COLUMNS = [
+    Column('Datacenter Name', 'datacenter_name'),
+    Column('Provider Name', 'provider_name'),
+    Column('Running CPUs', 'running_cpus'),
+    Column('Running CPUs Quota', 'running_cpus_quota'),
+    Column('Unused Running CPUs Quota', 'unused_running_cpus_quota'),
+    Column('Running Memory (GB)', 'running_memory_gb'),
+    Column('Running Memory Quota (GB)', 'running_memory_quota_gb'),
+    Column('Unused Running Memory Quota (GB)', 'unused_running_memory_quota_gb'),
+    Column('Running vApps', 'running_vApps'),
+    Column('Running vApps Quota', 'running_vApps_quota'),
+    Column('Unused Running vApps Quota', 'unused_running_vApps_quota'),
+    Column('Total vApps', 'total_vApps'),
+    Column('Total vApps Quota', 'total_vApps_quota'),
+    Column('Unused Total vApps Quota', 'unused_total_vApps_quota'),
+]
+
+RANGE_HEADER_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class Echo:
+    """
+    A file-like object whose write returns the value written, so csv.writer can produce
+    one line at a time.
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(columns, rows):
+    """
+    Yields the header line and then one CSV line per row.
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow([column.header for column in columns])
+    for row in rows:
+        yield writer.writerow([row.get(column.key) for column in columns])
+
+
+def iter_ndjson(columns, rows):
+    """
+    Yields one JSON object per row, keyed by the column keys.
+    """
+    for row in rows:
+        yield json.dumps({column.key: row.get(column.key) for column in columns},
+                         cls=DjangoJSONEncoder) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': (iter_csv, 'text/csv', 'csv'),
+    'ndjson': (iter_ndjson, 'application/x-ndjson', 'ndjson'),
+}
+
+
+def iter_gzip(chunks):
+    """
+    Gzip compresses a stream of str chunks.
+    """
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def accepts_gzip(request):
+    return 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '').lower()
+
+
+def export_response(request, columns, rows, filename):
+    """
+    Streams a report as an attachment.
+
+    The format is taken from the format query parameter (csv by default, or ndjson), and the
+    response is gzip encoded if the client accepts it.
+
+    Args:
+        columns: list: The Column list of the report.
+        rows: iterable: The report rows as dicts.
+        filename: str: The attachment name, without extension.
+
+    Returns:
+        StreamingHttpResponse: The export, or HttpResponse 400 for an unknown format.
+    """
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponse(f'Unknown export format: {export_format}', status=400)
+    row_writer, content_type, extension = EXPORT_FORMATS[export_format]
+
+    chunks = row_writer(columns, rows)
+    if accepts_gzip(request):
+        response = StreamingHttpResponse(iter_gzip(chunks), content_type=content_type)
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Vary'] = 'Accept-Encoding'
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{extension}"'
+    return response
+
+
+def write_csv_file(file_path, columns, rows):
+    """
+    Writes a report to a CSV file one row at a time.
+    """
+    with open(file_path, 'w', newline='') as csv_file:
+        for line in iter_csv(columns, rows):
+            csv_file.write(line)
+
+
+def historical_report_path(report_name):
+    """
+    Returns the path of a historical report file, or None if it does not exist.
+    """
+    if os.path.basename(report_name) != report_name:
+        return None
+    file_path = os.path.join(HISTORICAL_REPORTS_DIR, report_name)
+    return file_path if os.path.isfile(file_path) else None
+
+
+def parse_range(range_header, file_size):
+    """
+    Parses a single byte range of a Range header.
+
+    Returns:
+        tuple: (start, end) inclusive, None if there is no usable range header, or
+        False if the range cannot be satisfied.
+    """
+    match = RANGE_HEADER_PATTERN.match(range_header.strip()) if range_header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if start == '':
+        start, end = max(file_size - int(end), 0), file_size - 1
+    else:
+        start = int(start)
+        end = min(int(end), file_size - 1) if end else file_size - 1
+    if start > end or start >= file_size:
+        return False
+    return start, end
+
+
+def iter_file_range(file_path, start, end):
+    with open(file_path, 'rb') as report_file:
+        report_file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = report_file.read(min(FILE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def file_response(request, file_path, content_type='text/csv'):
+    """
+    Serves a file as an attachment in chunks, honouring a single HTTP byte range.
+
+    Returns:
+        FileResponse for the whole file, StreamingHttpResponse 206 for a range, or
+        HttpResponse 416 if the range cannot be satisfied.
+    """
+    file_size = os.path.getsize(file_path)
+    filename = os.path.basename(file_path)
+    byte_range = parse_range(request.META.get('HTTP_RANGE'), file_size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{file_size}'
+        return response
+
+    if byte_range is None:
+        response = FileResponse(open(file_path, 'rb'), as_attachment=True, filename=filename,
+                                content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(iter_file_range(file_path, start, end),
+                                         status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{file_size}'
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,203 @@
+"""
+This module contains the gateway index used by the VM self-service APIs to find the vApp
+and VM of a caller from its IP address.
+
+The callers of these APIs are the gateways of the vApps, so a caller is identified by its
+IP address, or failing that by its hostname, and then by the VM name it asks for. The index
+is kept in Redis hashes, updated by the Vapps and Vms signals whenever an import or a job
+saves a vApp's ip_address or vts_name or a VM, and rebuilt from the database when it is
+older than GATEWAY_INDEX_MAX_AGE:
+
+    gateway_index:ip      gateway IP -> vApp pk
+    gateway_index:host    gateway short hostname -> vApp pk
+    gateway_index:vapps   vApp pk -> {"vcd_id", "name", "ip", "host"} (JSON)
+    gateway_index:vms     "<vApp pk>|<VM name>" -> VM vcd_id
+
+Reverse DNS is only used when the caller's IP is not indexed, and its answers are cached
+for DNS_CACHE_TTL (DNS_NEGATIVE_TTL when the lookup fails).
+"""
+import json
+import logging
+import socket
+from redis.exceptions import RedisError
+from pyvcloud_project.models import Vapps, Vms
+from pyvcloud_project.utils import pyvcloud_utils as utils
+
+logger = logging.getLogger(__name__)
+
+GATEWAY_IP_KEY = 'gateway_index:ip'
+GATEWAY_HOST_KEY = 'gateway_index:host'
+GATEWAY_VAPPS_KEY = 'gateway_index:vapps'
+GATEWAY_VMS_KEY = 'gateway_index:vms'
+GATEWAY_INDEX_BUILT_KEY = 'gateway_index_built'
+
+# The index is rebuilt from the database at least this often
+GATEWAY_INDEX_MAX_AGE = 24 * 3600
+
+CALLER_DNS_KEY = 'caller_dns:{}'
+DNS_CACHE_TTL = 3600
+DNS_NEGATIVE_TTL = 300
+
+
+def _short_hostname(hostname):
+    return (hostname or '').split('.')[0].lower()
+
+
+def _vm_key(vapp_pk, vm_name):
+    return f'{vapp_pk}|{vm_name}'
+
+
+def _vapp_entry(vcd_id, name, ip_address, vts_name):
+    return {'vcd_id': vcd_id, 'name': name, 'ip': ip_address or '',
+            'host': _short_hostname(vts_name)}
+
+
+def _swap_hash(pipeline, key, mapping):
+    """
+    Replaces a hash atomically through a temporary key.
+    """
+    pipeline.delete(f'{key}:tmp')
+    if mapping:
+        pipeline.hset(f'{key}:tmp', mapping=mapping)
+        pipeline.rename(f'{key}:tmp', key)
+    else:
+        pipeline.delete(key)
+
+
+def rebuild_index():
+    """
+    Rebuilds the gateway index from the Vapps and Vms tables.
+
+    Returns:
+        str: A message with the number of vApps and VMs indexed.
+    """
+    vapps, ips, hosts = {}, {}, {}
+    for vapp in Vapps.objects.values('pk', 'vcd_id', 'name', 'ip_address', 'vts_name'):
+        entry = _vapp_entry(vapp['vcd_id'], vapp['name'], vapp['ip_address'], vapp['vts_name'])
+        vapps[vapp['pk']] = json.dumps(entry)
+        if entry['ip']:
+            ips[entry['ip']] = vapp['pk']
+        if entry['host']:
+            hosts[entry['host']] = vapp['pk']
+    vms = {_vm_key(vm['vapp_obj'], vm['name']): vm['vcd_id']
+           for vm in Vms.objects.filter(vapp_obj__isnull=False).values('vapp_obj', 'name', 'vcd_id')}
+
+    pipeline = utils.get_redis().pipeline()
+    _swap_hash(pipeline, GATEWAY_VAPPS_KEY, vapps)
+    _swap_hash(pipeline, GATEWAY_IP_KEY, ips)
+    _swap_hash(pipeline, GATEWAY_HOST_KEY, hosts)
+    _swap_hash(pipeline, GATEWAY_VMS_KEY, vms)
+    pipeline.set(GATEWAY_INDEX_BUILT_KEY, 1, ex=GATEWAY_INDEX_MAX_AGE)
+    pipeline.execute()
+    return f'{len(vapps)} vApps and {len(vms)} VMs indexed'
+
+
+def ensure_index():
+    """
+    Rebuilds the gateway index if it is missing or older than GATEWAY_INDEX_MAX_AGE.
+    """
+    if not utils.get_redis().exists(GATEWAY_INDEX_BUILT_KEY):
+        rebuild_index()
+
+
+def index_vapp(vapp):
+    """
+    Updates the index entries of a saved vApp, dropping the entries of its old gateway.
+    """
+    redis_instance = utils.get_redis()
+    entry = _vapp_entry(vapp.vcd_id, vapp.name, vapp.ip_address, vapp.vts_name)
+    old = json.loads(redis_instance.hget(GATEWAY_VAPPS_KEY, vapp.pk) or '{}')
+    pipeline = redis_instance.pipeline()
+    if old.get('ip') and old['ip'] != entry['ip']:
+        pipeline.hdel(GATEWAY_IP_KEY, old['ip'])
+    if old.get('host') and old['host'] != entry['host']:
+        pipeline.hdel(GATEWAY_HOST_KEY, old['host'])
+    pipeline.hset(GATEWAY_VAPPS_KEY, vapp.pk, json.dumps(entry))
+    if entry['ip']:
+        pipeline.hset(GATEWAY_IP_KEY, entry['ip'], vapp.pk)
+    if entry['host']:
+        pipeline.hset(GATEWAY_HOST_KEY, entry['host'], vapp.pk)
+    pipeline.execute()
+
+
+def unindex_vapp(vapp):
+    """
+    Removes the index entries of a deleted vApp.
+    """
+    redis_instance = utils.get_redis()
+    old = json.loads(redis_instance.hget(GATEWAY_VAPPS_KEY, vapp.pk) or '{}')
+    pipeline = redis_instance.pipeline()
+    if old.get('ip'):
+        pipeline.hdel(GATEWAY_IP_KEY, old['ip'])
+    if old.get('host'):
+        pipeline.hdel(GATEWAY_HOST_KEY, old['host'])
+    pipeline.hdel(GATEWAY_VAPPS_KEY, vapp.pk)
+    pipeline.execute()
+
+
+def index_vm(vm):
+    if vm.vapp_obj_id and vm.name:
+        utils.get_redis().hset(GATEWAY_VMS_KEY, _vm_key(vm.vapp_obj_id, vm.name), vm.vcd_id)
+
+
+def unindex_vm(vm):
+    if vm.vapp_obj_id and vm.name:
+        utils.get_redis().hdel(GATEWAY_VMS_KEY, _vm_key(vm.vapp_obj_id, vm.name))
+
+
+def reverse_dns(ip_address):
+    """
+    Returns the hostname of an IP address, caching the answer of the DNS lookup.
+
+    Returns:
+        str: The hostname, or '' if the lookup fails.
+    """
+    redis_instance = utils.get_redis()
+    cached = redis_instance.get(CALLER_DNS_KEY.format(ip_address))
+    if cached is not None:
+        return cached
+    try:
+        hostname = socket.gethostbyaddr(ip_address)[0]
+    except (socket.herror, socket.gaierror) as error:
+        logger.warning(f'Unable to resolve hostname for IP {ip_address}: {error}')
+        hostname = ''
+    redis_instance.set(CALLER_DNS_KEY.format(ip_address), hostname,
+                       ex=DNS_CACHE_TTL if hostname else DNS_NEGATIVE_TTL)
+    return hostname
+
+
+def resolve_caller(ip_address, vm_name):
+    """
+    Finds the vApp whose gateway has the caller's IP address, and its VM called vm_name.
+
+    The vApp is looked up by IP address, then by the hostname of the IP address.
+
+    Returns:
+        tuple: (vapp, vm_vcd_id) where vapp is a dict with vcd_id and name, or None if no
+        vApp was found, and vm_vcd_id is None if the vApp has no such VM.
+    """
+    redis_instance = utils.get_redis()
+    try:
+        ensure_index()
+        vapp_pk = redis_instance.hget(GATEWAY_IP_KEY, ip_address)
+        if not vapp_pk:
+            hostname = _short_hostname(reverse_dns(ip_address))
+            vapp_pk = redis_instance.hget(GATEWAY_HOST_KEY, hostname) if hostname else None
+        if not vapp_pk:
+            return None, None
+        pipeline = redis_instance.pipeline()
+        pipeline.hget(GATEWAY_VAPPS_KEY, vapp_pk)
+        pipeline.hget(GATEWAY_VMS_KEY, _vm_key(vapp_pk, vm_name))
+        vapp, vm_vcd_id = pipeline.execute()
+        return (json.loads(vapp) if vapp else None), vm_vcd_id
+    except RedisError as error:
+        logger.warning(f'Gateway index unavailable, looking up {ip_address} in the database: {error}')
+
+    vapp = Vapps.objects.filter(ip_address=ip_address).values('pk', 'vcd_id', 'name').first()
+    if vapp is None:
+        hostname = _short_hostname(socket.getfqdn(ip_address))
+        vapp = Vapps.objects.filter(vts_name__iexact=hostname).values('pk', 'vcd_id', 'name').first()
+    if vapp is None:
+        return None, None
+    vm_vcd_id = Vms.objects.filter(vapp_obj=vapp['pk'], name=vm_name).values_list('vcd_id', flat=True).first()
+    return vapp, vm_vcd_id
@@ -3,6 +3,7 @@ This module contains functions related to group management.
 """
 from django.db.models.functions import Lower
 from pyvcloud_project.models import Groups, OrgVdcs, Orgs, Catalogs
+from pyvcloud_project.utils import permission_utils
 
 
 def add_group(params):
@@ -66,6 +67,8 @@ def update_group(params):
         unrestricted=','.join(catalogs),
         restrict_catalogs=bool(params['cat_restricted'] and catalogs)
     )
+    # QuerySet.update() does not send post_save
+    permission_utils.invalidate_all()
 
     return 25, f"Group for {params.get('orgvdc_name')} and {params.get('org_name')} is updated successfully!"
 
@@ -0,0 +1,299 @@
+"""
+This module runs the job groups started by the bulk vApp operations API.
+
+A job group holds one worker job per vApp. The items are validated, locked in the busy
+cache and given their Start events in bulk by the caller, then handed to create_group.
+At most the group's parallel limit of jobs are enqueued at once; the rest wait in the
+Redis list job_group:<id>:pending, and each job that ends enqueues the next one from the
+job callbacks (see record_outcome). A job whose callbacks never ran, e.g. because its
+work horse was killed, is found by sweep_groups, which runs every minute from cron. The
+group record and the per-item results are kept in Redis for JOB_GROUP_TTL:
+
+    job_group:<id>           the group: action, user, counts and parallel limit
+    job_group:<id>:items     vApp vcd_id -> item result (JSON)
+    job_group:<id>:pending   the event parameters of the items not enqueued yet (JSON)
+    job_group:<id>:ended     the vApp vcd_ids whose outcome has been counted
+    job_groups:active        the ids of the groups that have not ended
+"""
+import json
+import logging
+import uuid
+from datetime import datetime
+import django_rq
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from rq.exceptions import NoSuchJobError
+from rq.job import Job
+from redis.exceptions import RedisError
+from pyvcloud_project.utils import progress_utils, pyvcloud_utils as utils
+from pyvcloud_project.worker_queue_settings import REGISTERED_JOBS, job_path
+
+logger = logging.getLogger(__name__)
+
+JOB_GROUP_KEY = 'job_group:{}'
+JOB_GROUP_ITEMS_KEY = 'job_group:{}:items'
+JOB_GROUP_PENDING_KEY = 'job_group:{}:pending'
+JOB_GROUP_ENDED_KEY = 'job_group:{}:ended'
+ACTIVE_GROUPS_KEY = 'job_groups:active'
+JOB_GROUP_TTL = 24 * 3600
+
+DEFAULT_PARALLEL = 5
+MAX_PARALLEL = 20
+
+# The most vApps one group may hold
+MAX_GROUP_SIZE = 500
+
+REJECTED = 'rejected'
+PENDING = 'pending'
+QUEUED = 'queued'
+STARTED = 'started'
+FINISHED = 'finished'
+FAILED = 'failed'
+
+
+def parse_parallel(value):
+    """
+    Parses the parallel= parameter into a limit between 1 and MAX_PARALLEL.
+    """
+    try:
+        parallel = int(value) if value not in (None, '') else DEFAULT_PARALLEL
+    except (TypeError, ValueError):
+        parallel = DEFAULT_PARALLEL
+    return min(max(parallel, 1), MAX_PARALLEL)
+
+
+def _keys(group_id):
+    return (JOB_GROUP_KEY.format(group_id), JOB_GROUP_ITEMS_KEY.format(group_id),
+            JOB_GROUP_PENDING_KEY.format(group_id), JOB_GROUP_ENDED_KEY.format(group_id))
+
+
+def _encode_params(params, job):
+    """
+    Encodes the event parameters of a pending item, leaving out the user.
+    """
+    encoded = {key: value for key, value in params.items() if key != 'user'}
+    encoded['created'] = params['created'].isoformat()
+    encoded['job'] = job_path(job)
+    return json.dumps(encoded)
+
+
+def _decode_params(value, user):
+    params = json.loads(value)
+    job = REGISTERED_JOBS[params.pop('job')]
+    params['created'] = datetime.fromisoformat(params['created'])
+    params['user'] = user
+    return params, job
+
+
+def create_group(action, user, items, rejected, parallel=DEFAULT_PARALLEL):
+    """
+    Records a job group and enqueues its first jobs.
+
+    Args:
+        action: str: The bulk action, e.g. stop.
+        user: User: The user who started the group.
+        items: list: (event params, job) of every accepted vApp, already locked in the
+            busy cache. The params get the group_id.
+        rejected: dict: vApp vcd_id -> (vApp name, reason) of the vApps that were refused.
+        parallel: int: The most jobs of the group that run at once.
+
+    Returns:
+        dict: The group record, see get_group.
+    """
+    group_id = uuid.uuid4().hex
+    group_key, items_key, pending_key, _ = _keys(group_id)
+    record = {'group_id': group_id, 'action': action, 'user_id': user.pk, 'total': len(items),
+              'rejected': len(rejected), 'finished': 0, 'failed': 0, 'parallel': parallel,
+              'created': timezone.now().isoformat()}
+
+    results = {vapp_vcd_id: json.dumps({'vapp_name': vapp_name, 'status': REJECTED, 'job_id': '',
+                                        'error': reason})
+               for vapp_vcd_id, (vapp_name, reason) in rejected.items()}
+    for params, job in items:
+        params['group_id'] = group_id
+        results[params['resource_id']] = json.dumps({'vapp_name': params.get('vapp_name', ''),
+                                                     'status': PENDING, 'job_id': '', 'error': ''})
+
+    pipeline = utils.get_redis().pipeline()
+    pipeline.hset(group_key, mapping=record)
+    if results:
+        pipeline.hset(items_key, mapping=results)
+    if items:
+        pipeline.rpush(pending_key, *[_encode_params(params, job) for params, job in items])
+    for key in (group_key, items_key, pending_key):
+        pipeline.expire(key, JOB_GROUP_TTL)
+    if items:
+        pipeline.sadd(ACTIVE_GROUPS_KEY, group_id)
+    pipeline.execute()
+
+    dispatch(group_id, parallel, user)
+    return get_group(group_id)
+
+
+def _set_item(group_id, resource_id, **fields):
+    redis_instance = utils.get_redis()
+    items_key = JOB_GROUP_ITEMS_KEY.format(group_id)
+    item = json.loads(redis_instance.hget(items_key, resource_id) or '{}')
+    item.update(fields)
+    redis_instance.hset(items_key, resource_id, json.dumps(item))
+
+
+def dispatch(group_id, count, user):
+    """
+    Enqueues up to count pending jobs of a group.
+
+    Returns:
+        int: The number of jobs enqueued.
+    """
+    redis_instance = utils.get_redis()
+    enqueued = 0
+    while enqueued < count:
+        value = redis_instance.lpop(JOB_GROUP_PENDING_KEY.format(group_id))
+        if value is None:
+            break
+        params, job = _decode_params(value, user)
+        try:
+            worker_job = job.delay(params)
+        except RedisError as error:
+            logger.warning(f'Could not enqueue {params["resource_id"]} of job group {group_id}: {error}')
+            utils.remove_vapp_or_vm_from_busy_cache(params['resource_id'])
+            record_outcome(params, succeeded=False, error=f'Could not be queued: {error}')
+            continue
+        _set_item(group_id, params['resource_id'], status=QUEUED, job_id=worker_job.id)
+        enqueued += 1
+    return enqueued
+
+
+def record_outcome(params, succeeded, error=''):
+    """
+    Records the outcome of a job that belongs to a group and enqueues the group's next job.
+    Called from the job callbacks and sweep_groups, it does nothing for jobs outside of a
+    group or whose outcome has already been recorded.
+    """
+    group_id = params.get('group_id') if isinstance(params, dict) else None
+    if not group_id:
+        return
+    try:
+        redis_instance = utils.get_redis()
+        ended_key = JOB_GROUP_ENDED_KEY.format(group_id)
+        if not redis_instance.sadd(ended_key, params['resource_id']):
+            return
+        redis_instance.expire(ended_key, JOB_GROUP_TTL)
+        _set_item(group_id, params['resource_id'], status=FINISHED if succeeded else FAILED,
+                  error=error, ended=timezone.now().isoformat())
+        redis_instance.hincrby(JOB_GROUP_KEY.format(group_id), FINISHED if succeeded else FAILED)
+        dispatch(group_id, 1, params.get('user'))
+    except RedisError as redis_error:
+        logger.warning(f'Could not record the outcome of {params.get("resource_id")} in job group {group_id}: {redis_error}')
+
+
+def get_group(group_id):
+    """
+    Returns a job group with the result of each vApp and the progress of the group.
+
+    The progress is the share of the group's jobs that have ended, with running jobs
+    counted by the percent of their current vCD task.
+
+    Returns:
+        dict: The group record with status, progress and items, or None if the group is
+        not known.
+    """
+    group_key, items_key, _, _ = _keys(group_id)
+    redis_instance = utils.get_redis()
+    record = redis_instance.hgetall(group_key)
+    if not record:
+        return None
+    items = {vapp_vcd_id: json.loads(value)
+             for vapp_vcd_id, value in redis_instance.hgetall(items_key).items()}
+
+    running = [vapp_vcd_id for vapp_vcd_id, item in items.items() if item['status'] == QUEUED]
+    events = progress_utils.latest_events(running) if running else {}
+    progress = 0
+    for vapp_vcd_id, item in items.items():
+        event = events.get(vapp_vcd_id)
+        if item['status'] == QUEUED and progress_utils.is_running(event) \
+                and event['stage'] != progress_utils.QUEUED:
+            item['status'] = STARTED
+            item['task'] = progress_utils.status_text(event)
+            progress += int(event.get('percent') or 0)
+        elif item['status'] in (FINISHED, FAILED):
+            progress += 100
+
+    for field in ('total', 'rejected', 'finished', 'failed', 'parallel', 'user_id'):
+        record[field] = int(record[field])
+    ended = record['finished'] + record['failed']
+    if ended == record['total']:
+        record['status'] = FINISHED
+    elif any(item['status'] == STARTED for item in items.values()) or ended:
+        record['status'] = STARTED
+    else:
+        record['status'] = QUEUED
+    record['progress'] = round(progress / record['total']) if record['total'] else 100
+    record['items'] = [dict(item, vapp_vcd_id=vapp_vcd_id) for vapp_vcd_id, item in items.items()]
+    return record
+
+
+def _lost_job_outcome(job_id, connection):
+    """
+    Returns (succeeded, error) for the rq job of a queued item whose callbacks did not
+    record an outcome, or None while the job may still record one itself.
+
+    The callbacks run before rq sets a job's status to finished or failed, so a job in one
+    of those statuses whose item is still queued will not record its outcome.
+    """
+    try:
+        status = Job.fetch(job_id, connection=connection).get_status()
+    except NoSuchJobError:
+        return False, 'The worker job was lost before it ended'
+    if status == 'finished':
+        return True, ''
+    if status in ('failed', 'stopped', 'canceled'):
+        return False, f'The worker job {status} without recording its outcome'
+    return None
+
+
+def sweep_groups():
+    """
+    Ends the items of the active job groups whose rq job is gone or ended without its
+    callbacks recording the outcome, releasing their vApps from the busy cache, and
+    enqueues pending items when a group has fewer than its parallel limit of jobs queued.
+
+    Returns:
+        str: A summary of the sweep.
+    """
+    redis_instance = utils.get_redis()
+    connection = django_rq.get_connection()
+    swept = dispatched = 0
+    for group_id in redis_instance.smembers(ACTIVE_GROUPS_KEY):
+        group_key, items_key, pending_key, _ = _keys(group_id)
+        record = redis_instance.hgetall(group_key)
+        if not record:
+            redis_instance.srem(ACTIVE_GROUPS_KEY, group_id)
+            continue
+        user = get_user_model().objects.filter(pk=record['user_id']).first()
+
+        queued = 0
+        for resource_id, value in redis_instance.hgetall(items_key).items():
+            item = json.loads(value)
+            if item['status'] != QUEUED:
+                continue
+            outcome = _lost_job_outcome(item['job_id'], connection) if item['job_id'] else None
+            if outcome is None:
+                queued += 1
+                continue
+            logger.warning(f'Ending {resource_id} of job group {group_id}, its job {item["job_id"]} '
+                           f'did not record an outcome')
+            utils.remove_vapp_or_vm_from_busy_cache(resource_id)
+            succeeded, error = outcome
+            record_outcome({'group_id': group_id, 'resource_id': resource_id, 'user': user},
+                           succeeded=succeeded, error=error)
+            swept += 1
+
+        free = int(record['parallel']) - queued
+        if free > 0 and redis_instance.llen(pending_key):
+            dispatched += dispatch(group_id, free, user)
+
+        record = redis_instance.hgetall(group_key)
+        if record and int(record['finished']) + int(record['failed']) >= int(record['total']):
+            redis_instance.srem(ACTIVE_GROUPS_KEY, group_id)
+    return f'ended {swept} lost jobs and enqueued {dispatched} pending jobs'
@@ -8,7 +8,7 @@ import math
 from django.db.models import Sum
 from pyvcloud.vcd.client import ResourceType
 from pyvcloud_project.vmware_client import VMWareClientSingleton
-from pyvcloud_project.utils import pvdc_utils, pyvcloud_utils as utils
+from pyvcloud_project.utils import power_state_utils, pvdc_utils, pyvcloud_utils as utils
 from pyvcloud_project.models import OrgVdcs, ProviderVdcs, Vapps
 from pyvcloud_project import forms
 from pyvcloud_project.utils.pyvcloud_utils import PowerState
@@ -237,67 +237,51 @@ def get_org_vdc_db_values(orgvdc_id) -> dict:
     return db_values
 
 
-def count_vapps(client, orgvdc_id):
+def aggregate_vapp_resources(vm_records):
     """
-    Counts the number of running and not running vApps in an organization VDC.
+    Groups VM typed-query records by vApp in a single pass.
+
+    Records without numberOfCpus, memoryMB or status (e.g. a query for the
+    container field only) count as zero CPU and memory.
 
     Returns:
-        list: A list containing the count of running and not running vApps.
+        dict: vApp vcd_id -> {'cpu_on_count', 'cpu_total', 'memory_on_count',
+        'memory_total', 'number_of_vms'}.
     """
-    resource_type = ResourceType.ADMIN_VAPP.value
-    fields = "name,status"
-    qfilter = f"isExpired==false;vdc=={orgvdc_id}"
-
-    vapps = utils.send_typed_query(client, resource_type, fields, qfilter)
-    running = 0
-    not_running = 0
-    for vapp in vapps:
-        status = vapp.get("status")
-        if status == PowerState.POWER_ON.value:
-            running += 1
-        else:
-            not_running += 1
-    return [running, not_running]
-
-
-def get_vapp_resources(client, org_vdc_id):
+    vapp_resources = {}
+    for vm_result in vm_records:
+        vapp_vcd_id = utils.href_to_id(vm_result.get('container'))
+        resources = vapp_resources.get(vapp_vcd_id)
+        if resources is None:
+            resources = vapp_resources[vapp_vcd_id] = {
+                'cpu_on_count': 0, 'cpu_total': 0, 'memory_on_count': 0,
+                'memory_total': 0, 'number_of_vms': 0}
+        cpus = int(vm_result.get('numberOfCpus') or 0)
+        memory = math.ceil(int(vm_result.get('memoryMB') or 0) / 1024)
+        resources['number_of_vms'] += 1
+        resources['cpu_total'] += cpus
+        resources['memory_total'] += memory
+        if vm_result.get('status') == PowerState.POWER_ON.value:
+            resources['cpu_on_count'] += cpus
+            resources['memory_on_count'] += memory
+    return vapp_resources
+
+
+def get_vapp_resources(client, org_vdc_id=None):
     """
-    Retrieves resource information for vApps in an organization VDC.
+    Retrieves resource information for vApps in an organization VDC, or for
+    every vApp in the system if no org_vdc_id is given.
 
     Returns:
         dict: A dictionary containing the resource information for vApps.
     """
     resource_type = ResourceType.ADMIN_VM.value
     fields = "status,numberOfCpus,memoryMB,container"
-    qfilter = f"isVAppTemplate==false;vdc=={org_vdc_id}"
-    query_results = utils.send_typed_query(
-        client, resource_type, fields, qfilter)
-
-    vapp_hrefs = [vm_result.get('container') for vm_result in query_results]
-
-    vapp_resources = {}
-    for vapp_href in vapp_hrefs:
-        number_of_vms = 0
-        cpu_on_count = 0
-        cpu_total = 0
-        memory_on_count = 0
-        memory_total = 0
-        for vm_result in query_results:
-            if vm_result.get('container') == vapp_href:
-                number_of_vms = number_of_vms + 1
-                if vm_result.get('status') == 'POWERED_ON':
-                    cpu_on_count = cpu_on_count + \
-                        int(vm_result.get('numberOfCpus'))
-                    memory_on_count = memory_on_count + \
-                        math.ceil(int(vm_result.get('memoryMB')) / 1024)
-                cpu_total = cpu_total + int(vm_result.get('numberOfCpus'))
-                memory_total = memory_total + \
-                    math.ceil(int(vm_result.get('memoryMB')) / 1024)
-        vapp_vcd_id = utils.href_to_id(vapp_href)
-        vapp_resources[vapp_vcd_id] = {'cpu_on_count': cpu_on_count, 'cpu_total': cpu_total,
-                                       'memory_on_count': memory_on_count, 'memory_total': memory_total, 'number_of_vms': number_of_vms}
-
-    return vapp_resources
+    qfilter = "isVAppTemplate==false"
+    if org_vdc_id:
+        qfilter += f";vdc=={org_vdc_id}"
+    return aggregate_vapp_resources(
+        utils.stream_typed_query(client, resource_type, fields, qfilter))
 
 
 def get_vapp_vms(client, org_vdc_id):
@@ -310,40 +294,40 @@ def get_vapp_vms(client, org_vdc_id):
     resource_type = ResourceType.ADMIN_VM.value
     fields = "container"
     qfilter = f"isVAppTemplate==false;vdc=={org_vdc_id}"
-    query_results = utils.send_typed_query(
-        client, resource_type, fields, qfilter)
+    vapp_resources = aggregate_vapp_resources(
+        utils.stream_typed_query(client, resource_type, fields, qfilter))
+    return {vapp_vcd_id: {'number_of_vms': resources['number_of_vms']}
+            for vapp_vcd_id, resources in vapp_resources.items()}
 
-    vapp_hrefs = [vm_result.get('container') for vm_result in query_results]
 
-    vapp_resources = {}
-    for vapp_href in vapp_hrefs:
-        number_of_vms = sum(vm_result.get('container') ==
-                            vapp_href for vm_result in query_results)
-        vapp_vcd_id = utils.href_to_id(vapp_href)
-        vapp_resources[vapp_vcd_id] = {'number_of_vms': number_of_vms}
-
-    return vapp_resources
-
-
-def get_power_state_of_vapps(client, org_vdc_id):
+def get_power_state_of_vapps(client, org_vdc_id=None, fresh=False):
     """
-    Retrieves the power state of vApps in an organization VDC.
+    Retrieves the power state of vApps in an organization VDC, or of every
+    vApp in the system if no org_vdc_id is given.
+
+    The states are read from the power state cache unless fresh is True or
+    the cache is not active, in which case vCD is queried.
 
     Returns:
         dict: A dictionary containing the power state of vApps.
     """
+    cached_states = None if fresh else power_state_utils.get_org_vdc_vapp_states(org_vdc_id)
+    if cached_states is not None:
+        return {vapp_urn: {'power_state': create_vapp_status_string(status, isdeployed),
+                           'deployed': isdeployed == 'true'}
+                for vapp_urn, (status, isdeployed) in cached_states.items()}
+
     resource_type = ResourceType.ADMIN_VAPP.value
     fields = "status,isDeployed"
-    qfilter = f"vdc=={org_vdc_id}"
-    query_results = utils.send_typed_query(
-        client, resource_type, fields, qfilter)
+    qfilter = f"vdc=={org_vdc_id}" if org_vdc_id else None
     vapp_power_states = {}
-    for query_result in query_results:
+    for query_result in utils.stream_typed_query(client, resource_type, fields, qfilter):
         vapp_urn = utils.href_to_id(query_result.get('href'))
         status = query_result.get('status')
         isdeployed = query_result.get('isDeployed')
         vapp_power_state = create_vapp_status_string(status, isdeployed)
-        vapp_power_states[vapp_urn] = {'power_state': vapp_power_state}
+        vapp_power_states[vapp_urn] = {'power_state': vapp_power_state,
+                                       'deployed': isdeployed == 'true'}
 
     return vapp_power_states
 
@@ -0,0 +1,160 @@
+"""
+This module contains the permission resolver used by the org VDC, catalog and vApp views.
+
+A user's LDAP groups are parsed into a set of group CNs once, matched against the Groups
+table, and the resulting ACL (readable, writable and admin org VDCs and allowed catalogs)
+is cached per user in Redis. The cached ACL is rebuilt when the user's SppUser or User row
+changes, and for every user when Groups or Catalogs change (see signals.py).
+"""
+import json
+from pyvcloud_project.models import Catalogs, Groups, SppUser
+from pyvcloud_project.utils import pyvcloud_utils as utils
+
+ACL_KEY = 'user_acl:{}'
+ACL_VERSION_KEY = 'user_acl_version'
+ACL_TTL = 3600
+
+
+def parse_ldap_groups(ldap_groups):
+    """
+    Parses the comma-joined LDAP group DNs of a user into a set of lower-cased group CNs.
+
+    Returns:
+        set: e.g. {'cn=team_a', 'cn=team_b'}
+    """
+    if not ldap_groups:
+        return set()
+    return {rdn.strip().lower() for rdn in ldap_groups.split(',')
+            if rdn.strip().lower().startswith('cn=')}
+
+
+def group_cn(group_dn):
+    """
+    Returns the lower-cased CN of a group DN.
+    """
+    return group_dn.split(',', 1)[0].strip().lower()
+
+
+class UserAcl:
+    """
+    The resolved permissions of a user.
+
+    The org VDC sets hold OrgVdcs primary keys and the catalog set holds Catalogs vcd_ids.
+    A value of None means the user is not restricted.
+    """
+
+    def __init__(self, readable, writable, admin, catalogs):
+        self.readable = None if readable is None else set(readable)
+        self.writable = None if writable is None else set(writable)
+        self.admin = None if admin is None else set(admin)
+        self.catalogs = None if catalogs is None else set(catalogs)
+
+    def can_read(self, org_vdc_pk):
+        return self.readable is None or org_vdc_pk in self.readable
+
+    def can_write(self, org_vdc_pk):
+        return self.writable is None or org_vdc_pk in self.writable
+
+    def is_admin(self, org_vdc_pk):
+        return self.admin is None or org_vdc_pk in self.admin
+
+    def can_use_catalog(self, catalog_vcd_id):
+        return self.catalogs is None or catalog_vcd_id in self.catalogs
+
+    def filter_catalogs(self, catalogs, key='vcd_id'):
+        """
+        Returns the catalogs (dicts or model instances) the user is allowed to use.
+        """
+        if self.catalogs is None:
+            return list(catalogs)
+        return [catalog for catalog in catalogs
+                if (catalog.get(key) if isinstance(catalog, dict) else getattr(catalog, key)) in self.catalogs]
+
+    def to_json(self, version):
+        def dump(values):
+            return None if values is None else sorted(values)
+        return json.dumps({'version': version, 'readable': dump(self.readable),
+                           'writable': dump(self.writable), 'admin': dump(self.admin),
+                           'catalogs': dump(self.catalogs)})
+
+
+def build_acl(spp_user):
+    """
+    Resolves the permissions of a user from the Groups table.
+
+    Returns:
+        UserAcl: The user's permissions.
+    """
+    user = spp_user.user
+    is_superuser = user.is_superuser
+    is_privileged = user.is_staff or user.is_superuser
+    user_cns = parse_ldap_groups(spp_user.ldap_groups)
+
+    user_groups = [group for group in Groups.objects.all().values(
+        'group_dn', 'org_vdc_obj', 'read_permission', 'write_permission', 'admin_permission',
+        'restrict_catalogs', 'unrestricted', 'org_obj') if group_cn(group['group_dn']) in user_cns]
+
+    if user_cns and not is_superuser:
+        readable = {group['org_vdc_obj'] for group in user_groups if group['read_permission']}
+        writable = {group['org_vdc_obj'] for group in user_groups if group['write_permission']}
+    elif is_privileged:
+        readable = writable = None
+    else:
+        readable = writable = set()
+
+    if is_privileged:
+        admin = catalogs = None
+    else:
+        admin = {group['org_vdc_obj'] for group in user_groups if group['admin_permission']}
+        catalogs = set()
+        unrestricted_orgs = set()
+        for group in user_groups:
+            if group['restrict_catalogs']:
+                catalogs.update((group['unrestricted'] or '').split(','))
+            else:
+                unrestricted_orgs.add(group['org_obj'])
+        if unrestricted_orgs:
+            catalogs.update(Catalogs.objects.filter(
+                org_obj__in=unrestricted_orgs).values_list('vcd_id', flat=True))
+        catalogs.discard('')
+
+    return UserAcl(readable, writable, admin, catalogs)
+
+
+def get_acl(user):
+    """
+    Returns the cached permissions of a user, building them if needed.
+
+    Args:
+        user: User or SppUser.
+
+    Returns:
+        UserAcl: The user's permissions.
+    """
+    user_id = user.user_id if isinstance(user, SppUser) else user.pk
+    redis_instance = utils.get_redis()
+    version = redis_instance.get(ACL_VERSION_KEY) or '0'
+    cached = redis_instance.get(ACL_KEY.format(user_id))
+    if cached:
+        acl = json.loads(cached)
+        if acl['version'] == version:
+            return UserAcl(acl['readable'], acl['writable'], acl['admin'], acl['catalogs'])
+
+    spp_user = user if isinstance(user, SppUser) else SppUser.objects.select_related('user').get(user=user)
+    acl = build_acl(spp_user)
+    redis_instance.set(ACL_KEY.format(user_id), acl.to_json(version), ex=ACL_TTL)
+    return acl
+
+
+def invalidate_user(user_id):
+    """
+    Drops the cached permissions of one user.
+    """
+    utils.get_redis().delete(ACL_KEY.format(user_id))
+
+
+def invalidate_all():
+    """
+    Drops the cached permissions of every user.
+    """
+    utils.get_redis().incr(ACL_VERSION_KEY)
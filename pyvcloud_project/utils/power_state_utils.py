@@ -0,0 +1,179 @@
+"""
+This module contains the system-wide power state cache.
+
+The refresh_power_states command runs one paged ADMIN_VAPP query and one paged ADMIN_VM
+query for the whole system every few seconds and writes the results to Redis hashes:
+
+    vapp_power_states            vApp vcd_id -> "<status>|<isDeployed>"
+    vapp_power_states:<vdc_id>   the same, for the vApps of one org VDC
+    vm_power_states              VM vcd_id -> status
+
+The power state helpers in orgvdc_utils and vapp_utils read these hashes. While the
+power_states_refreshed key is missing (the refresher has not run for POWER_STATES_MAX_AGE
+seconds) they fall back to querying vCD.
+"""
+import logging
+import time
+from pyvcloud.vcd.client import ResourceType
+from pyvcloud_project.vmware_client import VMWareClientSingleton
+from pyvcloud_project.utils import pyvcloud_utils as utils
+
+logger = logging.getLogger(__name__)
+
+VAPP_POWER_STATES_KEY = 'vapp_power_states'
+VDC_VAPP_POWER_STATES_KEY = 'vapp_power_states:{}'
+VDC_VAPP_POWER_STATES_INDEX_KEY = 'vapp_power_states_vdcs'
+VM_POWER_STATES_KEY = 'vm_power_states'
+POWER_STATES_REFRESHED_KEY = 'power_states_refreshed'
+
+# The cache is ignored if the refresher has not completed a run for this long
+POWER_STATES_MAX_AGE = 300
+
+
+def _encode_vapp_state(status, is_deployed):
+    return f'{status}|{is_deployed}'
+
+
+def _decode_vapp_state(value):
+    status, _, is_deployed = value.partition('|')
+    return status, is_deployed
+
+
+def _swap_hash(pipeline, key, mapping):
+    """
+    Replaces a hash atomically through a temporary key.
+    """
+    if not mapping:
+        pipeline.delete(key)
+        return
+    tmp_key = f'{key}:tmp'
+    pipeline.delete(tmp_key)
+    pipeline.hset(tmp_key, mapping=mapping)
+    pipeline.rename(tmp_key, key)
+
+
+def refresh_power_states(client=None):
+    """
+    Reads the power state of every vApp and VM in the system into Redis.
+
+    Returns:
+        str: A message with the number of vApps and VMs refreshed.
+    """
+    client = client or VMWareClientSingleton().client
+    vapp_states = {}
+    vdc_vapp_states = {}
+    for record in utils.stream_typed_query(client, ResourceType.ADMIN_VAPP.value,
+                                           'status,isDeployed,vdc', None):
+        vapp_vcd_id = utils.href_to_id(record.get('href'))
+        state = _encode_vapp_state(record.get('status'), record.get('isDeployed'))
+        vapp_states[vapp_vcd_id] = state
+        vdc_vapp_states.setdefault(utils.vdc_href_to_id(record.get('vdc')), {})[vapp_vcd_id] = state
+
+    vm_states = {
+        utils.href_to_id(record.get('href')): record.get('status')
+        for record in utils.stream_typed_query(client, ResourceType.ADMIN_VM.value,
+                                               'status', 'isVAppTemplate==false')
+    }
+
+    redis_instance = utils.get_redis()
+    old_vdc_ids = redis_instance.smembers(VDC_VAPP_POWER_STATES_INDEX_KEY)
+    pipeline = redis_instance.pipeline()
+    _swap_hash(pipeline, VAPP_POWER_STATES_KEY, vapp_states)
+    _swap_hash(pipeline, VM_POWER_STATES_KEY, vm_states)
+    for vdc_id, states in vdc_vapp_states.items():
+        _swap_hash(pipeline, VDC_VAPP_POWER_STATES_KEY.format(vdc_id), states)
+    for vdc_id in old_vdc_ids - set(vdc_vapp_states):
+        pipeline.delete(VDC_VAPP_POWER_STATES_KEY.format(vdc_id))
+    pipeline.delete(VDC_VAPP_POWER_STATES_INDEX_KEY)
+    if vdc_vapp_states:
+        pipeline.sadd(VDC_VAPP_POWER_STATES_INDEX_KEY, *vdc_vapp_states)
+    pipeline.set(POWER_STATES_REFRESHED_KEY, time.time(), ex=POWER_STATES_MAX_AGE)
+    pipeline.execute()
+    return f'{len(vapp_states)} vApp and {len(vm_states)} VM power states refreshed'
+
+
+def is_cache_active(redis_instance=None):
+    """
+    Returns True if the refresher has completed a run within POWER_STATES_MAX_AGE.
+    """
+    return bool((redis_instance or utils.get_redis()).exists(POWER_STATES_REFRESHED_KEY))
+
+
+def get_vapp_state(vapp_vcd_id):
+    """
+    Returns the cached (status, isDeployed) of a vApp, or None if it is not cached.
+    """
+    redis_instance = utils.get_redis()
+    if not is_cache_active(redis_instance):
+        return None
+    value = redis_instance.hget(VAPP_POWER_STATES_KEY, vapp_vcd_id)
+    return _decode_vapp_state(value) if value else None
+
+
+def get_org_vdc_vapp_states(org_vdc_id=None):
+    """
+    Returns the cached vApp vcd_id -> (status, isDeployed) of an org VDC, or of the whole
+    system if no org_vdc_id is given. Returns None if the cache is not active.
+    """
+    redis_instance = utils.get_redis()
+    if not is_cache_active(redis_instance):
+        return None
+    key = VDC_VAPP_POWER_STATES_KEY.format(org_vdc_id) if org_vdc_id else VAPP_POWER_STATES_KEY
+    return {vapp_vcd_id: _decode_vapp_state(value)
+            for vapp_vcd_id, value in redis_instance.hgetall(key).items()}
+
+
+def get_vapp_states(vapp_vcd_ids):
+    """
+    Returns the cached vApp vcd_id -> (status, isDeployed) of many vApps with one read.
+    vApps that are not cached are left out, and nothing is returned if the cache is not
+    active.
+    """
+    redis_instance = utils.get_redis()
+    if not vapp_vcd_ids or not is_cache_active(redis_instance):
+        return {}
+    values = redis_instance.hmget(VAPP_POWER_STATES_KEY, list(vapp_vcd_ids))
+    return {vapp_vcd_id: _decode_vapp_state(value)
+            for vapp_vcd_id, value in zip(vapp_vcd_ids, values) if value}
+
+
+def set_vapp_state(vapp_vcd_id, status, is_deployed, org_vdc_id=None):
+    """
+    Writes a vApp power state read from vCD back into the cache.
+    """
+    state = _encode_vapp_state(status, is_deployed)
+    pipeline = utils.get_redis().pipeline()
+    pipeline.hset(VAPP_POWER_STATES_KEY, vapp_vcd_id, state)
+    if org_vdc_id:
+        pipeline.hset(VDC_VAPP_POWER_STATES_KEY.format(org_vdc_id), vapp_vcd_id, state)
+    pipeline.execute()
+
+
+def set_vm_states(vm_states):
+    """
+    Writes VM power states read from vCD back into the cache.
+    """
+    if vm_states:
+        utils.get_redis().hset(VM_POWER_STATES_KEY, mapping=vm_states)
+
+
+def get_vm_state(vm_vcd_id):
+    """
+    Returns the cached status of a VM, or None if it is not cached.
+    """
+    redis_instance = utils.get_redis()
+    if not is_cache_active(redis_instance):
+        return None
+    return redis_instance.hget(VM_POWER_STATES_KEY, vm_vcd_id)
+
+
+def get_vm_states(vm_vcd_ids):
+    """
+    Returns the cached VM vcd_id -> status of many VMs with one read, leaving out the VMs
+    that are not cached.
+    """
+    redis_instance = utils.get_redis()
+    if not vm_vcd_ids or not is_cache_active(redis_instance):
+        return {}
+    values = redis_instance.hmget(VM_POWER_STATES_KEY, list(vm_vcd_ids))
+    return {vm_vcd_id: value for vm_vcd_id, value in zip(vm_vcd_ids, values) if value}
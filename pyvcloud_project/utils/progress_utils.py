@@ -0,0 +1,283 @@
+"""
+This module contains the job progress streams watched by the progress endpoints.
+
+Worker jobs publish structured progress events (stage, percent, vCD task status) into a
+capped Redis stream per resource, progress:<resource id>, and into progress:<job id> so an
+accepted API job can be followed before its vApp exists. Events are published when a job is
+queued, started and ended, and on every poll of the vCD tasks the job waits for.
+
+The progress endpoints are served by the WSGI application. A watcher waits for new events
+with a blocking XREAD on the stream (wait_for_events), bounded so that a watcher only holds a
+web server thread for a short while: the event stream closes after a few seconds and the
+browser reconnects from the last event it received. A watcher costs one Redis read per event
+instead of one vCD task query per poll.
+"""
+import json
+import logging
+import re
+from datetime import timedelta
+import django_rq
+from rq import get_current_job
+from rq.exceptions import NoSuchJobError
+from rq.job import Job
+from redis.exceptions import RedisError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from pyvcloud_project.utils import pyvcloud_utils as utils
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_STREAM_KEY = 'progress:{}'
+PROGRESS_STREAM_MAXLEN = 200
+PROGRESS_STREAM_TTL = 24 * 3600
+
+QUEUED = 'queued'
+STARTED = 'started'
+RETRYING = 'retrying'
+FINISHED = 'finished'
+FAILED = 'failed'
+FINAL_STAGES = (FINISHED, FAILED)
+
+WAIT_READ_COUNT = 100
+
+# vCD task status answers are shared by every poller of a resource for this long
+TASK_STATUS_KEY = 'task_status:{}'
+TASK_STATUS_TTL = 5
+
+# A job whose latest event is older than this is only taken as running if rq says so, as a
+# job that died or a synchronous call leaves no final event behind
+RUNNING_CONFIRM_AGE = timedelta(seconds=60)
+RQ_RUNNING_STATUSES = ('queued', 'started', 'scheduled', 'deferred')
+
+# The number of progress streams open, see open_stream
+OPEN_STREAMS_KEY = 'progress_streams:open'
+
+EVENT_ID_PATTERN = re.compile(r'^\d+-\d+$')
+
+STAGE_TEXT = {
+    QUEUED: 'Queued..',
+    STARTED: 'Starting..',
+    RETRYING: 'Retrying..',
+    'instantiating': 'Instantiating..',
+    'resetting_mac': 'Resetting MAC..',
+    'powering_on': 'Powering On..',
+    'powering_off': 'Powering Off..',
+    'stopping': 'Stopping..',
+    'shutting_down': 'Shutting Down..',
+    'deleting': 'Deleting..',
+    'recomposing': 'Recomposing..',
+    'renaming': 'Renaming..',
+    'capturing': 'Copying..',
+}
+
+
+def _targets(params, job_id=None):
+    targets = [params.get('resource_id')]
+    if job_id is None:
+        job = get_current_job()
+        job_id = job.id if job else None
+    if job_id:
+        targets.append(job_id)
+    return [target for target in targets if target]
+
+
+def publish(params, stage, percent=None, task_status='', message='', job_id=None):
+    """
+    Publishes a progress event for the resource of a job.
+
+    Failures are logged and swallowed so that they never affect the job.
+
+    Args:
+        params: dict: The job parameters.
+        stage: str: The job stage, e.g. queued, started, powering_on, finished.
+        percent: int: The progress of the current vCD task, if known.
+        task_status: str: The status of the current vCD task.
+        message: str: A human readable description of the stage.
+        job_id: str: The rq job id, taken from the current job if not given.
+    """
+    if not isinstance(params, dict):
+        return
+    event = {'stage': stage, 'percent': '' if percent is None else str(percent),
+             'task_status': task_status or '', 'message': message or '',
+             'job_id': job_id or '', 'func_name': params.get('func_name', ''),
+             'time': timezone.now().isoformat()}
+    try:
+        targets = _targets(params, job_id)
+        if not event['job_id'] and len(targets) > 1:
+            event['job_id'] = targets[-1]
+        pipeline = utils.get_redis().pipeline()
+        for target in targets:
+            key = PROGRESS_STREAM_KEY.format(target)
+            pipeline.xadd(key, event, maxlen=PROGRESS_STREAM_MAXLEN, approximate=True)
+            pipeline.expire(key, PROGRESS_STREAM_TTL)
+        pipeline.execute()
+    except RedisError as error:
+        logger.warning(f'Could not publish progress of {params.get("resource_id")}: {error}')
+
+
+def task_callback(params, stage):
+    """
+    Returns a callback for TaskMonitor.wait_for_success that publishes the status and
+    progress of the vCD task whenever they change.
+    """
+    last = {}
+
+    def callback(task):
+        progress = getattr(task, 'Progress', None)
+        percent = int(progress.text) if progress is not None and progress.text else None
+        status = task.get('status', '')
+        if last.get('status') == status and last.get('percent') == percent:
+            return
+        last.update(status=status, percent=percent)
+        publish(params, stage, percent=percent, task_status=status,
+                message=task.get('operation', ''))
+    return callback
+
+
+def _event(entry):
+    event_id, fields = entry
+    return dict(fields, id=event_id)
+
+
+def read_events(resource_id, after=None, until='+', count=PROGRESS_STREAM_MAXLEN):
+    """
+    Returns the events of a resource after the event id after (exclusive) up to until.
+    """
+    entries = utils.get_redis().xrange(PROGRESS_STREAM_KEY.format(resource_id),
+                                       after or '-', until, count=count + 1)
+    return [_event(entry) for entry in entries if entry[0] != after][:count]
+
+
+def latest_event(resource_id):
+    """
+    Returns the latest progress event of a resource, or None.
+    """
+    entries = utils.get_redis().xrevrange(PROGRESS_STREAM_KEY.format(resource_id), count=1)
+    return _event(entries[0]) if entries else None
+
+
+def latest_events(resource_ids):
+    """
+    Returns the latest progress event of many resources with one Redis round trip.
+
+    Returns:
+        dict: resource id -> event, for the resources that have one.
+    """
+    resource_ids = list(resource_ids)
+    pipeline = utils.get_redis().pipeline()
+    for resource_id in resource_ids:
+        pipeline.xrevrange(PROGRESS_STREAM_KEY.format(resource_id), count=1)
+    return {resource_id: _event(entries[0])
+            for resource_id, entries in zip(resource_ids, pipeline.execute()) if entries}
+
+
+def wait_for_events(resource_id, after, timeout):
+    """
+    Returns the events of a resource after the event id after, waiting up to timeout
+    seconds for one to be published if there are none yet.
+
+    Args:
+        resource_id: str: The vApp, VM or job id.
+        after: str: The last event id the caller has, '0-0' for all the events.
+        timeout: float: The most seconds to wait.
+
+    Returns:
+        list: The events, empty if none was published in time.
+    """
+    response = utils.get_redis().xread({PROGRESS_STREAM_KEY.format(resource_id): after},
+                                       count=WAIT_READ_COUNT, block=max(int(timeout * 1000), 1))
+    return [_event(entry) for _, entries in response or [] for entry in entries]
+
+
+def open_stream(max_streams, duration):
+    """
+    Counts a progress stream as open if fewer than max_streams are.
+
+    The count expires a little after duration, so streams that were never closed, e.g.
+    because their process died, stop counting.
+
+    Returns:
+        bool: True if the stream may be opened, in which case close_stream must be called.
+    """
+    try:
+        pipeline = utils.get_redis().pipeline()
+        pipeline.incr(OPEN_STREAMS_KEY)
+        pipeline.expire(OPEN_STREAMS_KEY, duration * 2)
+        count, _ = pipeline.execute()
+        if count <= max_streams:
+            return True
+        close_stream()
+    except RedisError as error:
+        logger.warning(f'Could not count the open progress streams: {error}')
+    return False
+
+
+def close_stream():
+    try:
+        utils.get_redis().decr(OPEN_STREAMS_KEY)
+    except RedisError as error:
+        logger.warning(f'Could not count the open progress streams: {error}')
+
+
+def is_event_id(value):
+    return bool(value) and bool(EVENT_ID_PATTERN.match(value))
+
+
+def _job_is_running(job_id):
+    if not job_id:
+        return False
+    try:
+        job = Job.fetch(job_id, connection=django_rq.get_connection())
+    except NoSuchJobError:
+        return False
+    status = job.get_status()
+    return getattr(status, 'value', status) in RQ_RUNNING_STATUSES
+
+
+def is_running(event):
+    """
+    Returns True if the latest event of a resource belongs to a job that is still running.
+
+    An event older than RUNNING_CONFIRM_AGE is confirmed with the status of its rq job.
+    """
+    if not event or event['stage'] in FINAL_STAGES:
+        return False
+    published = parse_datetime(event.get('time') or '')
+    if published and timezone.now() - published < RUNNING_CONFIRM_AGE:
+        return True
+    try:
+        return _job_is_running(event.get('job_id'))
+    except RedisError as error:
+        logger.warning(f'Could not read the status of job {event.get("job_id")}: {error}')
+        return False
+
+
+def status_text(event):
+    """
+    Returns the short task status shown by the task views for a running job's event.
+    """
+    text = STAGE_TEXT.get(event['stage'], event['stage'].replace('_', ' ').capitalize() + '..')
+    return f"{text} {event['percent']}%" if event.get('percent') else text
+
+
+def task_status(resource_id, load_status):
+    """
+    Returns the task status of a resource for the task views.
+
+    While an SPP job is running on the resource the status comes from its progress stream.
+    Otherwise vCD is asked through load_status(), and the answer is shared by every caller
+    for TASK_STATUS_TTL seconds.
+
+    Returns:
+        dict: {'status': str}
+    """
+    redis_instance = utils.get_redis()
+    event = latest_event(resource_id)
+    if is_running(event):
+        return {'status': status_text(event)}
+    cached = redis_instance.get(TASK_STATUS_KEY.format(resource_id))
+    if cached:
+        return json.loads(cached)
+    status = load_status()
+    redis_instance.set(TASK_STATUS_KEY.format(resource_id), json.dumps(status), ex=TASK_STATUS_TTL)
+    return status
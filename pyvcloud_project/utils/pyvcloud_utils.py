@@ -2,25 +2,48 @@
 This module contains various utility functions related to PyvCloud.
 
 """
+import json
 import logging
+import os
+import socket
+import uuid
+from datetime import datetime
 from enum import Enum
 import time
+from urllib.parse import quote, urlencode
 import urllib3
 import redis
 from lxml import etree
 import django_rq
 from rq.job import Job
-from django.db import IntegrityError, transaction
+from rq.registry import FailedJobRegistry
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, InterfaceError, OperationalError, transaction
 from pyvcloud.vcd.client import Client, TaskStatus, QueryResultFormat
 from pyvcloud.vcd.system import System
 from pyvcloud.vcd.vdc import VDC
 from pyvcloud.vcd.exceptions import InvalidParameterException, OperationNotSupportedException
 from pyvcloud_project.vmware_client import VMWareClientSingleton
-from pyvcloud_project.models import SppUser, Events, RetryInterval
+from pyvcloud_project.utils import event_utils
+from pyvcloud_project.models import SppUser, Events
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 logger = logging.getLogger(__name__)
 
+EVENT_JOURNAL_STREAM = 'spp_event_journal'
+EVENT_JOURNAL_GROUP = 'event_writer'
+# Each flushing process reads as its own consumer; entries a dead consumer left pending
+# are claimed once they have been idle for EVENT_JOURNAL_CLAIM_IDLE_MS
+EVENT_JOURNAL_CONSUMER = f'{socket.gethostname()}:{os.getpid()}'
+EVENT_JOURNAL_CLAIM_IDLE_MS = 60000
+# Only one process flushes the journal at a time
+EVENT_JOURNAL_LOCK_KEY = 'event_journal_flush_lock'
+EVENT_JOURNAL_LOCK_TIMEOUT = 600
+EVENT_JOURNAL_MAXLEN = 100000
+# Journal records that could not be written to the database are moved here
+EVENT_JOURNAL_DEAD_STREAM = 'spp_event_journal:dead'
+FAILED_JOB_CURSOR_KEY = 'failed_job_cursor'
+
 
 class PowerState(Enum):
     # MIXED = vapp stopped but not powered off (undeployed)
@@ -90,6 +113,19 @@ def href_to_id(href):
     return start + vmware_element + ":" + vcd_id
 
 
+def vdc_href_to_id(href):
+    """
+    Convert an org VDC href to its vCD ID.
+
+    VDC hrefs end in the bare uuid (.../api/vdc/<uuid>), unlike vApp and VM
+    hrefs which carry a type prefix, so href_to_id cannot be used for them.
+
+    Returns:
+        str: The vCD ID.
+    """
+    return "urn:vcloud:vdc:" + href.rstrip("/").split("/")[-1]
+
+
 def execute_task(client: Client, task):
     """
     Execute a task and wait for its completion.
@@ -217,6 +253,96 @@ def send_typed_query(client: Client, resource_type, fields, qfilter, query_resul
     return response
 
 
+def stream_typed_query(client: Client, resource_type, fields, qfilter, page_size=128, query_result_format=QueryResultFormat.RECORDS):
+    """
+    Stream the records of a typed query page by page instead of building a list.
+
+    The query is retried with a refreshed client if it fails before the first
+    record is returned, the same way as send_typed_query.
+
+    Args:
+        client: pyvcloud.vcd.client.Client: The client object for making API requests.
+        resource_type: str: The type of resource to query.
+        fields: str: The fields to retrieve.
+        qfilter: str: The query filter.
+        page_size: int: The number of records requested per page.
+        query_result_format: pyvcloud.vcd.client.QueryResultFormat: The format of the query result.
+
+    Yields:
+        The query records.
+
+    """
+    client_to_use = client
+    for attempt in range(4):
+        returned = False
+        try:
+            for record in client_to_use.get_typed_query(resource_type,
+                                                        query_result_format=query_result_format,
+                                                        page_size=page_size,
+                                                        fields=fields,
+                                                        qfilter=qfilter).execute():
+                returned = True
+                yield record
+            return
+        except (AttributeError, TypeError, OperationNotSupportedException):
+            if returned:
+                raise
+            time.sleep(1)
+            client_to_use = VMWareClientSingleton().client
+    logger.info(
+        f'Error with typed Query : params {resource_type}  {fields}   {qfilter}. No Result Returned. ')
+
+
+def count_typed_query(client: Client, resource_type, qfilter):
+    """
+    Count the records matching a typed query without transferring them.
+
+    A single one-record page is requested in the idrecords format and the
+    total attribute of the result is returned. The query is retried with a
+    refreshed client the same way as send_typed_query.
+
+    Args:
+        client: pyvcloud.vcd.client.Client: The client object for making API requests.
+        resource_type: str: The type of resource to query.
+        qfilter: str: The query filter.
+
+    Returns:
+        int: The number of matching records.
+
+    """
+    params = {'type': resource_type, 'format': 'idrecords', 'pageSize': 1, 'page': 1}
+    if qfilter:
+        params['filter'] = qfilter
+    query = urlencode(params, quote_via=quote)
+    client_to_use = client
+    for attempt in range(4):
+        try:
+            result = client_to_use.get_resource(f'{client_to_use.get_api_uri()}/query?{query}')
+            return int(result.get('total', 0))
+        except (AttributeError, TypeError, OperationNotSupportedException):
+            time.sleep(1)
+            client_to_use = VMWareClientSingleton().client
+    logger.info(
+        f'Error with count Query : params {resource_type}  {qfilter}. No Result Returned. ')
+    return 0
+
+
+def typed_query_exists(client: Client, resource_type, qfilter):
+    """
+    Check whether any record matches a typed query.
+
+    Args:
+        client: pyvcloud.vcd.client.Client: The client object for making API requests.
+        resource_type: str: The type of resource to query.
+        qfilter: str: The query filter.
+
+    Returns:
+        bool: True if at least one record matches.
+
+    """
+    return count_typed_query(client, resource_type, qfilter) > 0
+
+
 def get_redis():
     """
     Get the Redis client.
@@ -242,6 +368,29 @@ def add_vapp_or_vm_to_busy_cache(resource_id, event):
     redis_instance.set(resource_id, event, ex=3600)
 
 
+def add_vapps_or_vms_to_busy_cache(resource_events):
+    """
+    Add many vApps or VMs to the busy cache with one Redis round trip.
+
+    Resources that are already in the busy cache are left as they are, so two
+    requests cannot both claim the same resource.
+
+    Args:
+        resource_events: dict: resource ID -> event associated with the resource.
+
+    Returns:
+        list: The IDs of the resources that were added.
+
+    """
+    resource_ids = list(resource_events)
+    pipeline = get_redis().pipeline()
+    for resource_id in resource_ids:
+        pipeline.set(resource_id, resource_events[resource_id], ex=3600, nx=True)
+    added = [resource_id for resource_id, was_set in zip(resource_ids, pipeline.execute()) if was_set]
+    logger.info(f'{len(added)} resources added to busy cache')
+    return added
+
+
 def remove_vapp_or_vm_from_busy_cache(resource_id):
     """
     Remove a vApp or VM from the busy cache.
@@ -278,17 +427,14 @@ def log_worker_completion(job_args, event):
     """
     resource_id = job_args.get('resource_id', "")
     func_name = job_args.get('func_name')
-    retry_settings = RetryInterval.objects.get_retry_obj(func_name)
-    retry_limit = retry_settings[1]['retry'].max
-    retries = retry_limit - job_args.get('retries_left', 0)
+    # The retry limit is resolved once at enqueue time and carried in job.meta
+    retry_limit = job_args.get('retry_max', 0)
+    retries = max(retry_limit - (job_args.get('retries_left') or 0), 0)
     job_args['retries'] = retries
     job_args['event_stage'] = 'End'
-    api_valid = job_args.get('is_api')
     logger.info(f' {event} : {func_name}, resource_id: {resource_id}')
-    Events.objects.filter(function_name=func_name, created=job_args['created']).update(
-        job_id=job_args['job_id'], is_api=api_valid)
     if func_name not in ['vapp_templates_rename']:
-        create_event_in_db(job_args)
+        publish_event(job_args)
 
 
 def on_worker_failure(job, connection, type, value, traceback):
@@ -315,6 +461,7 @@ def on_worker_failure(job, connection, type, value, traceback):
 
     job_args['outcome'] = 'Failed'
     job_args['job_id'] = job_id
+    job_args['retry_max'] = job.meta.get('retry_max', 0)
     log_worker_completion(job_args, 'Failure')
     remove_rq_job_resource_id_from_redis(job_args)
     # TODO: Failure mails
@@ -332,6 +479,7 @@ def on_worker_success(job, connection, result):
     """
     job_args = job.args[0]
     job_args['retries_left'] = job.retries_left
+    job_args['retry_max'] = job.meta.get('retry_max', 0)
     job_args['outcome'] = 'Completed'
     job_args['job_id'] = job.id
     log_worker_completion(job_args, 'Success')
@@ -343,52 +491,316 @@ def update_failed_events_in_db():
     """
     Update failed events in the database.
 
-    This function retrieves unhandled failed events from the database and updates their messages with the corresponding
-    exception information from RQ jobs.
+    This function walks the rq FailedJobRegistry of every queue from the cursor
+    stored by its previous run, and copies the exception information of the newly
+    failed jobs onto their failed events in one bulk_update. Only failures added
+    since the last run are read, so the cost does not grow with history.
+
+    Returns:
+        int: The number of events updated.
 
     """
-    unhandled_failed_events = Events.objects.filter(
-        outcome='Failed', message__exact="")
-    failed_events_to_update = []
-    job_ids = [event.job_id for event in unhandled_failed_events]
+    # Make sure the End events of the failed jobs have reached the database, waiting
+    # for a flush running in another process. The cursors are not moved on until then.
+    if flush_event_journal(blocking_timeout=EVENT_JOURNAL_LOCK_TIMEOUT) is None:
+        logger.warning('Event journal could not be flushed, failed events are left for the next run')
+        return 0
+
     rq_redis_connection = django_rq.get_connection()
-    rq_jobs = Job.fetch_many(job_ids, rq_redis_connection)
-    for event in unhandled_failed_events:
-        for job in rq_jobs:
-            if job and event.job_id == job.id:
-                event.message = job.exc_info
-                failed_events_to_update.append(event)
+    redis_instance = get_redis()
+    new_cursors = {}
+    job_ids = []
+    for queue_name in settings.RQ_QUEUES:
+        registry = FailedJobRegistry(queue=django_rq.get_queue(queue_name))
+        cursor_key = f'{FAILED_JOB_CURSOR_KEY}:{queue_name}'
+        cursor = redis_instance.get(cursor_key) or '-inf'
+        # The registry is a sorted set scored by expiry time, which follows the order
+        # the jobs failed in. Scores are whole seconds, so the cursor score is read
+        # again; already updated events no longer have an empty message.
+        entries = rq_redis_connection.zrangebyscore(registry.key, cursor, '+inf', withscores=True)
+        if not entries:
+            continue
+        job_ids.extend(job_id.decode() if isinstance(job_id, bytes) else job_id
+                       for job_id, _ in entries)
+        new_cursors[cursor_key] = entries[-1][1]
+
+    failed_events_to_update = []
+    if job_ids:
+        rq_jobs = {job.id: job for job in Job.fetch_many(job_ids, rq_redis_connection) if job}
+        for event in Events.objects.filter(job_id__in=rq_jobs.keys(), outcome='Failed', message__exact=""):
+            event.message = rq_jobs[event.job_id].exc_info
+            failed_events_to_update.append(event)
     if failed_events_to_update:
         Events.objects.bulk_update(failed_events_to_update, ['message'])
 
+    for cursor_key, cursor in new_cursors.items():
+        redis_instance.set(cursor_key, repr(cursor))
+    return len(failed_events_to_update)
+
 
 def create_event_in_db(params):
     """
-    This function creates a new event object in the database based on the provided parameters.
+    This function records a new event based on the provided parameters.
+
+    The event is appended to the Redis event journal and written to the database
+    in bulk by flush_event_journal, keeping database writes out of the request
+    path and the rq callbacks.
+
+    A Start event without a job id is given a new one in params, which the job's
+    delay() enqueues it with, so its Start and End events share the job id.
 
     Args:
         params: dict: The parameters for creating the event.
 
     """
-    if not isinstance(params['user'], SppUser):
-        params['user'] = SppUser.objects.get(user=params['user'])
-    event_obj, created = Events.objects.get_or_create(
-        user=params.get('user'),
-        function_name=params.get('func_name'),
-        function_parameters=params,
-        object_type=params.get('resource_type'),
-        resource_id=params.get('resource_id'),
-        event_stage=params.get('event_stage'),
-        retries=params.get('retries', 0),
-        created=params.get('created'),
-        outcome="" if not 'outcome' in params else params['outcome'],
-        message="" if not 'message' in params else params['message'],
-        job_id="" if not 'job_id' in params else params['job_id'],
-        is_api=params['is_api'],
-        request_host=params.get('request_host')
+    assign_job_id(params)
+    publish_event(params)
+
+
+def create_events_in_db(params_list):
+    """
+    Records many new events with one append to the Redis event journal.
+
+    Args:
+        params_list: list: The parameters for creating each event.
+
+    """
+    for params in params_list:
+        assign_job_id(params)
+    records = [_event_record(params) for params in params_list]
+    try:
+        pipeline = get_redis().pipeline()
+        for record in records:
+            pipeline.xadd(EVENT_JOURNAL_STREAM, {'event': json.dumps(record)},
+                          maxlen=EVENT_JOURNAL_MAXLEN, approximate=True)
+        pipeline.execute()
+    except redis.exceptions.RedisError as error:
+        logger.warning(f'Event journal unavailable, writing events directly: {error}')
+        _write_event_records(records)
+
+
+def assign_job_id(params):
+    """
+    Gives the parameters of a Start event the id its job will be enqueued with.
+    """
+    if params.get('event_stage') == 'Start' and not params.get('job_id'):
+        params['job_id'] = str(uuid.uuid4())
+
+
+def _event_user_id(user):
+    """
+    Return the auth User id for a User or SppUser instance.
+    """
+    if isinstance(user, SppUser):
+        return user.user_id
+    return getattr(user, 'pk', None)
+
+
+def _event_record(params):
+    """
+    Build the compact journal record for an event.
+    """
+    created = params.get('created')
+    return {
+        'user_id': _event_user_id(params.get('user')),
+        'function_name': params.get('func_name'),
+        'function_parameters': event_utils.encode_event_parameters(params),
+        'object_type': params.get('resource_type'),
+        'resource_id': params.get('resource_id'),
+        'event_stage': params.get('event_stage'),
+        'retries': params.get('retries', 0),
+        'created': created.isoformat() if created else None,
+        'outcome': params.get('outcome', ""),
+        'message': params.get('message', ""),
+        'job_id': params.get('job_id', ""),
+        'is_api': params.get('is_api'),
+        'request_host': params.get('request_host'),
+    }
+
+
+def publish_event(params):
+    """
+    Append an event to the Redis event journal.
+
+    If Redis is unavailable the event is written straight to the database so
+    that it is not lost.
+
+    Args:
+        params: dict: The event parameters.
+
+    """
+    record = _event_record(params)
+    try:
+        get_redis().xadd(EVENT_JOURNAL_STREAM, {'event': json.dumps(record)},
+                         maxlen=EVENT_JOURNAL_MAXLEN, approximate=True)
+    except redis.exceptions.RedisError as error:
+        logger.warning(f'Event journal unavailable, writing event directly: {error}')
+        _write_event_records([record])
+
+
+def _record_to_event(record, users):
+    created = record['created']
+    return Events(
+        user_id=users.get(record['user_id']),
+        function_name=record['function_name'],
+        function_parameters=record['function_parameters'],
+        object_type=record['object_type'],
+        resource_id=record['resource_id'],
+        event_stage=record['event_stage'],
+        retries=record['retries'] or 0,
+        created=datetime.fromisoformat(created) if created else None,
+        outcome=record['outcome'] or "",
+        message=record['message'] or "",
+        job_id=record['job_id'] or "",
+        is_api=record['is_api'],
+        request_host=record['request_host'],
     )
 
 
+@transaction.atomic
+def _write_event_records(records):
+    """
+    Insert a batch of journal records.
+
+    The Start and End events of a job carry its job id from the start, so they
+    need no correlating on insertion.
+    """
+    user_ids = {record['user_id'] for record in records}
+    users = dict(SppUser.objects.filter(user_id__in=user_ids).values_list('user_id', 'id'))
+    # Records journaled by earlier releases may be correlation-only End records
+    Events.objects.bulk_create([_record_to_event(record, users) for record in records
+                                if record.get('store', True)])
+
+
+def _dead_letter(redis_instance, message_id, fields, error):
+    logger.error(f'Moving event journal record {message_id} to {EVENT_JOURNAL_DEAD_STREAM}: {error}')
+    redis_instance.xadd(EVENT_JOURNAL_DEAD_STREAM,
+                        {'event': fields.get('event', ''), 'message_id': message_id, 'error': str(error)},
+                        maxlen=EVENT_JOURNAL_MAXLEN, approximate=True)
+
+
+def _write_journal_entries(redis_instance, entries):
+    """
+    Write a batch of journal entries to the database, then acknowledge and remove them.
+
+    The batch is inserted in one transaction. If that fails because of a record, the
+    records are inserted one at a time and the ones that still fail are moved to the
+    dead-letter stream, so one bad record never blocks the journal. If the database is
+    unavailable the error is raised and the entries stay pending for the next run.
+    """
+    records = []
+    for message_id, fields in entries:
+        # Pending entries already deleted from the stream come back without fields
+        if not fields:
+            continue
+        try:
+            records.append((message_id, fields, json.loads(fields['event'])))
+        except (KeyError, ValueError) as error:
+            _dead_letter(redis_instance, message_id, fields, error)
+
+    try:
+        _write_event_records([record for _, _, record in records])
+    except (OperationalError, InterfaceError):
+        raise
+    except (DatabaseError, KeyError, TypeError, ValueError) as error:
+        logger.warning(f'Event journal batch failed, writing its {len(records)} records one by one: {error}')
+        for message_id, fields, record in records:
+            try:
+                _write_event_records([record])
+            except (OperationalError, InterfaceError):
+                raise
+            except (DatabaseError, KeyError, TypeError, ValueError) as record_error:
+                _dead_letter(redis_instance, message_id, fields, record_error)
+
+    message_ids = [message_id for message_id, _ in entries]
+    redis_instance.xack(EVENT_JOURNAL_STREAM, EVENT_JOURNAL_GROUP, *message_ids)
+    redis_instance.xdel(EVENT_JOURNAL_STREAM, *message_ids)
+
+
+def _claim_stale_entries(redis_instance, batch_size):
+    """
+    Yields batches of journal entries left pending by consumers that have gone away.
+    """
+    start = '0-0'
+    while True:
+        response = redis_instance.execute_command(
+            'XAUTOCLAIM', EVENT_JOURNAL_STREAM, EVENT_JOURNAL_GROUP, EVENT_JOURNAL_CONSUMER,
+            EVENT_JOURNAL_CLAIM_IDLE_MS, start, 'COUNT', batch_size)
+        start, claimed = response[0], response[1]
+        entries = []
+        for entry in claimed:
+            if not entry:
+                continue
+            message_id, fields = entry[0], entry[1]
+            # Entries already deleted from the stream are claimed without fields
+            fields = dict(zip(fields[::2], fields[1::2])) if fields else {}
+            entries.append((message_id, fields))
+        if entries:
+            yield entries
+        if start in ('0-0', b'0-0'):
+            return
+
+
+def flush_event_journal(batch_size=500, blocking_timeout=0):
+    """
+    Consume the Redis event journal and write its records to the database.
+
+    Records are read through a consumer group and only acknowledged and removed
+    from the stream once their batch has been committed, so a crash mid-batch
+    leaves the batch pending rather than losing it. Records left pending by a
+    crashed run are claimed with XAUTOCLAIM before new ones are read. Records
+    the database rejects are moved to the EVENT_JOURNAL_DEAD_STREAM stream.
+
+    Runs are serialized with a Redis lock, so the same record is never written
+    by two processes.
+
+    Args:
+        batch_size: int: The maximum number of records written per transaction.
+        blocking_timeout: int: Seconds to wait for a run in another process to end.
+
+    Returns:
+        int: The number of records processed, or None if another process held
+        the lock for longer than blocking_timeout.
+
+    """
+    redis_instance = get_redis()
+    lock = redis_instance.lock(EVENT_JOURNAL_LOCK_KEY, timeout=EVENT_JOURNAL_LOCK_TIMEOUT,
+                               blocking_timeout=blocking_timeout)
+    if not lock.acquire():
+        logger.info('Event journal is being flushed by another process')
+        return None
+    try:
+        try:
+            redis_instance.xgroup_create(EVENT_JOURNAL_STREAM, EVENT_JOURNAL_GROUP, id='0', mkstream=True)
+        except redis.exceptions.ResponseError:
+            # BUSYGROUP, the group already exists
+            pass
+
+        processed = 0
+        for entries in _claim_stale_entries(redis_instance, batch_size):
+            _write_journal_entries(redis_instance, entries)
+            processed += len(entries)
+        while True:
+            response = redis_instance.xreadgroup(EVENT_JOURNAL_GROUP, EVENT_JOURNAL_CONSUMER,
+                                                 {EVENT_JOURNAL_STREAM: '>'}, count=batch_size)
+            entries = response[0][1] if response else []
+            if not entries:
+                break
+            _write_journal_entries(redis_instance, entries)
+            processed += len(entries)
+        # Consumers are named per process, drop this one once it holds no pending entries
+        if not redis_instance.xpending_range(EVENT_JOURNAL_STREAM, EVENT_JOURNAL_GROUP, '-', '+', 1,
+                                             consumername=EVENT_JOURNAL_CONSUMER):
+            redis_instance.xgroup_delconsumer(EVENT_JOURNAL_STREAM, EVENT_JOURNAL_GROUP,
+                                              EVENT_JOURNAL_CONSUMER)
+        return processed
+    finally:
+        try:
+            lock.release()
+        except redis.exceptions.LockError:
+            logger.warning('Event journal flush lock expired before the flush ended')
+
+
 def create_event_params(func_name=None, resource_id=None, user=None, resource_type='vapp', event_stage='Start', outcome='', created=None, extra_params={}, is_api=False, request_host='localhost'):
     """
     This function creates a dictionary of event parameters with the provided values.
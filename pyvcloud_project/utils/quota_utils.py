@@ -0,0 +1,314 @@
+"""
+This module contains the Redis quota ledger used for vApp admission.
+
+Each org VDC has two Redis hashes with the fields running (powered on vApps), stored
+(all vApps), cpu and memory_mb (allocated to its vApps):
+
+    quota_ledger:<org_vdc_id>     usage as last read from vCD, plus committed reservations
+    quota_reserved:<org_vdc_id>   the sum of the reservations not yet committed or released
+    quota_commits:<org_vdc_id>    the reservations committed lately, scored by commit time
+
+Creating a vApp reserves its share of the quota with a Lua script that checks every limit
+and records the reservation in one step, so concurrent requests cannot both pass the check.
+The reservation is committed into the ledger when the job succeeds and released when it
+fails. Reservations expire after RESERVATION_TTL, and reconcile() rebuilds the ledger from
+vCD and drops the expired reservations from the reserved totals. The ledger of an org VDC is
+reconciled after every vApp and VM job, and for the whole system by the vApp summary refresh.
+
+reconcile() writes the ledger and the reserved totals in one Lua script, so a reservation
+made or settled while vCD is queried is never overwritten. The reservations committed after
+the vCD query started are added on top of its usage, as the query may have missed their
+vApps; at worst a vApp is counted twice until the next reconcile.
+"""
+import logging
+import time
+import uuid
+from pyvcloud.vcd.client import ResourceType
+from pyvcloud_project.vmware_client import VMWareClientSingleton
+from pyvcloud_project.models import OrgVdcs, Vapps, Vms
+from pyvcloud_project.utils import pyvcloud_utils as utils
+from pyvcloud_project.utils.pyvcloud_utils import PowerState
+
+logger = logging.getLogger(__name__)
+
+LEDGER_KEY = 'quota_ledger:{}'
+RESERVED_KEY = 'quota_reserved:{}'
+RESERVATION_KEY = 'quota_reservation:{}'
+RESERVATION_INDEX_KEY = 'quota_reservations:{}'
+COMMITS_KEY = 'quota_commits:{}'
+
+QUOTA_FIELDS = ('running', 'stored', 'cpu', 'memory_mb')
+
+# Longer than the create_from_template_vapp job timeout, including its retries
+RESERVATION_TTL = 3 * 3600
+
+# Committed reservations are kept this long for the reconciles that were running meanwhile
+COMMIT_RETENTION = 3600
+
+# KEYS: ledger, reserved, reservation, reservation index
+# ARGV: ttl, reservation id, org vdc id, then (field, delta, limit) triples; limit -1 = none
+# Returns the name of the first field over its limit, or nil once the reservation is made
+RESERVE_SCRIPT = """
+for i = 4, #ARGV, 3 do
+    local delta = tonumber(ARGV[i + 1])
+    local limit = tonumber(ARGV[i + 2])
+    if delta > 0 and limit >= 0 then
+        local used = tonumber(redis.call('HGET', KEYS[1], ARGV[i]) or '0')
+            + tonumber(redis.call('HGET', KEYS[2], ARGV[i]) or '0')
+        if used + delta > limit then
+            return ARGV[i]
+        end
+    end
+end
+for i = 4, #ARGV, 3 do
+    redis.call('HINCRBY', KEYS[2], ARGV[i], ARGV[i + 1])
+    redis.call('HSET', KEYS[3], ARGV[i], ARGV[i + 1])
+end
+redis.call('HSET', KEYS[3], 'org_vdc_id', ARGV[3])
+redis.call('EXPIRE', KEYS[3], tonumber(ARGV[1]))
+redis.call('SADD', KEYS[4], ARGV[2])
+return nil
+"""
+
+# KEYS: ledger, reserved, reservation, reservation index, commits
+# ARGV: '1' to commit or '0' to release, reservation id, current time, commit retention
+SETTLE_SCRIPT = """
+redis.call('SREM', KEYS[4], ARGV[2])
+local reservation = redis.call('HGETALL', KEYS[3])
+if #reservation == 0 then
+    return 0
+end
+local entry = ARGV[2]
+for i = 1, #reservation, 2 do
+    if reservation[i] ~= 'org_vdc_id' then
+        redis.call('HINCRBY', KEYS[2], reservation[i], -tonumber(reservation[i + 1]))
+        if ARGV[1] == '1' then
+            redis.call('HINCRBY', KEYS[1], reservation[i], reservation[i + 1])
+            entry = entry .. '|' .. reservation[i] .. '=' .. reservation[i + 1]
+        end
+    end
+end
+if ARGV[1] == '1' then
+    redis.call('ZADD', KEYS[5], ARGV[3], entry)
+    redis.call('EXPIRE', KEYS[5], tonumber(ARGV[4]))
+end
+redis.call('DEL', KEYS[3])
+return 1
+"""
+
+# KEYS: ledger, reserved, reservation index, commits
+# ARGV: vCD query start time, commit retention start time, reservation key prefix,
+#       then (field, usage) pairs
+RECONCILE_SCRIPT = """
+local ledger = {}
+local reserved = {}
+for i = 4, #ARGV, 2 do
+    ledger[ARGV[i]] = tonumber(ARGV[i + 1])
+    reserved[ARGV[i]] = 0
+end
+for _, reservation_id in ipairs(redis.call('SMEMBERS', KEYS[3])) do
+    local reservation = redis.call('HGETALL', ARGV[3] .. reservation_id)
+    if #reservation == 0 then
+        redis.call('SREM', KEYS[3], reservation_id)
+    end
+    for i = 1, #reservation, 2 do
+        if reserved[reservation[i]] ~= nil then
+            reserved[reservation[i]] = reserved[reservation[i]] + tonumber(reservation[i + 1])
+        end
+    end
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[4], '-inf', '(' .. ARGV[2])
+for _, entry in ipairs(redis.call('ZRANGEBYSCORE', KEYS[4], ARGV[1], '+inf')) do
+    for field, delta in string.gmatch(entry, '|([%w_]+)=(-?%d+)') do
+        if ledger[field] ~= nil then
+            ledger[field] = ledger[field] + tonumber(delta)
+        end
+    end
+end
+for field, usage in pairs(ledger) do
+    redis.call('HSET', KEYS[1], field, usage)
+    redis.call('HSET', KEYS[2], field, reserved[field])
+end
+return 1
+"""
+
+
+class QuotaExceeded(Exception):
+    """
+    Raised when a reservation would bring an org VDC over one of its quotas.
+
+    Attributes:
+        field: str: The quota that would be exceeded, one of QUOTA_FIELDS.
+    """
+
+    def __init__(self, field):
+        super().__init__(f'{field} quota exceeded')
+        self.field = field
+
+
+def _keys(org_vdc_id, reservation_id=''):
+    return [LEDGER_KEY.format(org_vdc_id), RESERVED_KEY.format(org_vdc_id),
+            RESERVATION_KEY.format(reservation_id), RESERVATION_INDEX_KEY.format(org_vdc_id),
+            COMMITS_KEY.format(org_vdc_id)]
+
+
+def aggregate_usage(vapp_records):
+    """
+    Sums the quota usage of ADMIN_VAPP records per org VDC.
+
+    Returns:
+        dict: org VDC id -> {'running', 'stored', 'cpu', 'memory_mb'}
+    """
+    usage = {}
+    for record in vapp_records:
+        org_vdc_usage = usage.setdefault(utils.vdc_href_to_id(record.get('vdc')),
+                                         dict.fromkeys(QUOTA_FIELDS, 0))
+        org_vdc_usage['stored'] += 1
+        if record.get('status') == PowerState.POWER_ON.value:
+            org_vdc_usage['running'] += 1
+        org_vdc_usage['cpu'] += int(record.get('numberOfCpus') or 0)
+        org_vdc_usage['memory_mb'] += int(record.get('memoryAllocationMB') or 0)
+    return usage
+
+
+def reconcile(client=None, org_vdc_id=None):
+    """
+    Rebuilds the ledger of an org VDC, or of every org VDC, from one ADMIN_VAPP typed query.
+
+    Returns:
+        str: A message with the number of org VDC ledgers reconciled.
+    """
+    client = client or VMWareClientSingleton().client
+    started = time.time()
+    qfilter = 'isExpired==false'
+    if org_vdc_id:
+        qfilter += f';vdc=={org_vdc_id}'
+    usage = aggregate_usage(utils.stream_typed_query(
+        client, ResourceType.ADMIN_VAPP.value, 'status,numberOfCpus,memoryAllocationMB,vdc', qfilter))
+
+    if org_vdc_id:
+        org_vdc_ids = [org_vdc_id]
+    else:
+        org_vdc_ids = list(OrgVdcs.objects.exclude(org_vdc_id=None).values_list('org_vdc_id', flat=True))
+
+    write_ledgers(usage, org_vdc_ids, started)
+    return f'{len(org_vdc_ids)} org VDC quota ledgers reconciled'
+
+
+def write_ledgers(usage, org_vdc_ids, started):
+    """
+    Writes the usage read from vCD into the ledgers of org VDCs and recomputes their
+    reserved totals, one RECONCILE_SCRIPT call per org VDC.
+
+    Args:
+        usage: dict: org VDC id -> usage, as returned by aggregate_usage.
+        org_vdc_ids: list: The org VDCs to write, with no usage if they are not in usage.
+        started: float: The time the vCD query started.
+    """
+    redis_instance = utils.get_redis()
+    script = redis_instance.register_script(RECONCILE_SCRIPT)
+    pipeline = redis_instance.pipeline()
+    for vdc_id in org_vdc_ids:
+        vdc_usage = usage.get(vdc_id) or dict.fromkeys(QUOTA_FIELDS, 0)
+        args = [started, started - COMMIT_RETENTION, RESERVATION_KEY.format('')]
+        for field in QUOTA_FIELDS:
+            args += [field, int(vdc_usage[field])]
+        ledger_key, reserved_key, _, index_key, commits_key = _keys(vdc_id)
+        script(keys=[ledger_key, reserved_key, index_key, commits_key], args=args, client=pipeline)
+    pipeline.execute()
+
+
+def quota_limits(org_vdc, power_on, check_resources):
+    """
+    Returns the limits a new vApp is checked against, keeping the comparisons of the old
+    allowed_* checks: the running and stored vApp counts must stay below their quota, CPU
+    and memory must not go over it. A limit of -1 is not checked.
+    """
+    return {
+        'running': org_vdc.running_tb_limit - 1 if power_on else -1,
+        'stored': org_vdc.stored_tb_limit - 1,
+        'cpu': org_vdc.cpu_limit if check_resources else -1,
+        'memory_mb': org_vdc.memory_limit * 1024 if check_resources else -1,
+    }
+
+
+def reserve(org_vdc, power_on, cpu=0, memory_mb=0, check_resources=False, client=None):
+    """
+    Atomically checks the quotas of an org VDC and reserves room for one new vApp.
+
+    Args:
+        org_vdc: OrgVdcs: The org VDC the vApp is created in.
+        power_on: bool: Whether the vApp will be powered on.
+        cpu: int: The CPUs of the template.
+        memory_mb: int: The memory of the template.
+        check_resources: bool: Whether to check the CPU and memory quotas.
+
+    Returns:
+        str: The reservation id, to be passed to commit or release.
+
+    Raises:
+        QuotaExceeded: If the vApp would bring the org VDC over a quota.
+    """
+    org_vdc_id = org_vdc.org_vdc_id
+    redis_instance = utils.get_redis()
+    if not redis_instance.exists(LEDGER_KEY.format(org_vdc_id)):
+        reconcile(client, org_vdc_id)
+
+    deltas = {'running': 1 if power_on else 0, 'stored': 1, 'cpu': cpu, 'memory_mb': memory_mb}
+    limits = quota_limits(org_vdc, power_on, check_resources)
+    reservation_id = uuid.uuid4().hex
+    args = [RESERVATION_TTL, reservation_id, org_vdc_id]
+    for field in QUOTA_FIELDS:
+        args += [field, int(deltas[field]), int(limits[field])]
+
+    exceeded = redis_instance.register_script(RESERVE_SCRIPT)(
+        keys=_keys(org_vdc_id, reservation_id)[:4], args=args)
+    if exceeded:
+        raise QuotaExceeded(exceeded)
+    return reservation_id
+
+
+def _settle(org_vdc_id, reservation_id, committed):
+    script = utils.get_redis().register_script(SETTLE_SCRIPT)
+    return script(keys=_keys(org_vdc_id, reservation_id),
+                  args=['1' if committed else '0', reservation_id, time.time(), COMMIT_RETENTION])
+
+
+def commit(org_vdc_id, reservation_id):
+    """
+    Moves a reservation into the ledger once its vApp exists.
+    """
+    return _settle(org_vdc_id, reservation_id, True)
+
+
+def release(org_vdc_id, reservation_id):
+    """
+    Gives back a reservation whose vApp was not created.
+    """
+    return _settle(org_vdc_id, reservation_id, False)
+
+
+def refresh_after_job(job_args, succeeded):
+    """
+    Settles the reservation of a finished job and reconciles the ledger of its org VDC.
+
+    Failures are logged and swallowed so that they never affect the job outcome.
+    """
+    try:
+        org_vdc_id = job_args.get('org_vdc_id')
+        reservation_id = job_args.get('quota_reservation')
+        if reservation_id and org_vdc_id:
+            _settle(org_vdc_id, reservation_id, succeeded)
+
+        if not org_vdc_id:
+            resource_id = job_args.get('resource_id')
+            if job_args.get('resource_type') == 'vm':
+                org_vdc_id = Vms.objects.filter(vcd_id=resource_id).values_list(
+                    'vapp_obj__org_vdc_obj__org_vdc_id', flat=True).first()
+            else:
+                org_vdc_id = Vapps.objects.filter(vcd_id=resource_id).values_list(
+                    'org_vdc_obj__org_vdc_id', flat=True).first()
+        if org_vdc_id:
+            reconcile(org_vdc_id=org_vdc_id)
+    except Exception as error:
+        logger.warning(f'Failed to update the quota ledger after job {job_args.get("func_name")}: {error}')
@@ -0,0 +1,170 @@
+"""
+This module contains the report snapshot store shared by the report pages, the CSV downloads
+and the nightly historical report cron jobs.
+
+A report is built once by report_utils and saved as a ReportSnapshot row holding its rows as
+zlib compressed JSON. The report pages serve the latest snapshot while it is younger than
+SNAPSHOT_TTL. An older snapshot is still served, and a rebuild is queued with the
+rebuild_report_snapshot retry policy, on the low queue by default (stale-while-revalidate). Downloads ask for the snapshot the page was rendered from by id, and
+the cron jobs build a fresh snapshot and mark it as historical so it is kept. The system-wide
+snapshots built every hour by record_capacity_samples are also added to the capacity history
+(see capacity_history_utils). Snapshots built for page views are not, so the history does not
+depend on how often the reports are opened.
+"""
+import json
+import logging
+import zlib
+from datetime import timedelta
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from redis.exceptions import RedisError
+from pyvcloud_project.models import ReportSnapshot
+from pyvcloud_project.utils import capacity_history_utils, pyvcloud_utils as utils, report_utils
+from pyvcloud_project.worker_queue_settings import RetryPolicyRegistry, policy_job
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_SCHEMA_VERSION = 2
+
+# Snapshots older than this are served but rebuilt in the background
+SNAPSHOT_TTL = 900
+
+# Snapshots that are not historical are deleted once they are this old
+SNAPSHOT_RETENTION = timedelta(days=1)
+
+REBUILD_LOCK_KEY = 'report_snapshot_rebuild:{}:{}'
+
+DATETIME_FIELDS = ('creation_date',)
+
+HISTORY_RECORDERS = {
+    ReportSnapshot.ReportTypes.VAPP: capacity_history_utils.record_vapp_rows,
+    ReportSnapshot.ReportTypes.DATACENTER: capacity_history_utils.record_datacenter_rows,
+}
+
+BUILDERS = {
+    ReportSnapshot.ReportTypes.VAPP: lambda client, scope: report_utils.build_vapp_report(client, scope or None),
+    ReportSnapshot.ReportTypes.DATACENTER: lambda client, scope: report_utils.build_datacenter_report(client),
+}
+
+
+def build_snapshot(report_type, scope='', historical=False, client=None, record_history=False):
+    """
+    Builds a report and saves it as a new snapshot.
+
+    Args:
+        report_type: str: One of ReportSnapshot.ReportTypes.
+        scope: str: The datacenter name for a single datacenter report, '' for the whole system.
+        historical: bool: Keep the snapshot as a historical report.
+        record_history: bool: Add a system-wide snapshot to the capacity history.
+
+    Returns:
+        ReportSnapshot: The new snapshot.
+    """
+    rows = BUILDERS[report_type](client, scope)
+    data = zlib.compress(json.dumps(rows, cls=DjangoJSONEncoder, separators=(',', ':')).encode())
+    snapshot = ReportSnapshot.objects.create(report_type=report_type, scope=scope,
+                                             schema_version=SNAPSHOT_SCHEMA_VERSION,
+                                             row_count=len(rows), data=data, historical=historical)
+    if record_history and not scope:
+        try:
+            HISTORY_RECORDERS[report_type](rows, snapshot.created)
+        except Exception as error:
+            logger.warning(f'Could not add the {report_type} report to the capacity history: {error}')
+    ReportSnapshot.objects.filter(historical=False,
+                                  created__lt=timezone.now() - SNAPSHOT_RETENTION).delete()
+    return snapshot
+
+
+@policy_job('rebuild_report_snapshot')
+def record_capacity_samples(client=None):
+    """
+    Builds system-wide vApp and datacenter snapshots and adds them to the capacity history.
+    Runs every hour from cron, so every hourly bucket holds one sample.
+
+    Returns:
+        str: A summary of the snapshots built.
+    """
+    built = []
+    for report_type in HISTORY_RECORDERS:
+        snapshot = build_snapshot(report_type, client=client, record_history=True)
+        built.append(f'{snapshot.row_count} {report_type} rows')
+    return ', '.join(built) + ' recorded'
+
+
+def rebuild_snapshot(report_type, scope=''):
+    """
+    Job function rebuilding a stale snapshot in the background.
+
+    A rebuild killed at its job timeout does not release the lock, which then expires
+    with the same timeout.
+    """
+    try:
+        build_snapshot(report_type, scope)
+    finally:
+        utils.get_redis().delete(REBUILD_LOCK_KEY.format(report_type, scope))
+
+
+def _queue_rebuild(report_type, scope):
+    try:
+        lock_timeout = RetryPolicyRegistry.get(rebuild_snapshot.policy_name).timeout
+        if utils.get_redis().set(REBUILD_LOCK_KEY.format(report_type, scope), 1,
+                                 nx=True, ex=lock_timeout):
+            rebuild_snapshot.delay(report_type, scope)
+    except RedisError as error:
+        logger.warning(f'Could not queue a rebuild of the {report_type} report: {error}')
+
+
+def latest_snapshot(report_type, scope=''):
+    """
+    Returns the latest snapshot of a report, or None if there is none.
+    """
+    return ReportSnapshot.objects.filter(
+        report_type=report_type, scope=scope, schema_version=SNAPSHOT_SCHEMA_VERSION
+    ).order_by('-created').first()
+
+
+def get_snapshot(report_type, scope=''):
+    """
+    Returns the snapshot served by the report pages.
+
+    The report is built on the spot if it has no snapshot yet, and rebuilt in the background
+    if its latest snapshot is older than SNAPSHOT_TTL.
+
+    Returns:
+        ReportSnapshot: The snapshot.
+    """
+    snapshot = latest_snapshot(report_type, scope)
+    if snapshot is None:
+        return build_snapshot(report_type, scope)
+    if timezone.now() - snapshot.created > timedelta(seconds=SNAPSHOT_TTL):
+        _queue_rebuild(report_type, scope)
+    return snapshot
+
+
+def find_snapshot(report_type, snapshot_id=None, scope=''):
+    """
+    Returns the snapshot a download refers to, or the latest one if no id is given.
+    """
+    if snapshot_id and str(snapshot_id).isdigit():
+        snapshot = ReportSnapshot.objects.filter(pk=snapshot_id, report_type=report_type).first()
+        if snapshot:
+            return snapshot
+    return latest_snapshot(report_type, scope)
+
+
+def load_rows(snapshot):
+    """
+    Decodes the rows of a snapshot.
+
+    Returns:
+        list: The report rows.
+    """
+    if snapshot is None:
+        return []
+    rows = json.loads(zlib.decompress(bytes(snapshot.data)))
+    for row in rows:
+        for field in DATETIME_FIELDS:
+            if row.get(field):
+                row[field] = parse_datetime(row[field])
+    return rows
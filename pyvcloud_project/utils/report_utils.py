@@ -0,0 +1,128 @@
+"""
+This module builds the datacenter and vApp reports.
+
+The datacenter report is computed from one system-wide ADMIN_VM query and one
+system-wide ADMIN_VAPP query, grouped by org VDC in a single pass over each, so
+its cost does not grow with the number of org VDCs. The vApp report reads every
+vApp row with one DB query and joins it in memory with the power states (from
+the power state cache or one ADMIN_VAPP query) and one ADMIN_VM resource query.
+"""
+import math
+from pyvcloud.vcd.client import ResourceType
+from pyvcloud_project.vmware_client import VMWareClientSingleton
+from pyvcloud_project.models import OrgVdcs, Vapps
+from pyvcloud_project.utils import orgvdc_utils, pyvcloud_utils as utils
+from pyvcloud_project.utils.pyvcloud_utils import PowerState
+
+
+def aggregate_org_vdc_usage(vm_records, vapp_records):
+    """
+    Groups VM and vApp typed-query records by org VDC.
+
+    Returns:
+        dict: org VDC id -> {'running_cpus', 'running_memory_gb', 'running_vapps', 'total_vapps'}
+    """
+    usage = {}
+
+    def org_vdc_usage(record):
+        vdc_id = utils.vdc_href_to_id(record.get('vdc'))
+        if vdc_id not in usage:
+            usage[vdc_id] = {'running_cpus': 0, 'running_memory_gb': 0,
+                             'running_vapps': 0, 'total_vapps': 0}
+        return usage[vdc_id]
+
+    for vm_record in vm_records:
+        if vm_record.get('status') == PowerState.POWER_ON.value:
+            vdc_usage = org_vdc_usage(vm_record)
+            vdc_usage['running_cpus'] += int(vm_record.get('numberOfCpus') or 0)
+            vdc_usage['running_memory_gb'] += math.ceil(int(vm_record.get('memoryMB') or 0) / 1024)
+
+    for vapp_record in vapp_records:
+        vdc_usage = org_vdc_usage(vapp_record)
+        vdc_usage['total_vapps'] += 1
+        if vapp_record.get('status') == PowerState.POWER_ON.value:
+            vdc_usage['running_vapps'] += 1
+    return usage
+
+
+def build_datacenter_report(client=None):
+    """
+    Builds the datacenter report for every org VDC.
+
+    Returns:
+        list: One dict per org VDC with its running resources and quotas.
+    """
+    client = client or VMWareClientSingleton().client
+    vm_records = utils.stream_typed_query(client, ResourceType.ADMIN_VM.value,
+                                          'status,numberOfCpus,memoryMB,vdc', 'isVAppTemplate==false')
+    vapp_records = utils.stream_typed_query(client, ResourceType.ADMIN_VAPP.value,
+                                            'status,vdc', 'isExpired==false')
+    usage = aggregate_org_vdc_usage(vm_records, vapp_records)
+
+    datacenter_info = []
+    for org_vdc in OrgVdcs.objects.select_related('provider_vdc_obj'):
+        vdc_usage = usage.get(org_vdc.org_vdc_id, {})
+        running_cpus = vdc_usage.get('running_cpus', 0)
+        running_memory_gb = vdc_usage.get('running_memory_gb', 0)
+        running_vapps = vdc_usage.get('running_vapps', 0)
+        total_vapps = vdc_usage.get('total_vapps', 0)
+        datacenter_info.append({
+            "datacenter_name": org_vdc.name,
+            "org_vdc_id": org_vdc.org_vdc_id,
+            "provider_name": str(org_vdc.provider_vdc_obj),
+            "running_cpus": running_cpus,
+            "running_cpus_quota": org_vdc.cpu_limit,
+            "unused_running_cpus_quota": org_vdc.cpu_limit - running_cpus,
+            "running_memory_gb": running_memory_gb,
+            "running_memory_quota_gb": org_vdc.memory_limit,
+            "unused_running_memory_quota_gb": org_vdc.memory_limit - running_memory_gb,
+            "running_vApps": running_vapps,
+            "running_vApps_quota": org_vdc.running_tb_limit,
+            "unused_running_vApps_quota": org_vdc.running_tb_limit - running_vapps,
+            "total_vApps": total_vapps,
+            "total_vApps_quota": org_vdc.stored_tb_limit,
+            "unused_total_vApps_quota": org_vdc.stored_tb_limit - total_vapps,
+        })
+    return datacenter_info
+
+
+def build_vapp_report(client=None, datacenter_name=None):
+    """
+    Builds the vApp report for every vApp, or for the vApps of one org VDC.
+
+    Returns:
+        list: One dict per vApp with its power state, owner and running resources.
+    """
+    client = client or VMWareClientSingleton().client
+    vapps = Vapps.objects.all()
+    org_vdc_id = None
+    if datacenter_name:
+        vapps = vapps.filter(org_vdc_obj__name=datacenter_name)
+        org_vdc_id = OrgVdcs.objects.filter(name=datacenter_name).values_list('org_vdc_id', flat=True).first()
+        if not org_vdc_id:
+            return []
+
+    vapp_power_states = orgvdc_utils.get_power_state_of_vapps(client, org_vdc_id)
+    vapp_resources = orgvdc_utils.get_vapp_resources(client, org_vdc_id)
+
+    vapp_info_list = []
+    for vapp in vapps.values('vcd_id', 'name', 'vts_name', 'created', 'origin_catalog_name',
+                             'origin_template_name', 'org_vdc_obj__name', 'org_vdc_obj__org_vdc_id',
+                             'created_by_user_obj__user__username'):
+        power_state = vapp_power_states.get(vapp['vcd_id'], {})
+        resources = vapp_resources.get(vapp['vcd_id'], {})
+        vapp_info_list.append({
+            'vapp_vcd_id': vapp['vcd_id'],
+            'catalog_name': vapp['org_vdc_obj__name'],
+            'name': vapp['name'],
+            'vapp_power_state': power_state.get('power_state', ''),
+            'gateway': vapp['vts_name'],
+            'created_by': vapp['created_by_user_obj__user__username'] or 'N/A',
+            'creation_date': vapp['created'],
+            'origin_catalog_name': vapp['origin_catalog_name'],
+            'origin_template_name': vapp['origin_template_name'],
+            'org_vdc_id': vapp['org_vdc_obj__org_vdc_id'],
+            'running_cpu': resources.get('cpu_on_count'),
+            'running_memory': resources.get('memory_on_count'),
+        })
+    return vapp_info_list
@@ -0,0 +1,175 @@
+"""
+This module contains the vApp template cache used by the catalog pages and vApp admission.
+
+The templates of each catalog are read with one VAPP_TEMPLATE typed query and stored in Redis:
+
+    catalog_templates:<catalog>         template id -> JSON (name, status, creation date, CPUs, memory)
+    catalog_template_names:<catalog>    lower-cased template name -> template id
+    template_catalogs                   template id -> catalog name
+
+A catalog is read again from vCD once its entries are older than CATALOG_TEMPLATES_TTL, or
+straight away after a template is captured into it, renamed or deleted through the SPP.
+"""
+import json
+import logging
+from pyvcloud.vcd.client import ResourceType
+from pyvcloud_project.vmware_client import VMWareClientSingleton
+from pyvcloud_project.utils import pyvcloud_utils as utils
+
+logger = logging.getLogger(__name__)
+
+CATALOG_TEMPLATES_KEY = 'catalog_templates:{}'
+CATALOG_TEMPLATE_NAMES_KEY = 'catalog_template_names:{}'
+CATALOG_TEMPLATES_LOADED_KEY = 'catalog_templates_loaded:{}'
+TEMPLATE_CATALOGS_KEY = 'template_catalogs'
+
+# Templates changed directly in vCD are picked up after this long
+CATALOG_TEMPLATES_TTL = 600
+
+TEMPLATE_FIELDS = 'name,status,creationDate,numberOfCpus,memoryAllocationMB,catalogName'
+
+
+def _catalog_key(catalog_name):
+    return catalog_name.lower()
+
+
+def template_id_from_href(href):
+    """
+    Returns the bare uuid of a vApp template href (.../vAppTemplate/vappTemplate-<uuid>).
+    """
+    return href.rsplit('/', 1)[1].split('-', 1)[1]
+
+
+def template_record_to_dict(record):
+    """
+    Converts a VAPP_TEMPLATE query record into the dict stored in the cache.
+    """
+    return {
+        'id': template_id_from_href(record.get('href')),
+        'href': record.get('href'),
+        'name': record.get('name'),
+        'status': record.get('status'),
+        'creationDate': record.get('creationDate'),
+        'numberOfCpus': int(record.get('numberOfCpus') or 0),
+        'memoryAllocationMB': int(record.get('memoryAllocationMB') or 0),
+        'catalogName': record.get('catalogName'),
+    }
+
+
+def load_catalog(catalog_name, client=None):
+    """
+    Reads the templates of a catalog from vCD into the cache.
+
+    Returns:
+        list: The template dicts of the catalog.
+    """
+    client = client or VMWareClientSingleton().client
+    templates = [template_record_to_dict(record) for record in utils.stream_typed_query(
+        client, ResourceType.VAPP_TEMPLATE.value, TEMPLATE_FIELDS,
+        f'isExpired==false;catalogName=={catalog_name}')]
+
+    catalog_key = _catalog_key(catalog_name)
+    pipeline = utils.get_redis().pipeline()
+    pipeline.delete(CATALOG_TEMPLATES_KEY.format(catalog_key),
+                    CATALOG_TEMPLATE_NAMES_KEY.format(catalog_key))
+    if templates:
+        pipeline.hset(CATALOG_TEMPLATES_KEY.format(catalog_key),
+                      mapping={template['id']: json.dumps(template) for template in templates})
+        pipeline.hset(CATALOG_TEMPLATE_NAMES_KEY.format(catalog_key),
+                      mapping={template['name'].lower(): template['id'] for template in templates})
+        pipeline.hset(TEMPLATE_CATALOGS_KEY,
+                      mapping={template['id']: catalog_name for template in templates})
+    pipeline.set(CATALOG_TEMPLATES_LOADED_KEY.format(catalog_key), 1, ex=CATALOG_TEMPLATES_TTL)
+    pipeline.execute()
+    return templates
+
+
+def get_catalog_templates(catalog_name, client=None):
+    """
+    Returns the templates of a catalog, reading them from vCD if they are not cached.
+
+    Returns:
+        list: The template dicts of the catalog.
+    """
+    catalog_key = _catalog_key(catalog_name)
+    redis_instance = utils.get_redis()
+    if not redis_instance.exists(CATALOG_TEMPLATES_LOADED_KEY.format(catalog_key)):
+        return load_catalog(catalog_name, client)
+    return [json.loads(template) for template in
+            redis_instance.hvals(CATALOG_TEMPLATES_KEY.format(catalog_key))]
+
+
+def count_templates(catalog_name, client=None):
+    """
+    Returns the number of templates in a catalog.
+
+    If the catalog is not cached the templates are counted by vCD without being read.
+    """
+    catalog_key = _catalog_key(catalog_name)
+    redis_instance = utils.get_redis()
+    if redis_instance.exists(CATALOG_TEMPLATES_LOADED_KEY.format(catalog_key)):
+        return redis_instance.hlen(CATALOG_TEMPLATES_KEY.format(catalog_key))
+    return utils.count_typed_query(client or VMWareClientSingleton().client, ResourceType.VAPP_TEMPLATE.value,
+                                   f'isExpired==false;catalogName=={catalog_name}')
+
+
+def template_name_exists(catalog_name, template_name, client=None):
+    """
+    Returns True if the catalog has a template with this name, ignoring case.
+
+    If the catalog is not cached it is loaded first, so names that only differ in case are
+    caught and the template name is never put into a typed query filter.
+    """
+    catalog_key = _catalog_key(catalog_name)
+    redis_instance = utils.get_redis()
+    if not redis_instance.exists(CATALOG_TEMPLATES_LOADED_KEY.format(catalog_key)):
+        templates = load_catalog(catalog_name, client)
+        return any(template['name'].lower() == template_name.lower() for template in templates)
+    return bool(redis_instance.hexists(CATALOG_TEMPLATE_NAMES_KEY.format(catalog_key),
+                                       template_name.lower()))
+
+
+def get_template(template_id, client=None):
+    """
+    Returns a template by id, loading its catalog into the cache if needed.
+
+    Returns:
+        dict: The template, or None if it does not exist or has expired.
+    """
+    redis_instance = utils.get_redis()
+    catalog_name = redis_instance.hget(TEMPLATE_CATALOGS_KEY, template_id)
+    if catalog_name and redis_instance.exists(CATALOG_TEMPLATES_LOADED_KEY.format(_catalog_key(catalog_name))):
+        template = redis_instance.hget(CATALOG_TEMPLATES_KEY.format(_catalog_key(catalog_name)), template_id)
+        return json.loads(template) if template else None
+
+    if not catalog_name:
+        client = client or VMWareClientSingleton().client
+        query_result = utils.send_typed_query(client, ResourceType.VAPP_TEMPLATE.value, 'catalogName',
+                                              f'isExpired==false;id=={template_id}')
+        if not query_result:
+            return None
+        catalog_name = query_result[0].get('catalogName')
+
+    for template in load_catalog(catalog_name, client):
+        if template['id'] == template_id:
+            return template
+    return None
+
+
+def invalidate_catalog(catalog_name):
+    """
+    Drops the cached templates of a catalog so they are read again on next use.
+    """
+    catalog_key = _catalog_key(catalog_name)
+    utils.get_redis().delete(CATALOG_TEMPLATES_LOADED_KEY.format(catalog_key))
+
+
+def invalidate_template(template_id):
+    """
+    Drops the cached templates of the catalog holding a template.
+    """
+    redis_instance = utils.get_redis()
+    catalog_name = redis_instance.hget(TEMPLATE_CATALOGS_KEY, template_id)
+    redis_instance.hdel(TEMPLATE_CATALOGS_KEY, template_id)
+    if catalog_name:
+        invalidate_catalog(catalog_name)
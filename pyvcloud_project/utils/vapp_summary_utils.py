@@ -0,0 +1,228 @@
+"""
+This module maintains the materialized vApp summaries served by the vApp index and get_vapps.
+
+Each org VDC has a Redis hash vapp_summary:<org_vdc_id> mapping a vApp vcd_id to a JSON summary
+(power state, deployed flag, running and total CPU/memory, VM count, gateway, owner and the time
+it was built). Summaries are rebuilt by the job callbacks for the vApp a job touched, by the
+vApp import, and periodically for the whole system by the refresh_vapp_summaries command, so
+reading them never needs a call to vCD. The busy state is read from the busy cache at read time.
+"""
+import json
+import logging
+import time
+from datetime import datetime, timezone
+from pyvcloud.vcd.client import ResourceType
+from pyvcloud_project.vmware_client import VMWareClientSingleton
+from pyvcloud_project.models import Vapps, Vms
+from pyvcloud_project.utils import orgvdc_utils, power_state_utils, pyvcloud_utils as utils
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_KEY = 'vapp_summary:{}'
+SUMMARY_REFRESHED_KEY = 'vapp_summary_refreshed:{}'
+
+# Summaries older than this are flagged as stale to the user
+STALE_AFTER_SECONDS = 300
+
+# The job that creates a vApp is given the id of the template it creates it from
+CREATE_VAPP_FUNC_NAME = 'Create_VApp_From_Template'
+
+# Shown in the vApp index for a vApp that has no summary yet
+PENDING_POWER_STATE = 'Pending'
+
+EMPTY_RESOURCES = {'cpu_on_count': 0, 'cpu_total': 0, 'memory_on_count': 0,
+                   'memory_total': 0, 'number_of_vms': 0}
+
+
+def _vapp_rows(**filters):
+    return Vapps.objects.filter(**filters).values(
+        'vcd_id', 'vts_name', 'ip_address', 'org_vdc_obj__org_vdc_id',
+        'created_by_user_obj__user__username')
+
+
+def build_summary(vapp_row, resources, power_state, updated):
+    """
+    Builds the summary stored for a vApp.
+
+    Returns:
+        dict: The vApp summary.
+    """
+    resources = resources or EMPTY_RESOURCES
+    power_state = power_state or {}
+    return {
+        'power_state': power_state.get('power_state'),
+        'deployed': power_state.get('deployed', False),
+        'cpu_on_count': resources['cpu_on_count'],
+        'cpu_total': resources['cpu_total'],
+        'memory_on_count': resources['memory_on_count'],
+        'memory_total': resources['memory_total'],
+        'number_of_vms': resources['number_of_vms'],
+        'gateway': (vapp_row['vts_name'] or '').split('.')[0],
+        'ip_address': vapp_row['ip_address'] or '',
+        'owner': vapp_row['created_by_user_obj__user__username'] or '',
+        'updated': updated,
+    }
+
+
+def _write_org_vdc(redis_instance, org_vdc_id, summaries, updated):
+    key = SUMMARY_KEY.format(org_vdc_id)
+    pipeline = redis_instance.pipeline()
+    pipeline.delete(key)
+    if summaries:
+        pipeline.hset(key, mapping={vcd_id: json.dumps(summary)
+                                    for vcd_id, summary in summaries.items()})
+    pipeline.set(SUMMARY_REFRESHED_KEY.format(org_vdc_id), updated)
+    pipeline.execute()
+
+
+def refresh_org_vdc(client, org_vdc_id):
+    """
+    Rebuilds the summaries of every vApp in an org VDC from two typed queries.
+
+    Returns:
+        dict: vApp vcd_id -> summary.
+    """
+    vapp_resources = orgvdc_utils.get_vapp_resources(client, org_vdc_id)
+    vapp_power_states = orgvdc_utils.get_power_state_of_vapps(client, org_vdc_id)
+    updated = time.time()
+    summaries = {
+        vapp_row['vcd_id']: build_summary(vapp_row, vapp_resources.get(vapp_row['vcd_id']),
+                                          vapp_power_states.get(vapp_row['vcd_id']), updated)
+        for vapp_row in _vapp_rows(org_vdc_obj__org_vdc_id=org_vdc_id)
+        if vapp_row['vcd_id'] in vapp_power_states
+    }
+    _write_org_vdc(utils.get_redis(), org_vdc_id, summaries, updated)
+    return summaries
+
+
+def refresh_all(client=None):
+    """
+    Rebuilds the summaries of every vApp in the system from two system-wide typed queries.
+
+    Returns:
+        str: A message with the number of vApps summarised.
+    """
+    client = client or VMWareClientSingleton().client
+    vapp_resources = orgvdc_utils.get_vapp_resources(client)
+    vapp_power_states = orgvdc_utils.get_power_state_of_vapps(client)
+    updated = time.time()
+
+    summaries_by_org_vdc = {}
+    for vapp_row in _vapp_rows():
+        vcd_id = vapp_row['vcd_id']
+        org_vdc_summaries = summaries_by_org_vdc.setdefault(vapp_row['org_vdc_obj__org_vdc_id'], {})
+        if vcd_id in vapp_power_states:
+            org_vdc_summaries[vcd_id] = build_summary(
+                vapp_row, vapp_resources.get(vcd_id), vapp_power_states[vcd_id], updated)
+
+    redis_instance = utils.get_redis()
+    for org_vdc_id, summaries in summaries_by_org_vdc.items():
+        _write_org_vdc(redis_instance, org_vdc_id, summaries, updated)
+    return f'{sum(len(summaries) for summaries in summaries_by_org_vdc.values())} vApp summaries refreshed'
+
+
+def refresh_vapp(vapp_vcd_id, org_vdc_id=None, client=None):
+    """
+    Rebuilds the summary of a single vApp, or removes it if the vApp no longer exists.
+    """
+    vapp_row = _vapp_rows(vcd_id=vapp_vcd_id).first()
+    if vapp_row:
+        org_vdc_id = vapp_row['org_vdc_obj__org_vdc_id']
+    if not org_vdc_id:
+        return
+    key = SUMMARY_KEY.format(org_vdc_id)
+    redis_instance = utils.get_redis()
+
+    client = client or VMWareClientSingleton().client
+    vapp_query = utils.send_typed_query(
+        client, ResourceType.ADMIN_VAPP.value, 'status,isDeployed', f'id=={vapp_vcd_id}')
+    if not vapp_row or not vapp_query:
+        redis_instance.hdel(key, vapp_vcd_id)
+        return
+
+    is_deployed = vapp_query[0].get('isDeployed')
+    power_state_utils.set_vapp_state(vapp_vcd_id, vapp_query[0].get('status'), is_deployed, org_vdc_id)
+    power_state = {
+        'power_state': orgvdc_utils.create_vapp_status_string(vapp_query[0].get('status'), is_deployed),
+        'deployed': is_deployed == 'true',
+    }
+    vm_records = utils.send_typed_query(client, ResourceType.ADMIN_VM.value,
+                                        'status,numberOfCpus,memoryMB,container',
+                                        f'isVAppTemplate==false;container=={vapp_vcd_id}')
+    power_state_utils.set_vm_states({utils.href_to_id(vm.get('href')): vm.get('status')
+                                     for vm in vm_records})
+    resources = orgvdc_utils.aggregate_vapp_resources(vm_records).get(vapp_vcd_id)
+    summary = build_summary(vapp_row, resources, power_state, time.time())
+    redis_instance.hset(key, vapp_vcd_id, json.dumps(summary))
+
+
+def refresh_after_job(job_args):
+    """
+    Refreshes the summary of the vApp touched by a finished job.
+
+    Failures are logged and swallowed so that they never affect the job outcome.
+    """
+    try:
+        resource_id = job_args.get('resource_id')
+        if job_args.get('func_name') == CREATE_VAPP_FUNC_NAME:
+            resource_id = Vapps.objects.filter(
+                org_vdc_obj__org_vdc_id=job_args.get('org_vdc_id'),
+                name=job_args.get('vapp_name')).values_list('vcd_id', flat=True).first()
+        elif job_args.get('resource_type') == 'vm':
+            vm = Vms.objects.filter(vcd_id=resource_id).values('vapp_obj__vcd_id').first()
+            resource_id = vm['vapp_obj__vcd_id'] if vm else None
+        if resource_id:
+            refresh_vapp(resource_id, org_vdc_id=job_args.get('org_vdc_id'))
+    except Exception as error:
+        logger.warning(f'Failed to refresh vApp summary after job {job_args.get("func_name")}: {error}')
+
+
+def get_org_vdc_summaries(org_vdc_id):
+    """
+    Returns the vApp summaries of an org VDC with their freshness.
+
+    The summaries are built on first use if the refresher has not run yet.
+
+    Returns:
+        tuple: (dict of vApp vcd_id -> summary with its busy state,
+                datetime the summaries were last refreshed, bool stale)
+    """
+    redis_instance = utils.get_redis()
+    pipeline = redis_instance.pipeline()
+    pipeline.hgetall(SUMMARY_KEY.format(org_vdc_id))
+    pipeline.get(SUMMARY_REFRESHED_KEY.format(org_vdc_id))
+    raw_summaries, refreshed = pipeline.execute()
+
+    if refreshed is None:
+        summaries = refresh_org_vdc(VMWareClientSingleton().client, org_vdc_id)
+        refreshed = time.time()
+    else:
+        summaries = {vcd_id: json.loads(summary) for vcd_id, summary in raw_summaries.items()}
+        refreshed = float(refreshed)
+
+    vcd_ids = list(summaries)
+    if vcd_ids:
+        pipeline = redis_instance.pipeline()
+        for vcd_id in vcd_ids:
+            pipeline.exists(vcd_id)
+        for vcd_id, busy in zip(vcd_ids, pipeline.execute()):
+            summaries[vcd_id]['busy'] = busy
+
+    stale = time.time() - refreshed > STALE_AFTER_SECONDS
+    return summaries, datetime.fromtimestamp(refreshed, tz=timezone.utc), stale
+
+
+def pending_summary(vapp_vcd_id):
+    """
+    Returns the summary shown for a vApp that has none yet, e.g. one created since the last
+    refresh.
+    """
+    return dict(EMPTY_RESOURCES, power_state=PENDING_POWER_STATE, deployed=False,
+                busy=utils.get_redis().exists(vapp_vcd_id))
+
+
+def summary_updated(summary):
+    """
+    Returns the time a single vApp summary was built.
+    """
+    return datetime.fromtimestamp(summary['updated'], tz=timezone.utc)
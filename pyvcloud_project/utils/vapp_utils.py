@@ -7,7 +7,6 @@ import time
 import logging
 import requests
 from lxml import etree
-from django_rq import job
 from django.conf import settings
 from pyvcloud.vcd.client import Client, ResourceType, VCLOUD_STATUS_MAP, VAppPowerStatus, EntityType, E, RelationType
 from pyvcloud.vcd.vapp import VApp
@@ -16,12 +15,11 @@ from pyvcloud.vcd.exceptions import InvalidParameterException
 from pyvcloud.vcd.org import Org
 from pyvcloud.vcd.vm import VM
 
-from pyvcloud_project.worker_queue_settings import RetryIntervalLimits
+from pyvcloud_project.worker_queue_settings import policy_job
 from pyvcloud_project.vmware_client import VMWareClientSingleton
-from pyvcloud_project.utils import org_utils, orgvdc_utils, pyvcloud_utils as utils, vapp_network_utils, vm_utils, vsphere_utils
+from pyvcloud_project.utils import api_job_utils, job_group_utils, org_utils, orgvdc_utils, power_state_utils, progress_utils, pyvcloud_utils as utils, quota_utils, template_cache_utils, vapp_network_utils, vapp_summary_utils, vm_utils, vsphere_utils
 from pyvcloud_project.utils.pyvcloud_utils import PowerState
 from pyvcloud_project.models import OrgVdcs, Vapps, Vms
-from collections import defaultdict
 
 logger = logging.getLogger(__name__)
 
@@ -70,6 +68,8 @@ def import_vapps():
     if add_vapps:
         utils.save_models(add_vapps)
 
+    vapp_summary_utils.refresh_all(client)
+    quota_utils.reconcile(client)
     return 'Vapps are imported'
 
 
@@ -93,41 +93,6 @@ def get_vapp(client: Client, name=None, href=None, resource=None):
         print(f'method:get_vdc()\n {error}')
     return vapp
 
-def get_vapp_info(vapp, client):
-    vapp_vcd_id = vapp.vcd_id
-    vapp_power_state = get_vapp_power_state(client, vapp_vcd_id)
-    created_by = vapp.created_by_user_obj.username if vapp.created_by_user_obj else 'N/A'
-    vapp_info = {
-        'vapp_vcd_id': vapp_vcd_id,
-        'catalog_name': vapp.org_vdc_obj.name,
-        'name': vapp.name,
-        'vapp_power_state': vapp_power_state,
-        'gateway': vapp.vts_name,
-        'created_by': created_by,
-        'creation_date': vapp.created,
-        'origin_catalog_name': vapp.origin_catalog_name,
-        'origin_template_name': vapp.origin_template_name,
-        'org_vdc_id': vapp.org_vdc_obj.org_vdc_id,
-    }
-    return vapp_info
-
-def get_vapp_resource_info(client, vapps_data):
-    vapp_info_list = [get_vapp_info(vapp, client) for vapp in vapps_data]
-    org_ids = list(set([vapp.org_vdc_obj.org_vdc_id for vapp in vapps_data]))
-    org_vapps = defaultdict(list)
-
-    for org_id in org_ids:
-        org_vapps[org_id] = orgvdc_utils.get_vapp_resources(client, org_id)
-
-    for vapp_info in vapp_info_list:
-        vapp_org_vdc_id = vapp_info['org_vdc_id']
-        vapp_resource_data = org_vapps[vapp_org_vdc_id].get(vapp_info['vapp_vcd_id'])
-        if vapp_resource_data:
-            vapp_info['running_cpu'] = vapp_resource_data['cpu_on_count']
-            vapp_info['running_memory'] = vapp_resource_data['memory_on_count']
-
-    return vapp_info_list
-
 def create_vapp_model(client, vapp_res, org_vdc_db):
     """
     Creates a vApp model object.
@@ -158,106 +123,47 @@ def create_vapp_model(client, vapp_res, org_vdc_db):
     return vapp_obj
 
 
-def allowed_poweron_another_vapp(client, orgvdc_id):
-    """
-    Checks if it is allowed to power on another vApp in the specified organization virtual data center.
-
-    Args:
-        client (pyvcloud.vcd.client.Client): The VMware vCloud Director client.
-        orgvdc_id (str): The ID of the organization virtual data center.
-
-    Returns:
-        bool: True if it is allowed to power on another vApp, False otherwise.
+def reserve_vapp_quota(client, orgvdc_obj, vapp_template, power_on):
     """
-    running = count_vapps(client, orgvdc_id)[0]
-    quota = OrgVdcs.objects.get(org_vdc_id=orgvdc_id).running_tb_limit
+    Reserves the quota of a new vApp in the quota ledger of its organization virtual data center.
 
-    return running + 1 < quota
-
-
-def allowed_power_on_vapp_resources(client, orgvdc_id, vapp_template_name):
-    """
-    Checks if it is allowed to power on vApp resources for the specified organization virtual data center and vApp template name.
+    The CPU and memory quotas are only checked for provider VDCs on the new quota system.
 
     Args:
         client (pyvcloud.vcd.client.Client): The VMware vCloud Director client.
-        orgvdc_id (str): The ID of the organization virtual data center.
-        vapp_template_name (str): The name of the vApp template.
+        orgvdc_obj (pyvcloud_project.models.OrgVdcs): The organization virtual data center.
+        vapp_template (dict): The vApp template, as returned by template_cache_utils.
+        power_on (bool): Whether the vApp will be powered on.
 
     Returns:
-        bool: True if it is allowed to power on vApp resources, False otherwise.
-    """
-    total_cpu = 0
-    total_mem = 0
-    resource_type = ResourceType.VAPP_TEMPLATE.value
-    fields = "name,numberOfCpus,memoryAllocationMB"
-    qfilter = f"isExpired==false;name=={vapp_template_name}"
+        str: The reservation id.
 
-    vapp_templates_resources = utils.send_typed_query(
-        client, resource_type, fields, qfilter)
-    orgvdc = OrgVdcs.objects.get(org_vdc_id=orgvdc_id)
-    vdc_href = orgvdc_utils.get_vdc_href(client, orgvdc_id)
-
-    resource_type = ResourceType.ADMIN_VAPP.value
-    fields = "numberOfCpus,memoryAllocationMB"
-    qfilter = f"vdc=={vdc_href}"
-    existing_vapps_resources = utils.send_typed_query(
-        client, resource_type, fields, qfilter)
-
-    for template in vapp_templates_resources:
-        total_cpu += int(template.get("numberOfCpus"))
-        total_mem += int(template.get("memoryAllocationMB")) /1024
-    for vapp in existing_vapps_resources:
-        total_cpu += int(vapp.get("numberOfCpus"))
-        total_mem += int(vapp.get("memoryAllocationMB")) / 1024
-
-    if total_cpu > orgvdc.cpu_limit or total_mem > orgvdc.memory_limit:
-        return False
-    return True
-
-
-def allowed_create_another_vapp(client, orgvdc_id):
-    """
-    Checks if it is allowed to create another vApp in the specified organization virtual data center.
-
-    Args:
-        client (pyvcloud.vcd.client.Client): The VMware vCloud Director client.
-        orgvdc_id (str): The ID of the organization virtual data center.
-
-    Returns:
-        bool: True if it is allowed to create another vApp, False otherwise.
+    Raises:
+        quota_utils.QuotaExceeded: If the vApp would bring the org VDC over a quota.
     """
-    [running, not_running] = count_vapps(client, orgvdc_id)
-    quota = OrgVdcs.objects.get(org_vdc_id=orgvdc_id).stored_tb_limit
-
-    return running + not_running + 1 < quota
+    check_resources = bool(power_on) and orgvdc_obj.provider_vdc_obj.new_quota_system
+    cpu = vapp_template['numberOfCpus'] if check_resources else 0
+    memory_mb = vapp_template['memoryAllocationMB'] if check_resources else 0
+    return quota_utils.reserve(orgvdc_obj, bool(power_on), cpu=cpu, memory_mb=memory_mb,
+                               check_resources=check_resources, client=client)
 
 
-def count_vapps(client, orgvdc_id):
+def quota_exceeded_message(quota_field, vapp_name):
     """
-    Counts the number of running and not running vApps in the specified organization virtual data center.
+    Gets the message shown to the user when creating a vApp would exceed a quota.
 
     Args:
-        client (pyvcloud.vcd.client.Client): The VMware vCloud Director client.
-        orgvdc_id (str): The ID of the organization virtual data center.
+        quota_field (str): The quota that would be exceeded.
+        vapp_name (str): The name of the vApp.
 
     Returns:
-        list: A list containing the number of running and not running vApps.
+        str: The message.
     """
-    resource_type = ResourceType.ADMIN_VAPP.value
-    fields = "name,status"
-    qfilter = f"isExpired==false;vdc=={orgvdc_id}"
-
-    vapps = utils.send_typed_query(client, resource_type, fields, qfilter)
-    running = 0
-    not_running = 0
-    for vapp in vapps:
-        status = vapp.get("status")
-        if status == PowerState.POWER_ON.value:
-            running += 1
-        else:
-            not_running += 1
-    return [running, not_running]
+    if quota_field == 'running':
+        return "Choosing to power on this new vApp would bring you over the running vApp quota, please power off other vApps first"
+    if quota_field == 'stored':
+        return f"Creating this vApp {vapp_name} would bring you over the Total vApps quota, please delete other vApps first"
+    return f"Starting this vApp {vapp_name} would bring you over the running Resource (CPU/Memory) quota, please power off other vApps first"
 
 
 def get_status_number(status_str: str):
@@ -285,7 +191,16 @@ def on_worker_success(worker_job, connection, result):
         connection: The connection object.
         result: The result of the job.
     """
+    # The job group goes first, so that a failure below does not stall the group's next job
+    try:
+        job_group_utils.record_outcome(worker_job.args[0], succeeded=True)
+    except Exception:
+        logger.exception(f'Could not record the outcome of job {worker_job.id} in its job group')
     utils.on_worker_success(worker_job, connection, result)
+    vapp_summary_utils.refresh_after_job(worker_job.args[0])
+    quota_utils.refresh_after_job(worker_job.args[0], succeeded=True)
+    api_job_utils.record_outcome(worker_job.id, succeeded=True)
+    progress_utils.publish(worker_job.args[0], progress_utils.FINISHED, job_id=worker_job.id)
 
 
 def on_worker_failure(job, connection, type, value, traceback):
@@ -299,10 +214,22 @@ def on_worker_failure(job, connection, type, value, traceback):
         value: The value associated with the failure.
         traceback: The traceback information.
     """
+    if not job.retries_left:
+        try:
+            job_group_utils.record_outcome(job.args[0], succeeded=False, error=str(value))
+        except Exception:
+            logger.exception(f'Could not record the outcome of job {job.id} in its job group')
     utils.on_worker_failure(job, connection, type, value, traceback)
+    if not job.retries_left:
+        vapp_summary_utils.refresh_after_job(job.args[0])
+        quota_utils.refresh_after_job(job.args[0], succeeded=False)
+        api_job_utils.record_outcome(job.id, succeeded=False, error=str(value))
+        progress_utils.publish(job.args[0], progress_utils.FAILED, message=str(value), job_id=job.id)
+    else:
+        progress_utils.publish(job.args[0], progress_utils.RETRYING, message=str(value), job_id=job.id)
 
 
-@job(RetryIntervalLimits.start_vapp.args, **RetryIntervalLimits.start_vapp.kwargs, on_success=on_worker_success, on_failure=on_worker_failure)
+@policy_job('start_vapp', on_success=on_worker_success, on_failure=on_worker_failure)
 def start_vapp(params):
     """
     Job function to start a vApp.
@@ -318,7 +245,8 @@ def start_vapp(params):
     vapp_name = vapp_obj.name
     vapp = VApp(client, name=vapp_name, href=vapp_href)
     task = vapp.power_on()
-    client.get_task_monitor().wait_for_success(task)
+    client.get_task_monitor().wait_for_success(
+        task, callback=progress_utils.task_callback(params, 'powering_on'))
 
     # Find the hostname of the vApp
     vts_name = get_gateway_vm_hostname(client, vapp_href)
@@ -349,7 +277,7 @@ def get_gateway_vm_hostname(client, vapp_href, gateway_vm_href=None):
 
     return vapp_network_utils.get_hostname_from_ip(external_ip)
 
-@job(RetryIntervalLimits.stop_vapp.args, **RetryIntervalLimits.stop_vapp.kwargs, on_success=on_worker_success, on_failure=on_worker_failure)
+@policy_job('stop_vapp', on_success=on_worker_success, on_failure=on_worker_failure)
 def stop_vapp(params):
     """
     Job function to stop a vApp.
@@ -365,10 +293,11 @@ def stop_vapp(params):
     vapp_href = get_vapp_href(client, vapp_vcd_id)
     vapp = VApp(client, name=vapp_name, href=vapp_href)
     task = vapp.shutdown()
-    client.get_task_monitor().wait_for_success(task)
+    client.get_task_monitor().wait_for_success(
+        task, callback=progress_utils.task_callback(params, 'stopping'))
 
 
-@job(RetryIntervalLimits.recompose_vapp.args, **RetryIntervalLimits.recompose_vapp.kwargs, on_success=on_worker_success, on_failure=on_worker_failure)
+@policy_job('recompose_vapp', on_success=on_worker_success, on_failure=on_worker_failure)
 def recompose_vapp(params):
     """
     Job function to recompose a vApp.
@@ -414,7 +343,8 @@ def recompose_vapp(params):
         vm_specs_to_add.append(vm_spec)
 
     task = vapp.add_vms(vm_specs_to_add, power_on=False)
-    client.get_task_monitor().wait_for_success(task)
+    client.get_task_monitor().wait_for_success(
+        task, callback=progress_utils.task_callback(params, 'recomposing'))
 
     # Reloading the vApp resources after Vm add
     vapp.reload()
@@ -436,21 +366,23 @@ def recompose_vapp(params):
                     break
 
         task = client.put_linked_resource(net_conn_section, RelationType.EDIT, EntityType.NETWORK_CONNECTION_SECTION.value, net_conn_section)
-        client.get_task_monitor().wait_for_success(task)
+        client.get_task_monitor().wait_for_success(
+            task, callback=progress_utils.task_callback(params, 'recomposing'))
 
     logger.info(
         f'Recompose Completed. Powering on the vApp {vapp_name}')
     # Powering on the Vapp
     task = vapp.power_on()
-    client.get_task_monitor().wait_for_success(task)
+    client.get_task_monitor().wait_for_success(
+        task, callback=progress_utils.task_callback(params, 'recomposing'))
     logger.info("Starting Import of recomposed VMs")
-    vsphere_utils.import_vm_storage_from_vsphere()
+    vsphere_utils.refresh_vapp_storage(vapp_obj)
     vm_utils.import_vms()
     logger.info("Completed VM import")
 
 
 
-@job(RetryIntervalLimits.delete_vapp.args, **RetryIntervalLimits.delete_vapp.kwargs, on_success=on_worker_success, on_failure=on_worker_failure)
+@policy_job('delete_vapp', on_success=on_worker_success, on_failure=on_worker_failure)
 def delete_vapp(params):
     """
     Job function to delete a vApp.
@@ -469,11 +401,12 @@ def delete_vapp(params):
     pvdc_name = pvdc_obj.name
     orgvdc_client = VDC(client, name=pvdc_name, href=org_vdc_id)
     task = orgvdc_client.delete_vapp(vapp_name)
-    client.get_task_monitor().wait_for_success(task)
+    client.get_task_monitor().wait_for_success(
+        task, callback=progress_utils.task_callback(params, 'deleting'))
     vapp_obj.delete()
 
 
-@job(RetryIntervalLimits.poweroff_and_delete_vapp.args, **RetryIntervalLimits.poweroff_and_delete_vapp.kwargs, on_success=on_worker_success, on_failure=on_worker_failure)
+@policy_job('poweroff_and_delete_vapp', on_success=on_worker_success, on_failure=on_worker_failure)
 def poweroff_and_delete(params):
     """Power off and delete a vApp.
 
@@ -490,37 +423,58 @@ def poweroff_and_delete(params):
     pvdc_obj = org_vdc_obj.provider_vdc_obj
     pvdc_name = pvdc_obj.name
     orgvdc_client = VDC(client, name=pvdc_name, href=org_vdc_id)
-    vapp_power_state = get_vapp_power_state(client, vapp_vcd_id)
+    vapp_power_state = get_vapp_power_state(client, vapp_vcd_id, fresh=True)
     if PowerState.POWER_OFF.value != vapp_power_state:
         poweroff_vapp(params)
     task = orgvdc_client.delete_vapp(vapp_name)
-    client.get_task_monitor().wait_for_success(task)
+    client.get_task_monitor().wait_for_success(
+        task, callback=progress_utils.task_callback(params, 'deleting'))
     vapp_obj.delete()
 
 
-def get_vapp_power_state(client, vapp_vcd_id):
-    """Get the power state of a vApp.
+def query_vapp_power_state(client, vapp_vcd_id):
+    """Query vCD for the status and deployed flag of a vApp and update the power state cache.
 
     Args:
         client: VMWare client object.
         vapp_vcd_id (str): vApp resource ID.
 
     Returns:
-        str: Power state of the vApp.
+        tuple: (status, isDeployed), or None if the vApp was not found.
 
     """
-    vapp_power_state = ''
     resource_type = ResourceType.ADMIN_VAPP.value
-    fields = "status,isDeployed"
+    fields = "status,isDeployed,vdc"
     qfilter = f"id=={vapp_vcd_id}"
     query_result = utils.send_typed_query(
         client, resource_type, fields, qfilter)
-    if query_result:
-        vapp_power_state = query_result[0].get('status')
-        is_vapp_deployed = query_result[0].get('isDeployed')
-        vapp_power_state = orgvdc_utils.create_vapp_status_string(
-            vapp_power_state, is_vapp_deployed)
-    return vapp_power_state
+    if not query_result:
+        return None
+    status = query_result[0].get('status')
+    is_vapp_deployed = query_result[0].get('isDeployed')
+    power_state_utils.set_vapp_state(vapp_vcd_id, status, is_vapp_deployed,
+                                     utils.vdc_href_to_id(query_result[0].get('vdc')))
+    return status, is_vapp_deployed
+
+
+def get_vapp_power_state(client, vapp_vcd_id, fresh=False):
+    """Get the power state of a vApp.
+
+    Args:
+        client: VMWare client object.
+        vapp_vcd_id (str): vApp resource ID.
+        fresh (bool): Query vCD instead of reading the power state cache.
+
+    Returns:
+        str: Power state of the vApp.
+
+    """
+    vapp_state = None if fresh else power_state_utils.get_vapp_state(vapp_vcd_id)
+    if vapp_state is None:
+        vapp_state = query_vapp_power_state(client, vapp_vcd_id)
+    if not vapp_state:
+        return ''
+    return orgvdc_utils.create_vapp_status_string(*vapp_state)
 
 
 def get_vapp_status(client, vapp_vcd_id):
@@ -533,7 +487,6 @@ def get_vapp_status(client, vapp_vcd_id):
     Returns:
         dict: Dictionary with the status information of the vApp.
     """
-    shortened_operation = ""
     resource_type = ResourceType.ADMIN_TASK.value
     fields = "status,operationFull"
     qfilter = f"object=={vapp_vcd_id}"
@@ -543,24 +496,34 @@ def get_vapp_status(client, vapp_vcd_id):
         client, resource_type, fields, qfilter, sort_desc=sort_desc)
     vapp_status = "" if not query_result else query_result[0].get('status')
     if 'running' in vapp_status:
-        vapp_operation = query_result[0].get('operationFull')
-        if 'purging' in vapp_operation.lower():
-            shortened_operation = 'Cleaning up..'
-        elif 'capturing virtual' in vapp_operation.lower():
-            shortened_operation = 'Copying..'
-        elif 'powering off' in vapp_operation.lower():
-            shortened_operation = 'Powering Off VM..'
-        elif 'resetting' in vapp_operation.lower():
-            shortened_operation = 'Resetting VM..'
-        else:
-            shortened_operation = vapp_operation.split(' ')[0] + '..'
+        shortened_operation = shorten_task_operation(query_result[0].get('operationFull'))
     else:
         shortened_operation = 'No running tasks'
 
     return {'status': shortened_operation}
 
 
-@job(RetryIntervalLimits.poweroff_vapp.args, **RetryIntervalLimits.poweroff_vapp.kwargs, on_success=on_worker_success, on_failure=on_worker_failure)
+def shorten_task_operation(operation):
+    """Shorten the full operation of a running vCD task for display.
+
+    Args:
+        operation (str): The operationFull of the task.
+
+    Returns:
+        str: The short status, e.g. 'Copying..'.
+    """
+    if 'purging' in operation.lower():
+        return 'Cleaning up..'
+    if 'capturing virtual' in operation.lower():
+        return 'Copying..'
+    if 'powering off' in operation.lower():
+        return 'Powering Off VM..'
+    if 'resetting' in operation.lower():
+        return 'Resetting VM..'
+    return operation.split(' ')[0] + '..'
+
+
+@policy_job('poweroff_vapp', on_success=on_worker_success, on_failure=on_worker_failure)
 def poweroff_vapp(params):
     """Power off a vApp.
 
@@ -576,7 +539,8 @@ def poweroff_vapp(params):
     vapp_name = vapp_obj.name
     vapp = VApp(client, name=vapp_name, href=vapp_href)
     task = vapp.undeploy(action='powerOff')
-    client.get_task_monitor().wait_for_success(task)
+    client.get_task_monitor().wait_for_success(
+        task, callback=progress_utils.task_callback(params, 'powering_off'))
 
 
 def get_vapp_vcenter(vapp_id):
@@ -605,7 +569,7 @@ def get_vapp_vcenter(vapp_id):
     return query_result
 
 
-@job(RetryIntervalLimits.rename_vapp.args, **RetryIntervalLimits.rename_vapp.kwargs, on_success=on_worker_success, on_failure=on_worker_failure)
+@policy_job('rename_vapp', on_success=on_worker_success, on_failure=on_worker_failure)
 def rename_vapp(params):
     """
     Job function to rename a vApp.
@@ -625,12 +589,13 @@ def rename_vapp(params):
     vapp_name = vapp_obj.name
     vapp = VApp(client, name=vapp_name, href=vapp_href)
     task = vapp.edit_name_and_description(name=new_vapp_name)
-    client.get_task_monitor().wait_for_success(task)
+    client.get_task_monitor().wait_for_success(
+        task, callback=progress_utils.task_callback(params, 'renaming'))
     vapp_obj.name = new_vapp_name
     vapp_obj.save()
 
 
-@job(RetryIntervalLimits.rename_vapp_template.args, **RetryIntervalLimits.rename_vapp_template.kwargs, on_success=on_worker_success, on_failure=on_worker_failure)
+@policy_job('rename_vapp_template', on_success=on_worker_success, on_failure=on_worker_failure)
 def vapp_templates_rename(params):
     """
     Job function to rename vApp templates.
@@ -651,9 +616,10 @@ def vapp_templates_rename(params):
     task = client.put_resource(templates.get("href"),
                                etree.fromstring(contents), EntityType.VAPP_TEMPLATE.value)
     utils.execute_task(client, task)
+    template_cache_utils.invalidate_template(vapp_template_id)
 
 
-@job(RetryIntervalLimits.add_to_catalog_vapp.args, **RetryIntervalLimits.add_to_catalog_vapp.kwargs, on_success=on_worker_success, on_failure=on_worker_failure)
+@policy_job('add_to_catalog_vapp', on_success=on_worker_success, on_failure=on_worker_failure)
 def add_vapp_to_catalog(params):
     """
     Job function to add a vApp to a catalog.
@@ -679,10 +645,12 @@ def add_vapp_to_catalog(params):
     org = Org(client, href=org_href)
     catalog_res = org.get_catalog(catalog_name)
     task = org.capture_vapp(catalog_res, vapp_href, new_template_name, "")
-    client.get_task_monitor().wait_for_success(task)
+    client.get_task_monitor().wait_for_success(
+        task, callback=progress_utils.task_callback(params, 'capturing'))
+    template_cache_utils.invalidate_catalog(catalog_name)
 
 
-@job(RetryIntervalLimits.add_to_catalog_vapp.args, **RetryIntervalLimits.add_to_catalog_vapp.kwargs, on_success=on_worker_success, on_failure=on_worker_failure)
+@policy_job('add_to_catalog_vapp', on_success=on_worker_success, on_failure=on_worker_failure)
 def stop_and_add_vapp_to_catalog(params):
     """
     Job function to stop a vApp, and then add it to a catalog.
@@ -697,7 +665,7 @@ def stop_and_add_vapp_to_catalog(params):
     """
     vapp_vcd_id = params['resource_id']
     client = VMWareClientSingleton().client
-    vapp_power_state = get_vapp_power_state(client, vapp_vcd_id)
+    vapp_power_state = get_vapp_power_state(client, vapp_vcd_id, fresh=True)
     if PowerState.POWER_OFF.value != vapp_power_state:
         poweroff_vapp(params)
 
@@ -711,10 +679,12 @@ def stop_and_add_vapp_to_catalog(params):
     org = Org(client, href=org_href)
     catalog_res = org.get_catalog(catalog_name)
     task = org.capture_vapp(catalog_res, vapp_href, new_template_name, "")
-    client.get_task_monitor().wait_for_success(task)
+    client.get_task_monitor().wait_for_success(
+        task, callback=progress_utils.task_callback(params, 'capturing'))
+    template_cache_utils.invalidate_catalog(catalog_name)
 
 
-@job(RetryIntervalLimits.create_from_template_vapp.args, **RetryIntervalLimits.create_from_template_vapp.kwargs, on_success=on_worker_success, on_failure=on_worker_failure)
+@policy_job('create_from_template_vapp', on_success=on_worker_success, on_failure=on_worker_failure)
 def create_vapp_from_template(params):
     """
     Job function to create a vApp from a template.
@@ -742,7 +712,8 @@ def create_vapp_from_template(params):
                     EntityType.NETWORK_CONNECTION_SECTION.value))
                 task = client.put_linked_resource(
                     net_conn_section, RelationType.EDIT, EntityType.NETWORK_CONNECTION_SECTION.value, net_conn_section)
-                client.get_task_monitor().wait_for_success(task)
+                client.get_task_monitor().wait_for_success(
+                    task, callback=progress_utils.task_callback(params, 'resetting_mac'))
                 break  # Break out of the loop once index 0 is found
         gateway_vm_href = gateway_vm_res.get('href')
         logger.info(f"LMI Request: MAC Addresss reseting completed")
@@ -781,7 +752,10 @@ def create_vapp_from_template(params):
     # 80 * 15 seconds = 20 minutes. If vapp still hasn't instantiated and reached a powered off status in 20 minutes, something most likely going wrong.
     loop_index = 0
     while task_status != VAppPowerStatus.STOPPED.value and loop_index < 80:
-        task_status = client.get_task_monitor().get_status(vapp_res)
+        previous_status, task_status = task_status, client.get_task_monitor().get_status(vapp_res)
+        if task_status != previous_status:
+            progress_utils.publish(params, 'instantiating', task_status=task_status,
+                                   message=f'Instantiating vApp {params["vapp_name"]}')
         time.sleep(15)
         loop_index = loop_index + 1
 
@@ -820,7 +794,8 @@ def create_vapp_from_template(params):
 
     if power_on:
         task = vdc_vapp.power_on()
-        client.get_task_monitor().wait_for_success(task)
+        client.get_task_monitor().wait_for_success(
+            task, callback=progress_utils.task_callback(params, 'powering_on'))
         # Find the hostname of the gateway VM
         vts_name = get_gateway_vm_hostname(client, vapp_href, gateway_vm_href)
         logger.info(f"vApp {params['vapp_name']} with gateway {vts_name} Mapping to CI Portal Started")
@@ -842,7 +817,7 @@ def create_vapp_from_template(params):
 
     logger.info(f"vApp {params['vapp_name']} Object Saved Successfully")
     logger.info(f"vApp {params['vapp_name']} Importing vm storage from vSphere...")
-    vsphere_utils.import_vm_storage_from_vsphere()
+    vsphere_utils.refresh_vapp_storage(vapp_obj)
     logger.info("Importing newly added VM's")
     vm_utils.import_vms()
 
@@ -1021,26 +996,23 @@ def is_vapp_name_unique_on_vcd(client, vapp_name):
         bool: True if the vApp name is unique, False otherwise.
     """
     resource_type = ResourceType.ADMIN_VAPP.value
-    fields = "name"
     qfilter = f"isExpired==false;name=={vapp_name}"
-    results = utils.send_typed_query(client, resource_type, fields, qfilter)
-    return bool(results)
+    return utils.typed_query_exists(client, resource_type, qfilter)
 
 
-def is_vapp_powered_off(client, vapp_vcd_id):
+def is_vapp_powered_off(client, vapp_vcd_id, fresh=False):
     """
     Checks if a vApp is powered off.
 
     Args:
         client: The vCD client object.
         vapp_vcd_id (str): The vApp VCD ID.
+        fresh (bool): Query vCD instead of reading the power state cache.
 
     Returns:
         str: The power status of the vApp. Returns an empty string if the vApp doesn't exist or if the query result is empty.
     """
-    qfilter = f"id=={vapp_vcd_id}"
-    fields = "org,status"
-    resource_type = ResourceType.ADMIN_VAPP.value
-    query_result = utils.send_typed_query(
-        client, resource_type, fields, qfilter)
-    return "" if not query_result else query_result[0].get('status')
+    vapp_state = None if fresh else power_state_utils.get_vapp_state(vapp_vcd_id)
+    if vapp_state is None:
+        vapp_state = query_vapp_power_state(client, vapp_vcd_id)
+    return "" if not vapp_state else vapp_state[0]
@@ -10,13 +10,11 @@ from typing import List
 import logging
 import json
 from collections import defaultdict
-from django_rq import job
 import redis
 import concurrent.futures
 from typing import List
 from pyvcloud.vcd.vm import VM
 from pyvcloud.vcd.client import ResourceType
-from pyVmomi import vim
 from django.http import HttpResponse, HttpResponseBadRequest
 from pyvcloud_project.vmware_client import VMWareClientSingleton
 from pyvcloud_project.utils import pyvcloud_utils as utils
@@ -24,9 +22,9 @@ from pyvcloud_project.models import Vapps
 from pyvcloud.vcd.vm import VM
 from pyvcloud.vcd.client import ResourceType
 from pyvcloud_project.utils import (pyvcloud_utils as utils, vapp_network_utils, vsphere_utils,
-                                    vapp_utils)
+                                    progress_utils, quota_utils, vapp_utils, vapp_summary_utils)
 from pyvcloud_project.models import Vapps, Vms
-from pyvcloud_project.worker_queue_settings import RetryIntervalLimits
+from pyvcloud_project.worker_queue_settings import policy_job
 from pyvcloud_project.vmware_client import VMWareClientSingleton
 logger = logging.getLogger(__name__)
 
@@ -195,10 +193,44 @@ def get_vms(client, vapp_id) -> List:
     return vapp_vms
 
 
-@job(RetryIntervalLimits.power_on_vm.args,
-     **RetryIntervalLimits.power_on_vm.kwargs,
-     on_success=utils.on_worker_success,
-     on_failure=utils.on_worker_failure)
+def on_worker_success(worker_job, connection, result):
+    """
+    Callback function called when a worker job is successful.
+
+    Args:
+        worker_job: The job object.
+        connection: The connection object.
+        result: The result of the job.
+    """
+    utils.on_worker_success(worker_job, connection, result)
+    vapp_summary_utils.refresh_after_job(worker_job.args[0])
+    quota_utils.refresh_after_job(worker_job.args[0], succeeded=True)
+    progress_utils.publish(worker_job.args[0], progress_utils.FINISHED, job_id=worker_job.id)
+
+
+def on_worker_failure(job, connection, type, value, traceback):
+    """
+    Callback function called when a worker job fails.
+
+    Args:
+        worker_job: The job object.
+        connection: The connection object.
+        type: The type of the failure.
+        value: The value associated with the failure.
+        traceback: The traceback information.
+    """
+    utils.on_worker_failure(job, connection, type, value, traceback)
+    if not job.retries_left:
+        vapp_summary_utils.refresh_after_job(job.args[0])
+        quota_utils.refresh_after_job(job.args[0], succeeded=False)
+        progress_utils.publish(job.args[0], progress_utils.FAILED, message=str(value), job_id=job.id)
+    else:
+        progress_utils.publish(job.args[0], progress_utils.RETRYING, message=str(value), job_id=job.id)
+
+
+@policy_job('power_on_vm',
+            on_success=on_worker_success,
+            on_failure=on_worker_failure)
 def power_on_vm(params):
     """
     Job function to power on a virtual machine.
@@ -213,7 +245,8 @@ def power_on_vm(params):
     logger.info(f' vm_id: {vm_id}')
     vm = VM(client, href=vm_href)
     task = vm.power_on()
-    client.get_task_monitor().wait_for_success(task)
+    client.get_task_monitor().wait_for_success(
+        task, callback=progress_utils.task_callback(params, 'powering_on'))
     # Check if the vApp is a "master_gateway"
     if vm_name == "master_gateway":
         logger.info("VM is master_gateway... Importing Hostname")
@@ -257,10 +290,9 @@ def import_networks_and_update_vapps(vm_id):
     )
     logger.info(f"Hostname Update for the vApp {vapp_obj.name}")
 
-@job(RetryIntervalLimits.power_off_vm.args,
-     **RetryIntervalLimits.power_off_vm.kwargs,
-     on_success=utils.on_worker_success,
-     on_failure=utils.on_worker_failure)
+@policy_job('power_off_vm',
+            on_success=on_worker_success,
+            on_failure=on_worker_failure)
 def power_off_vm(params):
     """
     Job function to power off a virtual machine.
@@ -274,12 +306,12 @@ def power_off_vm(params):
     logger.info(f' vm_id: {vm_id}')
     vm = VM(client, href=vm_href)
     task = vm.undeploy(action='powerOff')
-    client.get_task_monitor().wait_for_success(task)
+    client.get_task_monitor().wait_for_success(
+        task, callback=progress_utils.task_callback(params, 'powering_off'))
 
-@job(RetryIntervalLimits.power_on_vm.args,
-     **RetryIntervalLimits.power_on_vm.kwargs,
-     on_success=utils.on_worker_success,
-     on_failure=utils.on_worker_failure)
+@policy_job('power_on_vm',
+            on_success=on_worker_success,
+            on_failure=on_worker_failure)
 def power_off_and_delete_vms(params):
     """
     Job function to power off and delete multiple virtual machines.
@@ -329,10 +361,9 @@ def power_off_and_delete_vms(params):
                 logger.error(f"An error occurred: {e}")
 
 
-@job(RetryIntervalLimits.shutdown_vm.args,
-     **RetryIntervalLimits.shutdown_vm.kwargs,
-     on_success=utils.on_worker_success,
-     on_failure=utils.on_worker_failure)
+@policy_job('shutdown_vm',
+            on_success=on_worker_success,
+            on_failure=on_worker_failure)
 def shutdown_vm(params):
     """
     Job function to shut down a virtual machine.
@@ -346,7 +377,8 @@ def shutdown_vm(params):
     logger.info(f' vm_id: {vm_id}')
     vm = VM(client, href=vm_href)
     task = vm.shutdown()
-    client.get_task_monitor().wait_for_success(task)
+    client.get_task_monitor().wait_for_success(
+        task, callback=progress_utils.task_callback(params, 'shutting_down'))
 
 
 def vm_tools_is_installed(href):
@@ -441,10 +473,9 @@ def get_vm_vcenter(vm_id):
     return error_msg
 
 
-@job(RetryIntervalLimits.delete_vm.args,
-     **RetryIntervalLimits.delete_vm.kwargs,
-     on_success=utils.on_worker_success,
-     on_failure=utils.on_worker_failure)
+@policy_job('delete_vm',
+            on_success=on_worker_success,
+            on_failure=on_worker_failure)
 def delete_vm(params):
     """
     Job function to delete a virtual machine.
@@ -458,7 +489,8 @@ def delete_vm(params):
     logger.info(f' vm_id: {vm_id}')
     vm = VM(client, href=vm_href)
     task = vm.delete()
-    client.get_task_monitor().wait_for_success(task)
+    client.get_task_monitor().wait_for_success(
+        task, callback=progress_utils.task_callback(params, 'deleting'))
 
 def get_vm_status(client, vm_id):
     """Get the status of a VM.
@@ -481,6 +513,24 @@ def get_vm_status(client, vm_id):
     if not query_result:
         return {'status': 'No running tasks'}
 
+    vm_status = query_result[0].get('status')
+    shortened_operation = shorten_task_operation(query_result[0].get('operationFull', ''))
+
+    if 'running' not in vm_status:
+        shortened_operation = 'No running tasks'
+
+    return {'status': shortened_operation}
+
+
+def shorten_task_operation(operation):
+    """Shorten the full operation of a running vCD task on a VM for display.
+
+    Args:
+        operation (str): The operationFull of the task.
+
+    Returns:
+        str: The short status, e.g. 'Powering On VM..'.
+    """
     cases = {
         'purging' : 'Cleaning up..',
         'capturing virtual' : 'Copying..',
@@ -488,15 +538,8 @@ def get_vm_status(client, vm_id):
         'resetting': 'Resetting VM..',
         'starting': 'Powering On VM..'
     }
-
-    vm_status = query_result[0].get('status')
-    vm_operation = query_result[0].get('operationFull', '').lower().split(' ')[0]
-    shortened_operation = cases.get(vm_operation, vm_operation + '..')
-
-    if 'running' not in vm_status:
-        shortened_operation = 'No running tasks'
-
-    return {'status': shortened_operation}
+    vm_operation = operation.lower().split(' ')[0]
+    return cases.get(vm_operation, vm_operation + '..')
 
 def poweron_vm_api(request, vapp_id, vm_id, vm_name):
     client = VMWareClientSingleton().client
@@ -591,24 +634,17 @@ def find_vm_by_ip(content, ip_address):
     """
     Find a VM by IP address.
 
+    The lookup is done by the vCenter search index from the guest IP addresses reported by
+    VMware Tools, instead of reading the IP address of every VM of the inventory.
+
     Parameters:
-    content (ServiceInstance): VMware service instance
+    content (ServiceContent): vSphere service content
     ip_address (str): IP address to search for
 
     Returns:
-    vim.VirtualApp: vApp containing the VM with the matching IP address, or None if not found
+    vim.VirtualMachine: The VM with the matching IP address, or None if not found
     """
-
-    # Create a view of all VMs
-    container_view = content.viewManager.CreateContainerView(
-        content.rootFolder, [vim.VirtualMachine], True)
-
-    for vm in container_view.view:
-        # Iterate through all network cards on the VM
-        if vm.guest.ipAddress == ip_address:
-            return vm
-
-    return None
+    return content.searchIndex.FindByIp(datacenter=None, ip=ip_address, vmSearch=True)
 
 def get_client_ip(request):
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
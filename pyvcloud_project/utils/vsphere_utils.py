@@ -1,67 +1,299 @@
 """
 This module provides functions for importing virtual machine storage details from vSphere to Redis.
 
+Storage is collected from every vCenter backing the Org VDCs at once, one thread per vCenter
+up to MAX_COLLECTORS. Each vCenter's result and timing are kept in the Redis hashes
+vsphere_vm_storage:vcenters and vsphere_vm_storage:stats, and the results are merged into
+vsphere_vm_storage. A vCenter that fails or does not answer within COLLECT_TIMEOUT keeps its
+last collected result, so it does not hold up or empty the import of the others. The
+collectors are daemon threads, so a vCenter that hangs past the timeout does not keep the
+process from exiting.
+
+Jobs that create or change a vApp call refresh_vapp_storage, which only collects the VMs of
+that vApp from the vCenter of its Org VDC and updates its entry in the results.
 """
 from collections import defaultdict
 import json
+import logging
+import queue
+import socket
+import threading
+import time
 import redis
+from django.db import connection
+from django.utils import timezone
 from pyVmomi import vim
-from pyVim.connect import SmartConnect
-from pyvcloud_project.models import AuthDetail
+from pyvcloud_project.models import AuthDetail, OrgVdcs
+from pyvcloud_project.vsphere_client import VSphereSessionManager, normalize_host
 
+logger = logging.getLogger(__name__)
 
-def import_vm_storage_from_vsphere(return_dict=False):
+VSPHERE_VM_STORAGE_KEY = 'vsphere_vm_storage'
+VCENTER_STORAGE_KEY = 'vsphere_vm_storage:vcenters'
+VCENTER_STATS_KEY = 'vsphere_vm_storage:stats'
+
+MAX_COLLECTORS = 4
+
+# Seconds the import waits for the slowest vCenter
+COLLECT_TIMEOUT = 1800
+
+
+def _resolve(host):
+    try:
+        return socket.gethostbyname(host)
+    except OSError:
+        return None
+
+
+def get_vcenter_hosts():
     """
-    Imports virtual machine storage details from vSphere and saves them to Redis.
+    Returns the vCenter hosts to collect storage from: the default vSphere host and the
+    vcenter of every Org VDC.
 
-    :param return_dict: Flag indicating whether to return the storage details as a dictionary.
-    :return: A string indicating the result of the import operation.
+    OrgVdcs.vcenter is resolved from the vCD href and may name the vCD cell or another alias
+    of a vCenter, so a host that resolves to the address of the vCD host or of a host already
+    listed is skipped, as is a host that does not resolve.
     """
-    auth_details = AuthDetail.objects.get(name='vsphere')
-    host = auth_details.host
-    user = auth_details.username
-    password = auth_details.password
-    conn = SmartConnect(host=host, user=user, pwd=password,
-                        disableSslCertValidation=True)
-    content = conn.content
+    default_host = VSphereSessionManager.default_host()
+    hosts = [default_host]
+    addresses = {_resolve(default_host)}
+    vcd = AuthDetail.objects.filter(name='vcd').first()
+    if vcd is not None:
+        addresses.add(_resolve(normalize_host(vcd.host)))
+
+    vcenters = {normalize_host(vcenter) for vcenter in OrgVdcs.objects.exclude(vcenter__isnull=True)
+                .exclude(vcenter='').values_list('vcenter', flat=True).distinct()}
+    for host in sorted(vcenters - {default_host}):
+        address = _resolve(host)
+        if address is None:
+            logger.warning(f'Skipping vCenter {host}, it does not resolve')
+        elif address not in addresses:
+            addresses.add(address)
+            hosts.append(host)
+    return hosts
+
+
+def _vm_storage(vm):
+    vm_commited_storage_per_datastore = defaultdict(int)
+    vm_provisioned_storage_per_datastore = defaultdict(int)
+    vm_attached_disk = {}
+    for device in vm.config.hardware.device:
+        if type(device).__name__ == 'vim.vm.device.VirtualDisk':
+            disk_name = device.deviceInfo.label
+            disk_size = device.deviceInfo.summary
+            disk_size = int(float(disk_size.replace(
+                ',', '').replace('KB', '').strip())/1024)
+            vm_attached_disk[disk_name] = disk_size
+    for datastore in vm.storage.perDatastoreUsage:
+        datastore_name = datastore.datastore.name
+        commited_storage_in_bytes = 0 if not datastore.committed else float(
+            datastore.committed)
+        provisioned_storage_in_bytes = commited_storage_in_bytes + \
+            0 if not datastore.uncommitted else commited_storage_in_bytes + \
+            float(datastore.uncommitted)
+        commited_storage_in_gb = int(
+            commited_storage_in_bytes / 1024 / 1024 / 1024)
+        provisioned_storage_in_gb = int(
+            provisioned_storage_in_bytes / 1024 / 1024 / 1024)
+        vm_commited_storage_per_datastore[datastore_name] = commited_storage_in_gb
+        vm_provisioned_storage_per_datastore[datastore_name] = provisioned_storage_in_gb
+    return {'datastore_committed': vm_commited_storage_per_datastore,
+            'datastore_provisioned': vm_provisioned_storage_per_datastore,
+            'diskinfo': vm_attached_disk}
+
+
+def _vm_parent_id(vm):
+    # vCD names the folder of a vApp's VMs '<vApp name> (<vApp uuid>)'
+    return vm.parent.name.split('(')[-1].split(')')[0]
+
+
+def collect_vcenter_storage(host):
+    """
+    Collects the storage details of the VMs of one vCenter.
+
+    :param host: The vCenter hostname.
+    :return: A dictionary of vApp id -> VM name -> storage details.
+    """
+    content = VSphereSessionManager.get().content(host)
     container = content.viewManager.CreateContainerView(
         content.rootFolder, [vim.Datastore], True)
-    vapp_vm_vsphere_dict = defaultdict(lambda: defaultdict(dict))
+    vapp_vm_vsphere_dict = defaultdict(dict)
     for ds in container.view:
         for vm in ds.vm:
-            vm_parent_name = vm.parent.name
-            vm_parent_id = vm_parent_name.split('(')[-1].split(')')[0]
-            vm_commited_storage_per_datastore = defaultdict(int)
-            vm_provisioned_storage_per_datastore = defaultdict(int)
             vm_name = vm.name.rsplit('-', 1)[0]
-            vm_attached_disk = {}
-            for device in vm.config.hardware.device:
-                if type(device).__name__ == 'vim.vm.device.VirtualDisk':
-                    disk_name = device.deviceInfo.label
-                    disk_size = device.deviceInfo.summary
-                    disk_size = int(float(disk_size.replace(
-                        ',', '').replace('KB', '').strip())/1024)
-                    vm_attached_disk[disk_name] = disk_size
-            for datastore in vm.storage.perDatastoreUsage:
-                datastore_name = datastore.datastore.name
-                commited_storage_in_bytes = 0 if not datastore.committed else float(
-                    datastore.committed)
-                provisioned_storage_in_bytes = commited_storage_in_bytes + \
-                    0 if not datastore.uncommitted else commited_storage_in_bytes + \
-                    float(datastore.uncommitted)
-                commited_storage_in_gb = int(
-                    commited_storage_in_bytes / 1024 / 1024 / 1024)
-                provisioned_storage_in_gb = int(
-                    provisioned_storage_in_bytes / 1024 / 1024 / 1024)
-                vm_commited_storage_per_datastore[datastore_name] = commited_storage_in_gb
-                vm_provisioned_storage_per_datastore[datastore_name] = provisioned_storage_in_gb
-            vapp_vm_vsphere_dict[vm_parent_id][vm_name]['datastore_committed'] = vm_commited_storage_per_datastore
-            vapp_vm_vsphere_dict[vm_parent_id][vm_name]['datastore_provisioned'] = vm_provisioned_storage_per_datastore
-            vapp_vm_vsphere_dict[vm_parent_id][vm_name]['diskinfo'] = vm_attached_disk
+            vapp_vm_vsphere_dict[_vm_parent_id(vm)][vm_name] = _vm_storage(vm)
+
+    return vapp_vm_vsphere_dict
+
+
+def collect_vapp_storage(host, vapp_uuid):
+    """
+    Collects the storage details of the VMs of one vApp.
+
+    :param host: The vCenter hostname.
+    :param vapp_uuid: The vApp uuid, without the urn:vcloud:vapp: prefix.
+    :return: A dictionary of VM name -> storage details.
+    """
+    content = VSphereSessionManager.get().content(host)
+    container = content.viewManager.CreateContainerView(
+        content.rootFolder, [vim.Folder], True)
+    vm_storage = {}
+    try:
+        for folder in container.view:
+            if not folder.name.endswith(f'({vapp_uuid})'):
+                continue
+            for vm in folder.childEntity:
+                if isinstance(vm, vim.VirtualMachine):
+                    vm_storage[vm.name.rsplit('-', 1)[0]] = _vm_storage(vm)
+    finally:
+        container.Destroy()
+    return vm_storage
 
+
+def vcenter_host(org_vdc):
+    """
+    Returns the vCenter host an Org VDC is collected from by import_vm_storage_from_vsphere,
+    the default vSphere host when its vcenter is not one of them.
+
+    :param org_vdc: The OrgVdcs object.
+    """
+    hosts = get_vcenter_hosts()
+    if org_vdc is not None and org_vdc.vcenter:
+        address = _resolve(normalize_host(org_vdc.vcenter))
+        for host in hosts:
+            if address is not None and _resolve(host) == address:
+                return host
+    return hosts[0]
+
+
+def refresh_vapp_storage(vapp_obj):
+    """
+    Collects the storage details of one vApp and updates its entry in Redis, leaving the
+    other vApps as they were last imported.
+
+    :param vapp_obj: The Vapps object.
+    :return: A string indicating the result of the refresh.
+    """
+    host = vcenter_host(vapp_obj.org_vdc_obj)
+    vapp_uuid = vapp_obj.vcd_id.split(':')[-1]
+    try:
+        vm_storage = _collect(host, collect_vapp_storage, vapp_uuid)[0]
+    except Exception as error:
+        logger.error(f'Unable to collect VM storage of vApp {vapp_obj.name} from vCenter {host}: {error}')
+        return f'VM storage details of vApp {vapp_obj.name} not refreshed'
+
+    def update(pipe):
+        # Re-read both documents under WATCH so a concurrent refresh or import is not lost
+        vcenter_storage = json.loads(pipe.hget(VCENTER_STORAGE_KEY, host) or '{}')
+        vapp_vm_vsphere_dict = json.loads(pipe.get(VSPHERE_VM_STORAGE_KEY) or '{}')
+        for storage in (vcenter_storage, vapp_vm_vsphere_dict):
+            if vm_storage:
+                storage[vapp_uuid] = vm_storage
+            else:
+                storage.pop(vapp_uuid, None)
+        pipe.multi()
+        pipe.hset(VCENTER_STORAGE_KEY, host, json.dumps(vcenter_storage))
+        pipe.set(VSPHERE_VM_STORAGE_KEY, json.dumps(vapp_vm_vsphere_dict))
+
+    redis.Redis().transaction(update, VCENTER_STORAGE_KEY, VSPHERE_VM_STORAGE_KEY)
+    logger.info(f'Refreshed storage of {len(vm_storage)} VMs of vApp {vapp_obj.name} from vCenter {host}')
+    return f'VM storage details of vApp {vapp_obj.name} saved to Redis'
+
+
+def _collect(host, collector=collect_vcenter_storage, *args):
+    started = time.monotonic()
+    try:
+        storage = collector(host, *args)
+    except Exception:
+        VSphereSessionManager.get().invalidate(host)
+        raise
+    finally:
+        # The credentials lookup opened a database connection for this thread
+        connection.close()
+    return storage, time.monotonic() - started
+
+
+def import_vm_storage_from_vsphere(return_dict=False):
+    """
+    Imports virtual machine storage details from every vCenter and saves them to Redis.
+
+    :param return_dict: Flag indicating whether to return the storage details as a dictionary.
+    :return: A string indicating the result of the import operation.
+    """
+    hosts = get_vcenter_hosts()
     redis_server = redis.Redis()
-    vapp_vm_sphere_json = json.dumps(vapp_vm_vsphere_dict)
-    redis_server.set('vsphere_vm_storage', vapp_vm_sphere_json)
+    previous = redis_server.hgetall(VCENTER_STORAGE_KEY)
+    results, stats = {}, {}
+    started = time.monotonic()
+    pending, finished = queue.Queue(), queue.Queue()
+    for host in hosts:
+        pending.put(host)
+
+    def collector():
+        while True:
+            try:
+                host = pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                finished.put((host, _collect(host), None))
+            except Exception as error:
+                finished.put((host, None, error))
+
+    # Daemon threads, a collection that hangs cannot be stopped but must not block exit
+    for number in range(min(MAX_COLLECTORS, len(hosts))):
+        threading.Thread(target=collector, name=f'vsphere-storage-{number}', daemon=True).start()
+    deadline = started + COLLECT_TIMEOUT
+    for _ in hosts:
+        try:
+            host, result, error = finished.get(timeout=max(deadline - time.monotonic(), 0))
+        except queue.Empty:
+            break
+        if error is not None:
+            logger.error(f'Unable to collect VM storage from vCenter {host}: {error}')
+            stats[host] = {'error': str(error)}
+            continue
+        storage, seconds = result
+        results[host] = json.dumps(storage)
+        stats[host] = {'seconds': round(seconds, 1), 'vapps': len(storage), 'error': ''}
+        logger.info(f'Collected storage of {len(storage)} vApps from vCenter {host} in {seconds:.1f}s')
+    # Drop the hosts still waiting for a collector
+    while not pending.empty():
+        try:
+            pending.get_nowait()
+        except queue.Empty:
+            break
+    for host in hosts:
+        if host not in stats:
+            logger.error(f'vCenter {host} did not answer within {COLLECT_TIMEOUT}s')
+            stats[host] = {'error': f'Timed out after {COLLECT_TIMEOUT}s'}
+
+    collected = timezone.now().isoformat()
+    vapp_vm_vsphere_dict = {}
+    for host in hosts:
+        if host in results:
+            stats[host]['collected'] = collected
+            vcenter_storage = results[host]
+        else:
+            vcenter_storage = previous.get(host.encode())
+        if vcenter_storage:
+            vapp_vm_vsphere_dict.update(json.loads(vcenter_storage))
+
+    pipeline = redis_server.pipeline()
+    if results:
+        pipeline.hset(VCENTER_STORAGE_KEY, mapping=results)
+    for host, host_stats in stats.items():
+        old_stats = json.loads(redis_server.hget(VCENTER_STATS_KEY, host) or '{}')
+        pipeline.hset(VCENTER_STATS_KEY, host, json.dumps(dict(old_stats, **host_stats)))
+    pipeline.set(VSPHERE_VM_STORAGE_KEY, json.dumps(vapp_vm_vsphere_dict))
+    pipeline.execute()
+
+    failed = sorted(host for host in hosts if host not in results)
+    logger.info(f'VM storage collected from {len(results)} of {len(hosts)} vCenters '
+                f'in {time.monotonic() - started:.1f}s')
     if return_dict:
         return vapp_vm_vsphere_dict
-    return 'VM storage details imported from vSphere and saved to Redis'
+    if failed:
+        return (f'VM storage details imported from {len(results)} of {len(hosts)} vCenters and saved to Redis, '
+                f'keeping the last details of {", ".join(failed)}')
+    return f'VM storage details imported from {len(hosts)} vCenters and saved to Redis'
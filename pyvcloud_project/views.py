@@ -3,10 +3,11 @@ This module contains views and utility functions for managing
 VMware Cloud Director Org VDCs, VApp templates etc.
 
 """
-import csv
 from enum import Enum
 from datetime import datetime
+import json
 import logging
+import time
 import base64
 from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib import auth, messages
@@ -18,18 +19,20 @@ from django.http import HttpResponseBadRequest, HttpResponseNotFound, HttpRespon
 from django.contrib.auth import authenticate
 from django.shortcuts import render, redirect
 from django.views.decorators.csrf import csrf_exempt
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from collections import defaultdict
 
 from pyvcloud.vcd.client import ResourceType
 from lxml import etree
 import bleach
-import os
+from rest_framework.authentication import SessionAuthentication, BasicAuthentication
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from pyvcloud_project import forms
 from pyvcloud_project.vmware_client import VMWareClientSingleton
-from pyvcloud_project.models import OrgVdcs, Catalogs, Groups, ProviderVdcs, SppUser, MigRas, Vapps, HistoricalReport
-from pyvcloud_project.utils import pyvcloud_utils as utils, group_utils, orgvdc_utils, vapp_utils, catalog_utils
+from pyvcloud_project.models import OrgVdcs, Catalogs, Groups, ProviderVdcs, SppUser, MigRas, Vapps, Vms, HistoricalReport, ReportSnapshot
+from pyvcloud_project.utils import pyvcloud_utils as utils, api_job_utils, group_utils, orgvdc_utils, vapp_utils, catalog_utils, export_utils, permission_utils, progress_utils, quota_utils, report_snapshot_utils, template_cache_utils
 
 logger = logging.getLogger(__name__)
 
@@ -46,179 +49,49 @@ def show_report(request):
     return render(request, 'Reports/report.html')
 
 def vapp_report(request):
-    client = VMWareClientSingleton().client
-    vapps_data = Vapps.objects.all()
-    vapp_info_list = vapp_utils.get_vapp_resource_info(client, vapps_data)
+    snapshot = report_snapshot_utils.get_snapshot(ReportSnapshot.ReportTypes.VAPP)
 
-    # Store the vapp_info_list in a session for download
-    request.session['vapp_info_list_for_download'] = vapp_info_list
-    context = {"vapp_info_list": vapp_info_list}
+    # Downloads refer to the snapshot the page was rendered from
+    context = {"vapp_info_list": report_snapshot_utils.load_rows(snapshot),
+               "snapshot": snapshot}
     return render(request, 'Reports/vapp_reports.html', context)
 
 def datacenter_vapp_report(request, datacenter_name):
-    client = VMWareClientSingleton().client
-    vapps_data = Vapps.objects.filter(org_vdc_obj__name=datacenter_name)
-    vapp_info_list = vapp_utils.get_vapp_resource_info(client, vapps_data)
+    snapshot = report_snapshot_utils.get_snapshot(ReportSnapshot.ReportTypes.VAPP, datacenter_name)
 
     context = {
-        "vapp_info_list": vapp_info_list,
+        "vapp_info_list": report_snapshot_utils.load_rows(snapshot),
         "datacenter_name": datacenter_name,
+        "snapshot": snapshot,
     }
-    # Store the datacenter_vapp_info for download
-    request.session['datacenter_vapp_info_list_for_download'] = vapp_info_list
     return render(request, 'Reports/vapp_reports.html', context)
 
 def download_vapp_csv(request):
-    vapp_info_list = request.session.get('vapp_info_list_for_download', [])
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="vapp_report.csv"'
-
-    csv_writer = csv.writer(response)
-    csv_writer.writerow([
-        'Datacenter Name',
-        'vApp Name',
-        'Status',
-        'Gateway',
-        'Created By',
-        'Creation Date',
-        'Running CPUs',
-        'Running Memory (GB)',
-        'Origin Catalog Name',
-        'Origin Template Name',
-    ])
-
-    for vapp_info in vapp_info_list:
-        csv_writer.writerow([
-            vapp_info['catalog_name'],
-            vapp_info['name'],
-            vapp_info['vapp_power_state'],
-            vapp_info['gateway'],
-            vapp_info['created_by'],
-            vapp_info['creation_date'],
-            vapp_info['running_cpu'],
-            vapp_info['running_memory'],
-            vapp_info['origin_catalog_name'],
-            vapp_info['origin_template_name'],
-        ])
-
-    return response
+    snapshot = report_snapshot_utils.find_snapshot(ReportSnapshot.ReportTypes.VAPP,
+                                                   request.GET.get('snapshot'))
+    return export_utils.export_response(request, export_utils.VAPP_REPORT_COLUMNS,
+                                        report_snapshot_utils.load_rows(snapshot), 'vapp_report')
 
 def datacenter_report(request):
-    org_vdcs = OrgVdcs.objects.all()
-    client = VMWareClientSingleton().client
-    datacenter_info = []
+    snapshot = report_snapshot_utils.get_snapshot(ReportSnapshot.ReportTypes.DATACENTER)
 
-    for org_vdc in org_vdcs:
-        orgvdc_id = org_vdc.org_vdc_id
-        running_vapps, *_ = orgvdc_utils.count_vapps(client, orgvdc_id)
-        total_cpu_on_count = 0
-        total_memory_on_count = 0
-        vapp_resources = orgvdc_utils.get_vapp_resources(client, orgvdc_id)
-
-        for vapp_info in vapp_resources.items():
-            vapp_data = vapp_info[1]
-            total_cpu_on_count += vapp_data.get('cpu_on_count')
-            total_memory_on_count += vapp_data.get('memory_on_count')
-
-        datacenter_info.append({
-            "datacenter_name": org_vdc.name,
-            "provider_name": org_vdc.provider_vdc_obj,
-            "running_cpus": total_cpu_on_count,
-            "running_cpus_quota": org_vdc.cpu_limit,
-            "unused_running_cpus_quota": (org_vdc.cpu_limit - total_cpu_on_count),
-            "running_memory_gb": total_memory_on_count,
-            "running_memory_quota_gb": org_vdc.memory_limit,
-            "unused_running_memory_quota_gb": (org_vdc.memory_limit - total_memory_on_count),
-            "running_vApps": running_vapps,
-            "running_vApps_quota": org_vdc.running_tb_limit,
-            "unused_running_vApps_quota": (org_vdc.running_tb_limit - running_vapps),
-            "total_vApps": len(vapp_resources),
-            "total_vApps_quota": org_vdc.stored_tb_limit,
-            "unused_total_vApps_quota": (org_vdc.stored_tb_limit - len(vapp_resources)),
-        })
-
-    # Store the datacenter_info for downlaod
-    request.session['datacenter_info_list_for_download'] = datacenter_info
-    context = {"datacenter_info": datacenter_info}
+    # Downloads refer to the snapshot the page was rendered from
+    context = {"datacenter_info": report_snapshot_utils.load_rows(snapshot),
+               "snapshot": snapshot}
     return render(request, 'Reports/datacenter_report.html', context)
 
 def download_datacenter_csv(request):
-    datacenter_info_list = request.session.get('datacenter_info_list_for_download', [])
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="datacenter_report.csv"'
-
-    csv_writer = csv.writer(response)
-    csv_writer.writerow([
-        'Datacenter Name',
-        'Provider Name',
-        'Running CPUs',
-        'Running CPUs Quota',
-        'Unused Running CPUs Quota',
-        'Running Memory (GB)',
-        'Running Memory Quota (GB)',
-        'Unused Running Memory Quota (GB)',
-        'Running vApps',
-        'Running vApps Quota',
-        'Unused Running vApps Quota',
-        'Total vApps',
-        'Total vApps Quota',
-        'Unused Total vApps Quota',
-    ])
-
-    for datacenter_info in datacenter_info_list:
-        csv_writer.writerow([
-            datacenter_info['datacenter_name'],
-            datacenter_info['provider_name'],
-            datacenter_info['running_cpus'],
-            datacenter_info['running_cpus_quota'],
-            datacenter_info['unused_running_cpus_quota'],
-            datacenter_info['running_memory_gb'],
-            datacenter_info['running_memory_quota_gb'],
-            datacenter_info['unused_running_memory_quota_gb'],
-            datacenter_info['running_vApps'],
-            datacenter_info['running_vApps_quota'],
-            datacenter_info['unused_running_vApps_quota'],
-            datacenter_info['total_vApps'],
-            datacenter_info['total_vApps_quota'],
-            datacenter_info['unused_total_vApps_quota'],
-        ])
-
-    return response
+    snapshot = report_snapshot_utils.find_snapshot(ReportSnapshot.ReportTypes.DATACENTER,
+                                                   request.GET.get('snapshot'))
+    return export_utils.export_response(request, export_utils.DATACENTER_REPORT_COLUMNS,
+                                        report_snapshot_utils.load_rows(snapshot), 'datacenter_report')
 
 def download_datacenter_vapp_csv(request, datacenter_name):
-    vapp_info_list = request.session.get('datacenter_vapp_info_list_for_download', [])
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="datacenter_vapp_report.csv"'
-
-    csv_writer = csv.writer(response)
-    csv_writer.writerow([
-        'Datacenter Name',
-        'vApp Name',
-        'Status',
-        'Gateway',
-        'Created By',
-        'Creation Date',
-        'Running CPUs',
-        'Running Memory (GB)',
-        'Origin Catalog Name',
-        'Origin Template Name',
-    ])
-
-    for vapp_info in vapp_info_list:
-        csv_writer.writerow([
-            vapp_info['catalog_name'],
-            vapp_info['name'],
-            vapp_info['vapp_power_state'],
-            vapp_info['gateway'],
-            vapp_info['created_by'],
-            vapp_info['creation_date'],
-            vapp_info['running_cpu'],
-            vapp_info['running_memory'],
-            vapp_info['origin_catalog_name'],
-            vapp_info['origin_template_name'],
-        ])
-
-    return response
+    snapshot = report_snapshot_utils.find_snapshot(ReportSnapshot.ReportTypes.VAPP,
+                                                   request.GET.get('snapshot'), datacenter_name)
+    return export_utils.export_response(request, export_utils.VAPP_REPORT_COLUMNS,
+                                        report_snapshot_utils.load_rows(snapshot),
+                                        'datacenter_vapp_report')
 
 def historical_reports(request):
     historical_reports_obj = HistoricalReport.objects.all()
@@ -233,14 +106,10 @@ def historical_reports(request):
     return render(request, 'Reports/historical_reports.html', context)
 
 def historical_report_download(request, reportName):
-    file_path = os.path.join('/opt/pycloudportal/HistoricalReports/', reportName)
-    if os.path.exists(file_path):
-        with open(file_path, 'rb') as file:
-            response = HttpResponse(file.read(), content_type='text/csv')
-            response['Content-Disposition'] = f'attachment; filename="{reportName}"'
-            return response
-    else:
-        messages.error(request, 'File not found!')
+    file_path = export_utils.historical_report_path(reportName)
+    if file_path:
+        return export_utils.file_response(request, file_path)
+    messages.error(request, 'File not found!')
 
     return render(request, 'Reports/report.html')
 
@@ -279,28 +148,11 @@ def org_vdc_index(request):
                               'OrgVdc Memory(GB)/CPU Ratio'] \
             + context['columns']
 
-    groups = Groups.objects.all().values('group_dn', 'org_vdc_obj',
-                                         'read_permission', 'org_obj')
-
-    spp_user = SppUser.objects.get(user=request.user)
-    context['org_vdcs'] = []
-    ldap_groups = utils.get_user_ldap_groups(spp_user)
-    if ldap_groups and not spp_user.is_superuser:
-        for org_vdc in org_vdcs:
-            if not org_vdc['mig_ra_obj__name']:
-                org_vdc['mig_ra_obj__name'] = 'None'
-            for group in groups:
-                group_cn = group.get('group_dn').split(',', 1)[0]
-                if group.get('org_vdc_obj') == org_vdc.get('id')\
-                    and group.get('read_permission')\
-                        and group_cn.lower() in ldap_groups.lower():
-                    context['org_vdcs'].append(org_vdc)
-                    break
-    elif spp_user.is_staff or spp_user.is_superuser:
-        for org_vdc in org_vdcs:
-            if not org_vdc['mig_ra_obj__name']:
-                org_vdc['mig_ra_obj__name'] = 'None'
-        context['org_vdcs'] = org_vdcs
+    acl = permission_utils.get_acl(request.user)
+    for org_vdc in org_vdcs:
+        if not org_vdc['mig_ra_obj__name']:
+            org_vdc['mig_ra_obj__name'] = 'None'
+    context['org_vdcs'] = [org_vdc for org_vdc in org_vdcs if acl.can_read(org_vdc['id'])]
     provider_vdc = ProviderVdcs.objects.all().values()
     orgvdc_utils.set_organisation_data(provider_vdc, org_vdcs)
 
@@ -402,10 +254,7 @@ def vapp_templates(request, catalog_name, org_name, api=False):
     """
 
     client = VMWareClientSingleton().client
-    resource_type = ResourceType.VAPP_TEMPLATE.value
-    fields = "name,status,creationDate,numberOfCpus,memoryAllocationMB"
-    qfilter = f"isExpired==false;catalogName=={catalog_name}"
-    templates = utils.send_typed_query(client, resource_type, fields, qfilter)
+    templates = template_cache_utils.get_catalog_templates(catalog_name, client)
 
     if not templates and api:
         msg = f"No templates found in the catalog '{catalog_name}'. Please check if the catalog name is correct and contains templates."
@@ -531,6 +380,7 @@ def vapp_templates_delete(request, vapp_template_id):
     href = client.get_api_uri() + VMwereAPI.VAPP_TEMPLATE.value + vapp_template_id
     try:
         client.delete_resource(href)
+        template_cache_utils.invalidate_template(vapp_template_id)
         messages.success(request, "Template is deleted")
     except Exception:
         messages.error(request, "Failed to delete vApp template")
@@ -655,19 +505,17 @@ def vapp_template_creation_post_request(request, vapp_template_id):
 
     """
     func_name = "Create_VApp_From_Template"
-    error = False
     sppuser = SppUser.objects.get(user=request.user)
     client = VMWareClientSingleton().client
 
-    query_result = get_vapp_template(client, vapp_template_id)
-    if not query_result:
+    template = get_vapp_template(client, vapp_template_id)
+    if not template:
         msg = f"Could not retrieve template from vmware for template id {vapp_template_id}"
         messages.error(request, msg)
         return redirect('catalogs')
 
-    templates = query_result[0]
-    catalog_name = templates[0].get("catalogName")
-    template_name = templates[0].get("name")
+    catalog_name = template.get("catalogName")
+    template_name = template.get("name")
     vapp_name = get_vapp_name(request)
     power_on = request.POST.get("poweron")
     orgvdc_name = request.POST.get("orgvdc")
@@ -684,28 +532,19 @@ def vapp_template_creation_post_request(request, vapp_template_id):
 
     orgvdc_obj = OrgVdcs.objects.select_related(
         'provider_vdc_obj').get(name=orgvdc_name)
-    orgvdc_id = orgvdc_obj.org_vdc_id
 
+    quota_reservation = None
     if orgvdc_obj.provider_vdc_obj.new_quota_system:
-        if power_on and not vapp_utils.allowed_power_on_vapp_resources(client, orgvdc_id, template_name):
-            messages.error(
-                request, f"Starting this vApp {vapp_name} would bring you over the running Resource (CPU/Memory) quota, please power off other vApps first")
-            error = True
-        elif not vapp_utils.allowed_poweron_another_vapp(client, orgvdc_id):
-            messages.error(
-                request, "Choosing to power on this new vApp would bring you over the running vApp quota, please power off other vApps first")
-            error = True
-        elif not vapp_utils.allowed_create_another_vapp(client, orgvdc_id):
-            messages.error(
-                request, f"Creating this vApp {vapp_name} would bring you over the Total vApps quota, please delete other vApps first")
-            error = True
-    if error:
-        return redirect('create_vapp_from_template', vapp_template_id)
+        try:
+            quota_reservation = vapp_utils.reserve_vapp_quota(client, orgvdc_obj, template, power_on)
+        except quota_utils.QuotaExceeded as exceeded:
+            messages.error(request, vapp_utils.quota_exceeded_message(exceeded.field, vapp_name))
+            return redirect('create_vapp_from_template', vapp_template_id)
 
     extra_params = {
         'org_vdc_id': orgvdc_obj.org_vdc_id, 'vapp_name': vapp_name, 'catalog_name': catalog_name,
         'template_name': template_name, 'power_on': power_on, 'org_vdc_name': orgvdc_name,
-        'sppuser': sppuser
+        'sppuser': sppuser, 'quota_reservation': quota_reservation
     }
 
     event_params = utils.create_event_params(
@@ -718,8 +557,13 @@ def vapp_template_creation_post_request(request, vapp_template_id):
         f'user: {request.user} vapp_name {vapp_name} vapp_template_name: {template_name} vapp_template_id: {vapp_template_id} \
         catalog_name {catalog_name} orgvdc_name: {orgvdc_name} orgvdc_id: {orgvdc_obj.org_vdc_id}')
 
-    utils.create_event_in_db(event_params)
-    vapp_utils.create_vapp_from_template.delay(event_params)
+    try:
+        utils.create_event_in_db(event_params)
+        vapp_utils.create_vapp_from_template.delay(event_params)
+    except Exception:
+        if quota_reservation:
+            quota_utils.release(orgvdc_obj.org_vdc_id, quota_reservation)
+        raise
     messages.success(
         request, f"Your vApp {vapp_name} is now being added to your cloud. You will receive an email when it's ready.")
     return redirect('catalogs')
@@ -734,20 +578,8 @@ def get_context(request):
     """
     context = {"orgvdcs": []}
     org_vdcs = OrgVdcs.objects.all().values("name", "org_vdc_id", "id")
-    groups = Groups.objects.all().values(
-        'group_dn', 'org_vdc_obj', 'write_permission', 'org_obj')
-    spp_user = SppUser.objects.get(user=request.user)
-    ldap_groups = utils.get_user_ldap_groups(spp_user)
-    if ldap_groups and not spp_user.is_superuser:
-        for org_vdc in org_vdcs:
-            for group in groups:
-                group_cn = group.get('group_dn').split(',', 1)[0]
-                if group.get('org_vdc_obj') == org_vdc.get('id') and \
-                   group.get('write_permission') and group_cn in ldap_groups:
-                    context['orgvdcs'].append(org_vdc)
-                    break
-    elif spp_user.is_staff or spp_user.is_superuser:
-        context['orgvdcs'] = org_vdcs
+    acl = permission_utils.get_acl(request.user)
+    context['orgvdcs'] = [org_vdc for org_vdc in org_vdcs if acl.can_write(org_vdc['id'])]
 
     return context
 
@@ -764,14 +596,11 @@ def get_vapp_name(request):
 
 def get_vapp_template(client, vapp_template_id):
     """
-    Retrieves the vApp template information from the VMware server based on the provided vApp template ID.
+    Retrieves the vApp template information from the template cache based on the provided vApp template ID.
     Returns:
         dict or None: The vApp template information if found, None otherwise.
     """
-    resource_type = ResourceType.VAPP_TEMPLATE.value
-    fields = 'catalogName,name'
-    qfilter = f"isExpired==false;id=={vapp_template_id}"
-    return utils.send_typed_query(client, resource_type, fields, qfilter)
+    return template_cache_utils.get_template(vapp_template_id, client)
 
 
 @require_http_methods(['GET'])
@@ -799,29 +628,8 @@ def catalogs(request):
     context = {}
     context['catalogs'] = None
     catalogs_db = Catalogs.objects.all().values("name", "org_obj__name", 'vcd_id')
-    sppuser = SppUser.objects.get(user=request.user)
-    sppuser_ldap_groups = utils.get_user_ldap_groups(sppuser)
-    groups = Groups.objects.all().values('group_dn', 'unrestricted',
-                                         'restrict_catalogs', 'org_obj__name')
-    allowed_catalogs = []
-
-    if not (sppuser.is_staff or sppuser.is_superuser):
-        for group in groups:
-            group_cn = group.get('group_dn').split(',', 1)[0]
-            if group_cn in sppuser_ldap_groups:
-                if group.get('restrict_catalogs'):
-                    restricted_catalog_ids = group.get(
-                        'unrestricted').split(',')
-                    allowed_catalogs.extend(restricted_catalog_ids)
-                else:
-                    group_org_name = group.get('org_obj__name')
-                    allowed_catalogs.extend([catalog.get('vcd_id') for catalog in catalogs_db if catalog.get(
-                        'org_obj__name') == group_org_name])
-        if allowed_catalogs:
-            context['catalogs'] = [catalog for catalog in catalogs_db if catalog.get(
-                'vcd_id') in allowed_catalogs]
-    else:
-        context['catalogs'] = catalogs_db
+    acl = permission_utils.get_acl(request.user)
+    context['catalogs'] = acl.filter_catalogs(catalogs_db)
     if not context['catalogs']:
         messages.error(request, 'No catalogs were found')
     return render(request, 'catalogs.html', context)
@@ -1215,3 +1023,109 @@ def save_provider_vdc(request):
         provider_vdc.save()
 
     return redirect('ProviderVdcs')
+
+
+# Progress endpoints, served by mod_wsgi. The daemon process has 15 threads by default, and a
+# request holds one until it returns. progress_poll never waits, clients call it again every
+# PROGRESS_POLL_INTERVAL seconds. The optional SSE stream holds a thread while it is open, so
+# at most PROGRESS_MAX_STREAMS are open at once, each for at most PROGRESS_STREAM_DURATION, and
+# further stream requests get 503 and should poll instead.
+
+PROGRESS_POLL_INTERVAL = 3
+PROGRESS_STREAM_DURATION = 10
+PROGRESS_KEEPALIVE = 5
+PROGRESS_MAX_STREAMS = 4
+
+
+def _can_watch_progress(user, resource_id):
+    """
+    Returns True if a user may watch the progress of a vApp, VM or API job.
+    """
+    if user.is_staff or user.is_superuser:
+        return True
+    org_vdc_pk = Vapps.objects.filter(vcd_id=resource_id).values_list('org_vdc_obj', flat=True).first() or \
+        Vms.objects.filter(vcd_id=resource_id).values_list('vapp_obj__org_vdc_obj', flat=True).first()
+    if org_vdc_pk:
+        return permission_utils.get_acl(user).can_read(org_vdc_pk)
+    job = api_job_utils.get_job(resource_id)
+    return bool(job) and job['user_id'] == str(user.pk)
+
+
+def _sse_event(event):
+    return f"id: {event['id']}\nevent: progress\ndata: {json.dumps(event)}\n\n"
+
+
+# EventSource authenticates with the session cookie, and DRF content negotiation would
+# refuse its text/event-stream Accept header, so the stream only takes a session
+@login_required(login_url='user_login')
+def progress_stream(request, resource_id):
+    """
+    Streams the progress events of a vApp, VM or API job as server-sent events.
+
+    Events after the Last-Event-ID header (or the since parameter) are sent first, then new
+    events as they are published. The stream is a plain generator served by the WSGI
+    application, so it holds a web server thread while it is open. It therefore closes after
+    PROGRESS_STREAM_DURATION, and the browser reconnects from the last event it received.
+    When PROGRESS_MAX_STREAMS are already open it answers 503, see progress_poll.
+    """
+    if not _can_watch_progress(request.user, resource_id):
+        return HttpResponseNotFound(f'Resource {resource_id} not found')
+    if not progress_utils.open_stream(PROGRESS_MAX_STREAMS, PROGRESS_STREAM_DURATION):
+        response = HttpResponse('Too many progress streams are open, poll the progress instead',
+                                status=503)
+        response['Retry-After'] = PROGRESS_POLL_INTERVAL
+        return response
+    since = request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('since')
+    if not progress_utils.is_event_id(since):
+        latest = progress_utils.latest_event(resource_id)
+        since = latest['id'] if latest else '0-0'
+
+    def events():
+        cursor = since
+        try:
+            yield f'retry: {PROGRESS_POLL_INTERVAL * 1000}\n\n'
+            deadline = time.monotonic() + PROGRESS_STREAM_DURATION
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                new_events = progress_utils.wait_for_events(resource_id, cursor,
+                                                            min(remaining, PROGRESS_KEEPALIVE))
+                if not new_events:
+                    yield ': keepalive\n\n'
+                    continue
+                for event in new_events:
+                    yield _sse_event(event)
+                cursor = new_events[-1]['id']
+        finally:
+            progress_utils.close_stream()
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@api_view(['GET'])
+@authentication_classes([SessionAuthentication, BasicAuthentication])
+@permission_classes([IsAuthenticated])
+def progress_poll(request, resource_id):
+    """
+    Returns the progress events of a vApp, VM or API job without waiting.
+
+    Returns the events after the since parameter, or only the latest event without since.
+    Clients call it again with the returned last_id every poll_interval seconds.
+    """
+    if not _can_watch_progress(request.user, resource_id):
+        return HttpResponseNotFound(f'Resource {resource_id} not found')
+    since = request.GET.get('since')
+    if progress_utils.is_event_id(since):
+        events = progress_utils.read_events(resource_id, since)
+    else:
+        since = None
+        latest = progress_utils.latest_event(resource_id)
+        events = [latest] if latest else []
+
+    last_id = events[-1]['id'] if events else since
+    return Response({'resource_id': resource_id, 'events': events, 'last_id': last_id,
+                     'poll_interval': PROGRESS_POLL_INTERVAL})
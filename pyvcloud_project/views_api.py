@@ -3,12 +3,16 @@ This module contains API views for retrieving information from VMware Cloud Dire
 """
 
 import logging
+from datetime import timedelta
 from django.http import HttpResponseBadRequest, HttpResponse
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.authentication import SessionAuthentication, BasicAuthentication
 from rest_framework.permissions import IsAuthenticated
+from django.utils import timezone
 from . import views
+from .models import OrgVdcs, Vapps
+from .utils import capacity_history_utils, permission_utils
 import xml.etree.ElementTree as ET
 
 logger = logging.getLogger(__name__)
@@ -256,3 +260,80 @@ def get_templates_from_catalog_xml(request, catalog_name):
     xml_response = b'<?xml version="1.0" encoding="UTF-8"?>' + xml_string
 
     return HttpResponse(xml_response, content_type='application/xml')
+
+
+def _trend_window(request):
+    """
+    Reads the period and the number of days of a trend request. The days are clamped to the
+    history the period keeps.
+    """
+    period = request.GET.get('period', 'day')
+    days = min(max(int(request.GET.get('days', 90)), 1), capacity_history_utils.max_trend_days(period))
+    return period, timezone.now() - timedelta(days=days)
+
+
+@api_view(['GET'])
+@authentication_classes([SessionAuthentication, BasicAuthentication])
+@permission_classes([IsAuthenticated])
+def get_vdc_capacity_trend(request, datacenter_name, metric):
+    """
+    Retrieves the capacity trend of an org VDC from the capacity history.
+
+    Parameters:
+        - datacenter_name: The name of the org VDC.
+        - metric: running_cpus, running_memory_gb, running_vapps or total_vapps.
+        - period (query): hour, day (default) or week.
+        - days (query): How many days back to go, 90 by default.
+
+    Returns:
+        A list of dictionaries with the average and peak of the metric per period.
+    """
+    logger.info("Rest Call Received: Retrieving %s trend of %s", metric, datacenter_name)
+    org_vdc = OrgVdcs.objects.filter(name=datacenter_name).first()
+    if org_vdc is None or not permission_utils.get_acl(request.user).can_read(org_vdc.id):
+        return Response({'message': f'Org VDC {datacenter_name} not found'}, status=404)
+    try:
+        period, since = _trend_window(request)
+        series = capacity_history_utils.vdc_trend(org_vdc.org_vdc_id, metric, period, since)
+    except ValueError as error:
+        return Response({'message': f'Error {error}'}, status=400)
+
+    return Response({'message': f'{metric} trend of {datacenter_name} retrieved successfully',
+                     'period': period, 'series': series})
+
+
+@api_view(['GET'])
+@authentication_classes([SessionAuthentication, BasicAuthentication])
+@permission_classes([IsAuthenticated])
+def get_vapp_capacity_trend(request, vapp_vcd_id, metric):
+    """
+    Retrieves the capacity trend of a vApp from the capacity history.
+
+    Parameters:
+        - vapp_vcd_id: The vApp id.
+        - metric: running_cpu or running_memory.
+        - period (query): hour, day (default) or week.
+        - days (query): How many days back to go, 90 by default.
+
+    Returns:
+        A list of dictionaries with the average and peak of the metric and the share of
+        samples the vApp was powered on, per period.
+    """
+    logger.info("Rest Call Received: Retrieving %s trend of vApp %s", metric, vapp_vcd_id)
+    org_vdc_pk = Vapps.objects.filter(vcd_id=vapp_vcd_id).values_list('org_vdc_obj', flat=True).first()
+    if org_vdc_pk is None:
+        # A deleted vApp is checked against the org VDC its history was recorded in
+        org_vdc_id = capacity_history_utils.vapp_org_vdc_id(vapp_vcd_id)
+        org_vdc_pk = OrgVdcs.objects.filter(org_vdc_id=org_vdc_id).values_list('pk', flat=True).first() \
+            if org_vdc_id else None
+    # Without an org VDC only users that may read every org VDC see the history
+    if not permission_utils.get_acl(request.user).can_read(org_vdc_pk):
+        return Response({'message': f'vApp {vapp_vcd_id} not found'}, status=404)
+    try:
+        period, since = _trend_window(request)
+        series = capacity_history_utils.vapp_trend(vapp_vcd_id, metric, period, since)
+    except ValueError as error:
+        return Response({'message': f'Error {error}'}, status=400)
+
+    return Response({'message': f'{metric} trend of vApp {vapp_vcd_id} retrieved successfully',
+                     'period': period, 'series': series})
@@ -0,0 +1,218 @@
+"""
+This module provides the vSphere sessions shared by the pyVmomi callers of a process.
+
+The VSphereSessionManager keeps one logged in service instance per vCenter host, so requests
+and jobs reuse a session instead of paying a TLS handshake and a login on every call and
+leaving the session behind on vCenter. A session that has been idle for KEEPALIVE_INTERVAL is
+checked with SessionManager.SessionIsActive before it is handed out, and logged in again if
+vCenter has expired it. At most MAX_SESSIONS are kept; the least recently used one is logged
+out to make room, and every session is logged out when the process exits.
+
+A forked rq work horse inherits the sessions of the worker parent and exits without running
+atexit, so the parent checks its sessions before every fork (see refresh) and the horse logs
+out the sessions it logged in itself when its job ends (see disconnect_owned).
+
+The vCenter hosts are the host of AuthDetail(name='vsphere'), which is the default, and the
+vcenter of the Org VDCs. A host is logged in to with the AuthDetail that has its host, or
+else with the username and password of AuthDetail(name='vsphere').
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pyVim.connect import SmartConnect, Disconnect
+from pyVmomi import vim, vmodl
+from pyvcloud_project.models import AuthDetail
+
+logger = logging.getLogger(__name__)
+
+MAX_SESSIONS = 10
+
+# Seconds a session may stay unused before it is checked with SessionIsActive
+KEEPALIVE_INTERVAL = 60
+
+
+def normalize_host(host):
+    """
+    Returns the hostname of a vCenter host or URL, e.g. https://vcenter1.example.com/sdk.
+    """
+    host = (host or '').strip().lower()
+    host = host.replace('https://', '').replace('http://', '')
+    return host.split('/')[0]
+
+
+class VSphereSession:
+    """
+    A logged in service instance of one vCenter host.
+    """
+
+    def __init__(self, host, service_instance):
+        self.host = host
+        self.service_instance = service_instance
+        self.last_used = time.monotonic()
+        # The process that logged in, which is the one to log out
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+
+    @property
+    def content(self):
+        return self.service_instance.content
+
+    def is_alive(self):
+        try:
+            session_manager = self.content.sessionManager
+            session = session_manager.currentSession
+            if session is None:
+                return False
+            try:
+                return session_manager.SessionIsActive(session.key, session.userName)
+            except vim.fault.NoPermission:
+                # The user may not validate sessions, currentSession answered so it is alive
+                return True
+        except (vmodl.MethodFault, OSError, AttributeError):
+            return False
+
+    def disconnect(self):
+        try:
+            Disconnect(self.service_instance)
+        except (vmodl.MethodFault, OSError):
+            pass
+
+
+class VSphereSessionManager:
+    """
+    Hands out the vSphere session of a vCenter host, logging in when there is none.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+
+    @classmethod
+    def get(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    @staticmethod
+    def default_host():
+        return normalize_host(AuthDetail.objects.get(name='vsphere').host)
+
+    @staticmethod
+    def _credentials(host):
+        auth_details = AuthDetail.objects.filter(host__iexact=host).exclude(name='vcd').first()
+        if auth_details is None:
+            auth_details = AuthDetail.objects.get(name='vsphere')
+        return auth_details.username, auth_details.password
+
+    def _session(self, host):
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = self._sessions[host] = VSphereSession(host, None)
+            self._sessions.move_to_end(host)
+            evicted = []
+            while len(self._sessions) > MAX_SESSIONS:
+                evicted.append(self._sessions.popitem(last=False)[1])
+        for old_session in evicted:
+            if old_session.service_instance is not None:
+                logger.info(f'Logging out of vCenter {old_session.host} to stay within {MAX_SESSIONS} sessions')
+                old_session.disconnect()
+        return session
+
+    def service_instance(self, host=None):
+        """
+        Returns the service instance of a vCenter host.
+
+        Args:
+            host: str: The vCenter hostname or URL, the host of AuthDetail(name='vsphere')
+                if not given.
+
+        Returns:
+            vim.ServiceInstance: A logged in service instance.
+        """
+        host = normalize_host(host) or self.default_host()
+        session = self._session(host)
+        with session.lock:
+            now = time.monotonic()
+            if session.service_instance is not None and now - session.last_used > KEEPALIVE_INTERVAL \
+                    and not session.is_alive():
+                logger.info(f'vCenter session of {host} has expired')
+                session.service_instance = None
+            if session.service_instance is None:
+                username, password = self._credentials(host)
+                logger.info(f'Connecting to vCenter {host}')
+                session.service_instance = SmartConnect(host=host, user=username, pwd=password,
+                                                        disableSslCertValidation=True)
+                session.pid = os.getpid()
+            session.last_used = now
+            return session.service_instance
+
+    def content(self, host=None):
+        return self.service_instance(host).content
+
+    def invalidate(self, host=None):
+        """
+        Drops the session of a host after a call failed with NotAuthenticated.
+        """
+        host = normalize_host(host) or self.default_host()
+        with self._lock:
+            session = self._sessions.pop(host, None)
+        if session is not None and session.service_instance is not None:
+            session.disconnect()
+
+    def refresh(self):
+        """
+        Checks every session of the process, logging in again to the hosts whose session
+        has expired, so that a process forked next inherits live sessions.
+        """
+        with self._lock:
+            hosts = [host for host, session in self._sessions.items()
+                     if session.service_instance is not None]
+        for host in hosts:
+            try:
+                self.service_instance(host)
+            except Exception as ex:
+                logger.warning(f'Unable to refresh the vCenter session of {host}: {ex}')
+
+    def disconnect_owned(self):
+        """
+        Logs out the sessions this process logged in itself and forgets them, leaving the
+        sessions inherited from a parent process to the parent.
+        """
+        pid = os.getpid()
+        with self._lock:
+            owned = [host for host, session in self._sessions.items()
+                     if session.service_instance is not None and session.pid == pid]
+            sessions = [self._sessions.pop(host) for host in owned]
+        for session in sessions:
+            session.disconnect()
+
+    def drop_connections(self):
+        """
+        Closes the sockets of every session while keeping the sessions logged in, so that a
+        forked process opens its own connections with the inherited session cookies.
+        """
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            stub = getattr(session.service_instance, '_stub', None)
+            if stub is not None and hasattr(stub, 'DropConnections'):
+                stub.DropConnections()
+
+    def disconnect_all(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            if session.service_instance is not None:
+                session.disconnect()
+
+
+atexit.register(lambda: VSphereSessionManager.get().disconnect_all())
@@ -0,0 +1,141 @@
+"""
+This module provides long-lived rq worker classes for the SPP job queues.
+
+The stock rq worker imports the job module, logs in to vCD and opens a new
+database connection inside every forked work horse, so each job pays for
+loading pyvcloud/pyVmomi/lxml and a full vCD login before doing any work.
+
+WarmWorker warms the parent process once (heavy imports, job modules, the
+VMWareClientSingleton session and the default vSphere session) and then forks a
+work horse per job. The horse inherits the warm interpreter, vCD auth token and
+vSphere session cookie through copy-on-write, while a crashing or timed-out job
+still only takes down its own horse. The parent checks its vSphere sessions
+before every fork, logging in again when vCenter has expired one, so horses do
+not each log in on their own; a session a horse does log in is logged out when
+its job ends, since the horse exits without running atexit.
+
+The parent closes its database connections before every fork, so a horse always
+opens a new connection of its own.
+
+WarmSimpleWorker runs jobs in-process on the same warm interpreter, reusing
+the vCD session between jobs. It trades
+crash and job timeout isolation for the lowest per-job overhead, so the
+supervisord queues run WarmWorker and WarmSimpleWorker is only for queues whose
+jobs are short and trusted.
+
+Usage:
+    python manage.py rqworker default --worker-class pyvcloud_project.worker.WarmWorker
+"""
+
+import importlib
+import logging
+from django.db import close_old_connections, connections
+from rq import SimpleWorker, Worker
+
+logger = logging.getLogger(__name__)
+
+# Modules imported once in the worker parent so that job execution never
+# pays the import cost again.
+PRELOAD_MODULES = (
+    'lxml.etree',
+    'pyVmomi',
+    'pyvcloud.vcd.client',
+    'pyvcloud.vcd.vapp',
+    'pyvcloud.vcd.vm',
+    'pyvcloud.vcd.vdc',
+    'pyvcloud.vcd.org',
+    'pyvcloud_project.utils.pyvcloud_utils',
+    'pyvcloud_project.utils.vapp_utils',
+    'pyvcloud_project.utils.vm_utils',
+    'pyvcloud_project.utils.vsphere_utils',
+)
+
+
+def warm_up():
+    """
+    Pre-import the job dependencies and open the shared vCD and vSphere sessions.
+
+    Failures are logged rather than raised so a temporarily unreachable vCD
+    does not stop the worker from starting; the singleton logs in again on
+    first use.
+    """
+    for module in PRELOAD_MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError as ex:
+            logger.warning(f'Unable to preload {module}: {ex}')
+
+    try:
+        from pyvcloud_project.vmware_client import VMWareClientSingleton
+        VMWareClientSingleton()
+    except Exception as ex:
+        logger.warning(f'Unable to warm vCD session: {ex}')
+
+    try:
+        from pyvcloud_project.vsphere_client import VSphereSessionManager
+        VSphereSessionManager.get().service_instance()
+    except Exception as ex:
+        logger.warning(f'Unable to warm vSphere session: {ex}')
+
+
+def drop_inherited_sockets():
+    """
+    Close sockets that must not be shared between the parent and a forked horse.
+
+    Database connections are closed so each process opens its own, and the
+    vCD HTTP connection pool is emptied while keeping the session headers, so
+    the horse reuses the existing auth token over a fresh connection. The
+    vSphere sessions drop their connections the same way.
+    """
+    connections.close_all()
+    try:
+        from pyvcloud_project.vmware_client import VMWareClientSingleton
+        session = getattr(VMWareClientSingleton.client, '_session', None)
+        if session is not None:
+            session.close()
+    except AttributeError:
+        pass
+    from pyvcloud_project.vsphere_client import VSphereSessionManager
+    VSphereSessionManager.get().drop_connections()
+
+
+class WarmWorker(Worker):
+    """
+    Forking rq worker that keeps a warm parent process.
+    """
+
+    def work(self, *args, **kwargs):
+        warm_up()
+        return super().work(*args, **kwargs)
+
+    def fork_work_horse(self, job, queue):
+        from pyvcloud_project.vsphere_client import VSphereSessionManager
+        VSphereSessionManager.get().refresh()
+        drop_inherited_sockets()
+        return super().fork_work_horse(job, queue)
+
+    def perform_job(self, job, queue):
+        # Only called in the work horse
+        try:
+            return super().perform_job(job, queue)
+        finally:
+            from pyvcloud_project.vsphere_client import VSphereSessionManager
+            VSphereSessionManager.get().disconnect_owned()
+
+
+class WarmSimpleWorker(SimpleWorker):
+    """
+    In-process rq worker that reuses the vCD session.
+    """
+
+    def work(self, *args, **kwargs):
+        warm_up()
+        return super().work(*args, **kwargs)
+
+    def execute_job(self, job, queue):
+        # Close the database connection around each job the same way a request would.
+        close_old_connections()
+        try:
+            return super().execute_job(job, queue)
+        finally:
+            close_old_connections()
@@ -1,60 +1,196 @@
 """
-This module provides a RetryIntervalLimits class that retrieves retry intervals
-for different operations.
+This module provides the retry policy registry used to enqueue worker jobs.
 
-The RetryIntervalLimits class retrieves retry intervals from the RetryInterval model
-in the SPP. It initializes class attributes for various operations,
-such as starting a vApp, stopping a vApp, powering off a vApp, deleting a vApp, and more.
+Retry policies (queue, job timeout, retry count and interval) are stored in the
+RetryInterval model in the SPP. Rather than reading them once at import time,
+the RetryPolicyRegistry keeps an in-memory copy of every policy and compares it
+against a version stamp held in Redis. Saving or deleting a RetryInterval bumps
+the stamp, and every process reloads the table on its next lookup, so policy
+changes take effect without restarting the web server or the workers.
 
-If the RetryInterval model is not available (e.g., during initial migrations),
-default retry intervals are used.
+Job functions are decorated with policy_job, which resolves the queue, timeout
+and retry settings when the job is enqueued instead of when the module is
+imported, and publishes the queued and started progress events of the job.
+Every job function is registered under its dotted path, so jobs can be enqueued
+later by name (see job_group_utils).
+
+If the RetryInterval table is not available (e.g., during initial migrations),
+default retry policies are used.
 
 """
 
+import functools
+import random
+import threading
 from collections import namedtuple
-from django.db.utils import OperationalError
-from rq import Retry
+import django_rq
+from django.db.utils import OperationalError, ProgrammingError
+from redis.exceptions import RedisError
+from rq import Retry, get_current_job
 from pyvcloud_project.models import RetryInterval
+from pyvcloud_project.utils import progress_utils
+
+POLICY_VERSION_KEY = 'retry_policy_version'
+
+# Fraction of each backoff interval added as random jitter
+BACKOFF_JITTER = 0.25
+
+RetryPolicy = namedtuple('RetryPolicy', ['queue', 'timeout', 'max_retries', 'retry_interval',
+                                         'backoff', 'max_interval'])
+
+VAPP_DEFAULT_POLICY = RetryPolicy('default', 1800, 3, 30, False, 600)
+VM_DEFAULT_POLICY = RetryPolicy('default', 593, 3, 30, False, 600)
+REPORT_DEFAULT_POLICY = RetryPolicy('low', 1800, 0, 60, False, 600)
+
+# Policies that share the settings of another policy
+POLICY_ALIASES = {
+    'rename_vapp_template': 'rename_vapp',
+    'recompose_vapp': 'create_from_template_vapp',
+}
+
+# Dotted job path -> policy job, filled in as the job modules are imported
+REGISTERED_JOBS = {}
+
+# Policies used before migrations have created the RetryInterval table. Once the table
+# exists, a policy without a row gets VAPP_DEFAULT_POLICY, as RetryInterval rows always did.
+DEFAULT_POLICIES = {
+    'power_on_vm': VM_DEFAULT_POLICY,
+    'power_off_vm': VM_DEFAULT_POLICY,
+    'reboot_vm': VM_DEFAULT_POLICY,
+    'shutdown_vm': VM_DEFAULT_POLICY,
+    'delete_vm': VM_DEFAULT_POLICY,
+    'rebuild_report_snapshot': REPORT_DEFAULT_POLICY,
+}
+
+
+class RetryPolicyRegistry:
+    """
+    In-memory cache of the RetryInterval table, versioned through Redis.
+    """
+    _lock = threading.Lock()
+    _policies = None
+    _table_missing = False
+    _version = None
+
+    @staticmethod
+    def _redis():
+        return django_rq.get_connection('default')
+
+    @classmethod
+    def _current_version(cls):
+        try:
+            return cls._redis().get(POLICY_VERSION_KEY)
+        except RedisError:
+            # Without Redis keep serving the cached policies
+            return cls._version
+
+    @classmethod
+    def _load(cls):
+        try:
+            return {
+                row.name: RetryPolicy(row.queue, row.job_timeout, row.max_retries,
+                                      row.retry_interval, row.backoff, row.max_interval)
+                for row in RetryInterval.objects.all()
+            }
+        except (OperationalError, ProgrammingError):
+            # On first run, before migrations have been properly set up.
+            return None
 
+    @classmethod
+    def get(cls, name):
+        """
+        Return the RetryPolicy for the given name, reloading the table if the
+        version stamp in Redis has changed since it was last read.
+        """
+        version = cls._current_version()
+        with cls._lock:
+            if cls._policies is None or version != cls._version:
+                policies = cls._load()
+                cls._policies = {} if policies is None else policies
+                cls._table_missing = policies is None
+                cls._version = version
+            policies = cls._policies
+            table_missing = cls._table_missing
+        name = POLICY_ALIASES.get(name, name)
+        if name in policies:
+            return policies[name]
+        return DEFAULT_POLICIES.get(name, VAPP_DEFAULT_POLICY) if table_missing else VAPP_DEFAULT_POLICY
+
+    @classmethod
+    def invalidate(cls):
+        """
+        Bump the version stamp so every process reloads the policies.
+        """
+        with cls._lock:
+            cls._policies = None
+        try:
+            cls._redis().incr(POLICY_VERSION_KEY)
+        except RedisError:
+            pass
+
+
+def get_retry(policy):
+    """
+    Build the rq Retry object for a policy.
+
+    With backoff enabled the interval doubles on every attempt, capped at
+    max_interval, with up to BACKOFF_JITTER of random jitter added so retries
+    of jobs that failed together do not hit vCD at the same time.
+    """
+    if not policy.backoff:
+        return Retry(max=policy.max_retries, interval=policy.retry_interval)
+    intervals = []
+    for attempt in range(policy.max_retries):
+        interval = min(policy.retry_interval * 2 ** attempt, policy.max_interval)
+        intervals.append(int(interval + random.uniform(0, interval * BACKOFF_JITTER)))
+    return Retry(max=policy.max_retries, interval=intervals)
+
+
+def job_path(job):
+    """
+    Return the dotted path a policy job is registered under.
+    """
+    return f'{job.__module__}.{job.__name__}'
+
+
+def policy_job(policy_name, on_success=None, on_failure=None):
+    """
+    Decorator turning a function into an rq job whose queue, timeout and retry
+    settings are looked up in the RetryPolicyRegistry on every enqueue.
+
+    The decorated function keeps a delay() method with the same behaviour as the
+    django_rq job decorator, which also takes the job_id to enqueue the job under. The policy retry count is stored in job.meta so the
+    completion callbacks do not have to look the policy up again. The job
+    parameters (the first argument) are used to publish its progress events.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def job(params, *args, **kwargs):
+            # Called synchronously there is no rq job whose start could be followed
+            if get_current_job() is not None:
+                progress_utils.publish(params, progress_utils.STARTED)
+            return func(params, *args, **kwargs)
 
-class RetryIntervalLimits:
-    """
-    Class representing retry interval limits for different operations.
-    The RetryIntervalLimits class retrieves retry interval limits for various operations,
-    such as starting a vApp, stopping a vApp, powering off a vApp, deleting a vApp, and more.
-    """
-    try:
-        start_vapp = RetryInterval.objects.get_retry_obj('start_vapp')
-        stop_vapp = RetryInterval.objects.get_retry_obj('stop_vapp')
-        poweroff_vapp = RetryInterval.objects.get_retry_obj('poweroff_vapp')
-        delete_vapp = RetryInterval.objects.get_retry_obj('delete_vapp')
-        poweroff_and_delete_vapp = RetryInterval.objects.get_retry_obj(
-            'poweroff_and_delete_vapp')
-        rename_vapp = RetryInterval.objects.get_retry_obj('rename_vapp')
-        rename_vapp_template = RetryInterval.objects.get_retry_obj(
-            'rename_vapp')
-        add_to_catalog_vapp = RetryInterval.objects.get_retry_obj(
-            'add_to_catalog_vapp')
-        create_from_template_vapp = RetryInterval.objects.get_retry_obj(
-            'create_from_template_vapp')
-        recompose_vapp = RetryInterval.objects.get_retry_obj(
-            'create_from_template_vapp')
-        power_on_vm = RetryInterval.objects.get_retry_obj('power_on_vm')
-        power_off_vm = RetryInterval.objects.get_retry_obj('power_off_vm')
-        reboot_vm = RetryInterval.objects.get_retry_obj('reboot_vm')
-        shutdown_vm = RetryInterval.objects.get_retry_obj('shutdown_vm')
-        delete_vm = RetryInterval.objects.get_retry_obj('delete_vm')
-    except OperationalError:
-        # On first run, before migrations have been properly set up.
-        # This can throw an operational error as the table has not been created yet.
-        # Once migrations have been applied, this code is no longer used.
-        retry_tuple = namedtuple('RetryInterval', ['args', 'kwargs'])
-        start_vapp = stop_vapp = poweroff_vapp = delete_vapp = poweroff_and_delete_vapp = \
-            rename_vapp = rename_vapp_template = add_to_catalog_vapp = recompose_vapp = \
-            create_from_template_vapp = retry_tuple(
-                'default', {'connection': None, 'timeout': 1800,
-                            'retry': Retry(max=3, interval=30)}
-            )
-
-        power_on_vm = power_off_vm = reboot_vm = shutdown_vm = delete_vm = retry_tuple(
-            'default', {'connection': None, 'timeout': 593, 'retry': Retry(max=3, interval=30)})
+        def delay(*args, job_id=None, **kwargs):
+            # The job id given to the Start event by create_event_in_db
+            if job_id is None and args and isinstance(args[0], dict):
+                job_id = args[0].get('job_id') or None
+            policy = RetryPolicyRegistry.get(policy_name)
+            queue = django_rq.get_queue(policy.queue)
+            enqueued_job = queue.enqueue_call(job, args=args, kwargs=kwargs,
+                                              job_id=job_id,
+                                              timeout=policy.timeout,
+                                              retry=get_retry(policy),
+                                              meta={'retry_policy': policy_name,
+                                                    'retry_max': policy.max_retries},
+                                              on_success=on_success,
+                                              on_failure=on_failure)
+            if args and isinstance(args[0], dict):
+                progress_utils.publish(args[0], progress_utils.QUEUED, job_id=enqueued_job.id)
+            return enqueued_job
+        job.delay = delay
+        job.policy_name = policy_name
+        job.queue_name = lambda: RetryPolicyRegistry.get(policy_name).queue
+        REGISTERED_JOBS[job_path(job)] = job
+        return job
+    return decorator